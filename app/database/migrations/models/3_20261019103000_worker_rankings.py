@@ -0,0 +1,26 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "workerrankings" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "city" VARCHAR(50) NOT NULL,
+    "state" VARCHAR(50) NOT NULL,
+    "latitude" DOUBLE PRECISION NOT NULL,
+    "longitude" DOUBLE PRECISION NOT NULL,
+    "hourly_rate" DOUBLE PRECISION NOT NULL,
+    "avg_rating" DOUBLE PRECISION NOT NULL  DEFAULT 0,
+    "review_count" INT NOT NULL  DEFAULT 0,
+    "base_score" DOUBLE PRECISION NOT NULL,
+    "modified_at" TIMESTAMPTZ NOT NULL,
+    "profession_id" INT NOT NULL REFERENCES "professions" ("id") ON DELETE CASCADE,
+    "worker_id" INT NOT NULL UNIQUE REFERENCES "users" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_workerranki_profess_0c67ad" ON "workerrankings" ("profession_id", "city");
+CREATE INDEX IF NOT EXISTS "idx_workerranki_profess_2dbae7" ON "workerrankings" ("profession_id", "base_score");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "workerrankings";"""
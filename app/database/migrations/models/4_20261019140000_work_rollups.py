@@ -0,0 +1,24 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "workrollups" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "city" VARCHAR(50) NOT NULL,
+    "day" DATE NOT NULL,
+    "bookings" INT NOT NULL  DEFAULT 0,
+    "cancellations" INT NOT NULL  DEFAULT 0,
+    "revenue" DOUBLE PRECISION NOT NULL  DEFAULT 0,
+    "rating_sum" INT NOT NULL  DEFAULT 0,
+    "rating_count" INT NOT NULL  DEFAULT 0,
+    "modified_at" TIMESTAMPTZ NOT NULL,
+    "profession_id" INT NOT NULL REFERENCES "professions" ("id") ON DELETE CASCADE,
+    CONSTRAINT "uid_workrollups_profess_dbe060" UNIQUE ("profession_id", "city", "day")
+);
+CREATE INDEX IF NOT EXISTS "idx_workrollups_day_820120" ON "workrollups" ("day");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "workrollups";"""
@@ -0,0 +1,31 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "workerslots" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "starts_at" TIMESTAMPTZ NOT NULL,
+    "ends_at" TIMESTAMPTZ NOT NULL,
+    "created_at" TIMESTAMPTZ NOT NULL,
+    "worker_id" INT NOT NULL REFERENCES "users" ("id") ON DELETE CASCADE,
+    "work_id" INT  UNIQUE REFERENCES "works" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_workerslots_worker__4214be" ON "workerslots" ("worker_id", "starts_at");
+CREATE INDEX IF NOT EXISTS "idx_workerslots_starts__99588e" ON "workerslots" ("starts_at", "ends_at");
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+ALTER TABLE "workerslots" ADD CONSTRAINT "excl_workerslots_overlap"
+    EXCLUDE USING gist ("worker_id" WITH =, tstzrange("starts_at", "ends_at") WITH &&);
+INSERT INTO "workerslots" ("worker_id", "work_id", "starts_at", "ends_at", "created_at")
+    SELECT w."assigned_to_id", w."id", w."scheduled_date" + w."scheduled_time",
+        w."scheduled_date" + w."scheduled_time" + make_interval(secs => COALESCE(p."estimated_time_hours", 1) * 3600),
+        now()
+    FROM "works" w JOIN "professions" p ON p."id" = w."profession_id"
+    WHERE w."status" IN ('pending', 'accepted', 'started')
+    ORDER BY w."id"
+    ON CONFLICT DO NOTHING;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "workerslots";"""
@@ -0,0 +1,20 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "outboxevents" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "topic" VARCHAR(50) NOT NULL,
+    "payload" JSONB NOT NULL,
+    "attempts" INT NOT NULL  DEFAULT 0,
+    "last_error" TEXT,
+    "created_at" TIMESTAMPTZ NOT NULL,
+    "processed_at" TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS "idx_outboxevent_process_d6d2a6" ON "outboxevents" ("processed_at", "id");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "outboxevents";"""
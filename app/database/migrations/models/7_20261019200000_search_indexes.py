@@ -0,0 +1,22 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS "idx_professions_search" ON "professions"
+    USING GIN (to_tsvector('english', "name" || ' ' || COALESCE("description", '')));
+CREATE INDEX IF NOT EXISTS "idx_professions_name_trgm" ON "professions" USING GIN ("name" gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS "idx_workerdetails_bio_search" ON "workerdetails"
+    USING GIN (to_tsvector('english', "worker_bio"));
+CREATE INDEX IF NOT EXISTS "idx_workerdetails_bio_trgm" ON "workerdetails" USING GIN ("worker_bio" gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS "idx_works_tags" ON "works" USING GIN ("tags");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_professions_search";
+DROP INDEX IF EXISTS "idx_professions_name_trgm";
+DROP INDEX IF EXISTS "idx_workerdetails_bio_search";
+DROP INDEX IF EXISTS "idx_workerdetails_bio_trgm";
+DROP INDEX IF EXISTS "idx_works_tags";"""
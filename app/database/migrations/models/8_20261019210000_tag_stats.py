@@ -0,0 +1,29 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "tagstats" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "city" VARCHAR(50) NOT NULL,
+    "tag" VARCHAR(50) NOT NULL,
+    "count" INT NOT NULL  DEFAULT 0,
+    "modified_at" TIMESTAMPTZ NOT NULL,
+    "profession_id" INT NOT NULL REFERENCES "professions" ("id") ON DELETE CASCADE,
+    CONSTRAINT "uid_tagstats_profess_d49a81" UNIQUE ("profession_id", "city", "tag")
+);
+CREATE INDEX IF NOT EXISTS "idx_tagstats_profess_f1cc04" ON "tagstats" ("profession_id", "count");
+CREATE TABLE IF NOT EXISTS "workertagstats" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "tag" VARCHAR(50) NOT NULL,
+    "count" INT NOT NULL  DEFAULT 0,
+    "modified_at" TIMESTAMPTZ NOT NULL,
+    "worker_id" INT NOT NULL REFERENCES "users" ("id") ON DELETE CASCADE,
+    CONSTRAINT "uid_workertagst_worker__7ae19a" UNIQUE ("worker_id", "tag")
+);"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "tagstats";
+DROP TABLE IF EXISTS "workertagstats";"""
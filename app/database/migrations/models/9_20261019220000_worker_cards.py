@@ -0,0 +1,21 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "workerrankings" ADD "first_name" VARCHAR(50) NOT NULL DEFAULT '';
+ALTER TABLE "workerrankings" ADD "last_name" VARCHAR(50);
+ALTER TABLE "workerrankings" ADD "profession_name" VARCHAR(20) NOT NULL DEFAULT '';
+UPDATE "workerrankings" r SET "first_name" = u."first_name", "last_name" = u."last_name"
+    FROM "users" u WHERE u."id" = r."worker_id";
+UPDATE "workerrankings" r SET "profession_name" = p."name"
+    FROM "professions" p WHERE p."id" = r."profession_id";
+ALTER TABLE "workerrankings" ALTER COLUMN "first_name" DROP DEFAULT;
+ALTER TABLE "workerrankings" ALTER COLUMN "profession_name" DROP DEFAULT;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "workerrankings" DROP COLUMN "first_name";
+ALTER TABLE "workerrankings" DROP COLUMN "last_name";
+ALTER TABLE "workerrankings" DROP COLUMN "profession_name";"""
@@ -123,3 +123,117 @@ class Reviews(models.Model):
     class PydanticMeta:
         exclude = ["created_at", "modified_at"]
 
+
+
+class WorkerRankings(models.Model):
+    # Precomputed, user independent ranking data of a worker. Rows are refreshed whenever a worker's
+    # rating, review count, rate or address changes so that the filter route only adds the distance factor.
+    # Also the flat worker card of the listing routes, hence the copies of the names.
+    id = fields.IntField(pk=True)
+    worker: fields.OneToOneRelation[Users] = fields.OneToOneField(
+        "models.Users", related_name="ranking", null=False
+    )
+    first_name = fields.CharField(max_length=50, null=False)
+    last_name = fields.CharField(max_length=50, null=True)
+    profession: fields.ForeignKeyRelation[Professions] = fields.ForeignKeyField(
+        "models.Professions", related_name="rankings", null=False
+    )
+    profession_name = fields.CharField(max_length=20, null=False)
+    city = fields.CharField(max_length=50, null=False)
+    state = fields.CharField(max_length=50, null=False)
+    latitude = fields.FloatField(null=False)
+    longitude = fields.FloatField(null=False)
+    hourly_rate = fields.FloatField(null=False)
+    avg_rating = fields.FloatField(default=0)
+    review_count = fields.IntField(default=0)
+    base_score = fields.FloatField(null=False)
+    modified_at = fields.DatetimeField()
+
+    class Meta:
+        indexes = (("profession_id", "city"), ("profession_id", "base_score"))
+
+
+class WorkRollups(models.Model):
+    # Daily aggregates per profession and city (of the client) so that analytics never scan Works.
+    # Maintained incrementally by the work lifecycle routes, see app/utils/rollups.py.
+    id = fields.IntField(pk=True)
+    profession: fields.ForeignKeyRelation[Professions] = fields.ForeignKeyField(
+        "models.Professions", related_name="rollups", null=False
+    )
+    city = fields.CharField(max_length=50, null=False)
+    day = fields.DateField(null=False)
+    bookings = fields.IntField(null=False, default=0)
+    cancellations = fields.IntField(null=False, default=0)
+    revenue = fields.FloatField(null=False, default=0)
+    rating_sum = fields.IntField(null=False, default=0)
+    rating_count = fields.IntField(null=False, default=0)
+    modified_at = fields.DatetimeField()
+
+    class Meta:
+        unique_together = (("profession_id", "city", "day"),)
+        indexes = (("day",),)
+
+
+class WorkerSlots(models.Model):
+    # Time a worker is busy, one row per booked work (or a block set by the worker, without a work).
+    # On Postgres an exclusion constraint (see the worker_slots migration) rejects overlapping slots
+    # of the same worker, so two concurrent bookings can never both succeed.
+    id = fields.IntField(pk=True)
+    worker: fields.ForeignKeyRelation[Users] = fields.ForeignKeyField(
+        "models.Users", related_name="slots", null=False
+    )
+    work: fields.OneToOneNullableRelation[Works] = fields.OneToOneField(
+        "models.Works", related_name="slot", null=True
+    )
+    starts_at = fields.DatetimeField(null=False)
+    ends_at = fields.DatetimeField(null=False)
+    created_at = fields.DatetimeField()
+
+    class Meta:
+        indexes = (("worker_id", "starts_at"), ("starts_at", "ends_at"))
+
+
+class OutboxEvents(models.Model):
+    # Side effects of a write, stored in the same transaction as the write itself and
+    # carried out later, in order, by the dispatcher in app/utils/outbox.py.
+    id = fields.BigIntField(pk=True)
+    topic = fields.CharField(max_length=50, null=False)
+    payload = fields.JSONField(null=False)
+    attempts = fields.IntField(null=False, default=0)
+    last_error = fields.TextField(null=True)
+    created_at = fields.DatetimeField()
+    processed_at = fields.DatetimeField(null=True)
+
+    class Meta:
+        indexes = (("processed_at", "id"),)
+
+
+class TagStats(models.Model):
+    # How often a tag was given to works of a profession booked by clients of a city.
+    # Maintained incrementally from the outbox as works are booked, see app/utils/tags.py.
+    id = fields.IntField(pk=True)
+    profession: fields.ForeignKeyRelation[Professions] = fields.ForeignKeyField(
+        "models.Professions", related_name="tag_stats", null=False
+    )
+    city = fields.CharField(max_length=50, null=False)
+    tag = fields.CharField(max_length=50, null=False)
+    count = fields.IntField(null=False, default=0)
+    modified_at = fields.DatetimeField()
+
+    class Meta:
+        unique_together = (("profession_id", "city", "tag"),)
+        indexes = (("profession_id", "count"),)
+
+
+class WorkerTagStats(models.Model):
+    # How often a tag was given to works assigned to a worker, a ranking feature of the filter route
+    id = fields.IntField(pk=True)
+    worker: fields.ForeignKeyRelation[Users] = fields.ForeignKeyField(
+        "models.Users", related_name="tag_stats", null=False
+    )
+    tag = fields.CharField(max_length=50, null=False)
+    count = fields.IntField(null=False, default=0)
+    modified_at = fields.DatetimeField()
+
+    class Meta:
+        unique_together = (("worker_id", "tag"),)
@@ -0,0 +1,47 @@
+"""
+Title: Wait for database
+File: /database/wait_for_db.py
+Description: Polls the database until it accepts queries, with exponential backoff. Used by startup.sh
+instead of a fixed sleep before running migrations.
+Author: github.com/pzerone
+
+Usage:
+    python -m app.database.wait_for_db [--timeout 60]
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+from tortoise import Tortoise, connections
+from app.database.settings import TORTOISE_ORM
+
+
+async def database_ready() -> bool:
+    try:
+        await connections.get("default").execute_query("SELECT 1")
+        return True
+    except Exception:
+        return False
+
+
+async def wait_for_database(timeout: float, initial_delay: float = 0.1, max_delay: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        while not await database_ready():
+            if time.monotonic() + delay > deadline:
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+        return True
+    finally:
+        await connections.close_all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(wait_for_database(args.timeout)) else 1)
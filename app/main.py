@@ -7,8 +7,9 @@ Author: github.com/pzerone
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from tortoise.contrib.fastapi import register_tortoise
-from tortoise import Tortoise
+from tortoise import Tortoise, connections
 from app.database.settings import TORTOISE_ORM
 
 Tortoise.init_models(
@@ -16,6 +17,21 @@ Tortoise.init_models(
 )  # Initialize models as soon as the app starts so that table relations are properly set up
 
 from app.routers import auth, work, users, admin
+from app.database.models import WorkerDetails, WorkerRankings
+from app.utils.score import refresh_all_rankings
+from app.utils.metrics import render_metrics, instrument_db_clients
+from app.middleware import (
+    AdmissionMiddleware,
+    InstrumentationMiddleware,
+    RequestContextMiddleware,
+)
+from app.utils import warmup, health
+from app.utils.events import broker
+from app.utils.outbox import dispatcher
+from app.utils.admission import admission
+from app.utils.watchdog import watchdog
+from app.utils.pool import compute_pool
+from app.utils.popularity import regional_popularity
 
 app = FastAPI(openapi_url="/apidocs")
 origins = ["*"]
@@ -24,6 +40,8 @@ app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(work.router)
 app.include_router(admin.router)
+# Inside CORS so that shed requests still carry the CORS headers
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -31,6 +49,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(InstrumentationMiddleware)
+app.add_middleware(RequestContextMiddleware)
 
 
 @app.get("/")
@@ -39,8 +59,112 @@ async def root():
     return {"message": "hello world"}
 
 
+@app.get("/healthz", include_in_schema=False)
+async def liveness():
+    """Liveness probe. Only checks that the process is serving requests, never its dependencies"""
+    return {"status": "ok"}
+
+
+@app.get("/readyz", include_in_schema=False)
+async def readiness():
+    """Readiness probe. Ready once the database is reachable and the heavy components and caches are warm"""
+    result = await health.readiness()
+    return JSONResponse(content=result, status_code=200 if result["ready"] else 503)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint. Metrics are per process."""
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.on_event("shutdown")
+async def stop_outbox_dispatcher():
+    """Registered before tortoise so that it runs before the connections are closed"""
+    await dispatcher.stop()
+
+
 register_tortoise(
     app,
     config=TORTOISE_ORM,
     add_exception_handlers=True,
 )
+
+
+@app.on_event("startup")
+async def warm_up_components():
+    """Load the recommendation model and heavy libraries in the background"""
+    warmup.start_warm_up()
+
+
+@app.on_event("startup")
+async def instrument_database():
+    """Count queries per request. Must run after tortoise is initialized"""
+    instrument_db_clients(connections.all())
+
+
+async def backfill_worker_rankings():
+    """Build the ranking rows on the first start after the migration"""
+    if await WorkerRankings.all().count() < await WorkerDetails.all().count():
+        await refresh_all_rankings()
+
+
+@app.on_event("startup")
+async def warm_up_caches():
+    """Must run after tortoise is initialized"""
+    warmup.start_background("worker_rankings", backfill_worker_rankings)
+    warmup.start_background("regional_popularity", regional_popularity.get)
+
+
+@app.on_event("startup")
+async def start_event_broker():
+    """Receive events published by other workers. Must run after tortoise is initialized"""
+    await broker.start()
+
+
+@app.on_event("shutdown")
+async def stop_event_broker():
+    """Close the open event streams and the LISTEN connection"""
+    await broker.stop()
+
+
+@app.on_event("startup")
+async def start_outbox_dispatcher():
+    """Carry out the side effects recorded by the write routes. Must run after tortoise is initialized"""
+    dispatcher.start()
+
+
+@app.on_event("startup")
+async def start_admission_control():
+    """Measure the event loop lag that admission control sheds load on"""
+    admission.start()
+
+
+@app.on_event("shutdown")
+async def stop_admission_control():
+    await admission.stop()
+
+
+@app.on_event("startup")
+async def start_loop_watchdog():
+    """Log the stack and route of callbacks that block the event loop"""
+    watchdog.start()
+
+
+@app.on_event("shutdown")
+async def stop_loop_watchdog():
+    watchdog.stop()
+
+
+@app.on_event("startup")
+async def start_compute_pool():
+    """Start the worker processes, ready once all of them have loaded the model"""
+    compute_pool.start()
+    warmup.start_background("compute_pool", compute_pool.warm_up)
+
+
+@app.on_event("shutdown")
+async def stop_compute_pool():
+    compute_pool.stop()
@@ -0,0 +1,183 @@
+"""
+Title: Middlewares
+File: /middleware.py
+Description: This file contains the ASGI middlewares of the app.
+Author: github.com/pzerone
+"""
+
+import time
+import uuid
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.dependencies import decode_token
+from app.utils.logger import request_id
+from app.utils.metrics import (
+    DBStats,
+    request_db_stats,
+    http_requests_total,
+    http_request_duration_seconds,
+    http_request_db_queries,
+    http_request_db_duration_seconds,
+)
+from app.utils.profiler import SamplingProfiler
+from app.utils.watchdog import watchdog
+from app.utils.admission import (
+    RETRY_AFTER_SECONDS,
+    STREAM,
+    admission,
+    classify,
+    http_requests_shed_total,
+)
+
+PROFILE_HEADER = b"x-profile"
+REQUEST_ID_HEADER = b"x-request-id"
+
+
+def route_name(scope: dict) -> str:
+    """Path template of the matched route, so metrics are not split per path parameter"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def _is_admin(scope: dict) -> bool:
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer":
+                return False
+            claims = decode_token(token)
+            return claims is not None and claims.get("role") == "admin"
+    return False
+
+
+class InstrumentationMiddleware:
+    """
+    Records latency, database query count and database time per route.
+
+    Admins can send an `X-Profile: 1` header to get a sampling profile of the request
+    in place of the normal response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Lets the loop watchdog name the route when this request blocks the loop
+        watchdog.track(scope, request_id.get())
+
+        profiler = None
+        if dict(scope.get("headers", ())).get(PROFILE_HEADER) in (b"1", b"true"):
+            if _is_admin(scope):
+                profiler = SamplingProfiler()
+
+        status_code = 500
+        profiled_status = []
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            if profiler is not None:
+                # Swallow the real response, the profile is sent instead
+                if message["type"] == "http.response.start":
+                    profiled_status.append(message["status"])
+                return
+            await send(message)
+
+        stats = DBStats()
+        token = request_db_stats.set(stats)
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            request_db_stats.reset(token)
+            if profiler is not None:
+                profiler.stop()
+            route = route_name(scope)
+            method = scope["method"]
+            http_requests_total.inc(method, route, str(status_code))
+            http_request_duration_seconds.observe(elapsed, method, route)
+            http_request_db_queries.observe(stats.queries, method, route)
+            http_request_db_duration_seconds.observe(stats.seconds, method, route)
+
+        if profiler is not None:
+            report = (
+                f"{method} {scope['path']} -> {profiled_status[0] if profiled_status else 'no response'}\n"
+                f"db queries: {stats.queries}, db time: {stats.seconds * 1000:.1f} ms\n"
+                + profiler.render()
+            )
+            await PlainTextResponse(report)(scope, receive, send)
+
+
+class RequestContextMiddleware:
+    """
+    Assigns a request id (or reuses the caller's `X-Request-ID`) that is attached to every log record
+    of the request and echoed back in the response headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope.get("headers", ())).get(REQUEST_ID_HEADER)
+        current_id = incoming.decode("latin-1")[:64] if incoming else uuid.uuid4().hex
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", ())) + [
+                    (REQUEST_ID_HEADER, current_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        token = request_id.set(current_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id.reset(token)
+
+
+class AdmissionMiddleware:
+    """
+    Sheds load before it queues up: when too many requests are in flight or the event loop lags,
+    low priority requests (recommendations, listings) and then normal ones get a 503 right away,
+    critical ones (work transitions, payments) are always served. See app/utils/admission.py.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        priority = classify(scope["method"], scope["path"])
+        reason = admission.rejection(priority)
+        if reason is not None:
+            http_requests_shed_total.inc(priority, reason)
+            response = JSONResponse(
+                content={"detail": "Server is overloaded, try again later"},
+                status_code=503,
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
+            await response(scope, receive, send)
+            return
+
+        if priority == STREAM:
+            await self.app(scope, receive, send)
+            return
+        admission.enter(priority)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.leave(priority)
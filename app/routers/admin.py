@@ -5,14 +5,23 @@ Description: This file contains the FastAPI router for admin views.
 Author: github.com/pzerone
 """
 
-from typing import Optional, TypeAlias
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import JSONResponse
-from app.database.models import Professions, Works
+from datetime import date, timedelta
+from typing import Literal, Optional, TypeAlias
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
+from app.database.models import Professions, WorkerRankings, Works, WorkRollups
 from app.dependencies import TokenData
 from tortoise.contrib.pydantic.creator import pydantic_model_creator
 from tortoise import timezone
+from tortoise.functions import Sum
+from tortoise.transactions import in_transaction
 from app.routers.auth import get_current_user
+from app.utils.score import refresh_all_rankings
+from app.utils.cache import response_cache
+from app.utils.streaming import formatters, iter_rows, readers
+from app.utils.rollups import rebuild_rollups
+from app.utils.tags import rebuild_tag_stats
 
 profession_data: TypeAlias = pydantic_model_creator(
     Professions,
@@ -24,6 +33,29 @@ profession_data: TypeAlias = pydantic_model_creator(
     ),
 )  # type: ignore
 
+work_history_fields = [
+    "id",
+    "profession_id",
+    "booked_by_id",
+    "assigned_to_id",
+    "status",
+    "payment_status",
+    "estimated_cost",
+    "final_cost",
+    "scheduled_date",
+    "scheduled_time",
+    "created_at",
+]
+
+# Default and maximum number of days covered by the analytics routes
+ANALYTICS_DEFAULT_DAYS = 30
+ANALYTICS_MAX_DAYS = 366
+
+# Professions written per INSERT ... ON CONFLICT statement during an import
+PROFESSION_IMPORT_BATCH_SIZE = 1000
+# Invalid rows listed in the response of a rejected import, the rest of the body is not read
+MAX_IMPORT_ERRORS = 100
+
 router = APIRouter(
     prefix="/admin",
     tags=["Admin"],
@@ -60,6 +92,7 @@ async def add_profession(
         created_by_id=user.id,
         modified_by_id=user.id,
     )
+    await response_cache.invalidate("professions")
     return JSONResponse(
         content={"detail": "Profession added successfully"}, status_code=201
     )
@@ -93,6 +126,12 @@ async def update_profession(
     await Professions.filter(id=profession_id).update(
         **profession.model_dump(), modified_at=timezone.now(), modified_by_id=user.id
     )
+    # Worker cards carry the profession name
+    await WorkerRankings.filter(profession_id=profession_id).update(
+        profession_name=profession.name
+    )
+    # Estimated time feeds the estimated cost of every worker in the profession
+    await response_cache.invalidate("professions", "professionals", "estimated_cost")
     return JSONResponse(
         content={"detail": "Profession updated successfully"}, status_code=201
     )
@@ -119,14 +158,256 @@ async def delete_profession(
         raise HTTPException(status_code=404, detail="Profession does not exist")
 
     await Professions.filter(id=profession_id).delete()
+    await response_cache.invalidate("professions", "professionals", "estimated_cost")
     return JSONResponse(
         content={"detail": "Profession deleted successfully"}, status_code=200
     )
 
 
+@router.post("/rankings/refresh")
+async def refresh_rankings(user: TokenData = Depends(get_current_user)):
+    """
+    This route is used to rebuild the precomputed worker rankings - only for admin.
+    Rankings are kept up to date by the write routes, this is only needed after a manual change in the database.
+    """
+    if user.role != "admin":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    await refresh_all_rankings()
+    return JSONResponse(
+        content={"detail": "Rankings refreshed successfully"}, status_code=200
+    )
+
+
 @router.get("/work/history")
-async def list_work_history(user: TokenData = Depends(get_current_user)):
+async def list_work_history(
+    user: TokenData = Depends(get_current_user),
+    format: Literal["json", "ndjson", "csv"] = "json",
+):
+    """
+    This route is used to export the work history - only for admin.
+    Rows are streamed in chunks as they are read, so memory use does not grow with the table.
+
+    optional:
+    - format: json (a single array), ndjson (one object per line) or csv
+    """
     if user.role != "admin":
         raise HTTPException(status_code=400, detail="Unauthorized")
 
-    return await works_history.from_queryset(Works.all().only("profession_id", "booked_by_id"))
+    formatter, media_type = formatters[format]
+    return StreamingResponse(
+        formatter(iter_rows(Works.all(), work_history_fields), work_history_fields),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="work_history.{format}"'},
+    )
+
+
+def profession_row_errors(row) -> list[str]:
+    """Why an imported row can't be written, empty if it can"""
+    if not isinstance(row, dict):
+        return ["row must be an object"]
+    try:
+        # Checks the required fields, their types and the name's max_length of the model
+        profession = profession_data.model_validate(row)
+    except ValidationError as e:
+        return [
+            f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}"
+            for error in e.errors()
+        ]
+    if not profession.name.strip():
+        return ["name: Field required"]
+    return []
+
+
+@router.post("/professions/import")
+async def import_professions(
+    request: Request,
+    user: TokenData = Depends(get_current_user),
+    format: Literal["ndjson", "csv"] = "ndjson",
+):
+    """
+    This route is used to add or update professions in bulk - only for admin.
+    The request body is read as a stream and written in batches inside one transaction,
+    so either every row is imported or none is. If any row is invalid nothing is imported,
+    the 422 response lists the line and errors of every invalid row (up to MAX_IMPORT_ERRORS).
+
+    requires (body, one profession per line or csv row with a header):
+    - name: existing professions with this name are updated
+    - description
+    - estimated_time_hours
+
+    optional:
+    - format: ndjson or csv
+    """
+    if user.role != "admin":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    batch: dict[str, Professions] = {}
+    imported = 0
+
+    async def flush(conn):
+        await Professions.bulk_create(
+            batch.values(),
+            on_conflict=["name"],
+            update_fields=["description", "estimated_time_hours", "modified_at", "modified_by_id"],
+            using_db=conn,
+        )
+        batch.clear()
+
+    invalid_rows = []
+    try:
+        async with in_transaction() as conn:
+            async for line_number, row in readers[format](request.stream()):
+                errors = profession_row_errors(row)
+                if errors:
+                    invalid_rows.append({"line": line_number, "errors": errors})
+                    if len(invalid_rows) >= MAX_IMPORT_ERRORS:
+                        break
+                    continue
+                if invalid_rows:
+                    continue  # Nothing is written anymore, the import is rolled back
+                profession = profession_data.model_validate(row)
+                now = timezone.now()
+                # A name repeated within a batch keeps its last row, ON CONFLICT can't touch a row twice
+                batch[profession.name] = Professions(
+                    **profession.model_dump(),
+                    created_at=now,
+                    modified_at=now,
+                    created_by_id=user.id,
+                    modified_by_id=user.id,
+                )
+                imported += 1
+                if len(batch) >= PROFESSION_IMPORT_BATCH_SIZE:
+                    await flush(conn)
+            if invalid_rows:
+                # Raised inside the transaction, so the batches already written are rolled back
+                raise HTTPException(status_code=422, detail=invalid_rows)
+            if batch:
+                await flush(conn)
+    except ValueError as e:
+        # Malformed body, the readers report the line themselves
+        raise HTTPException(status_code=400, detail=f"Import failed: {e}")
+
+    await response_cache.invalidate("professions", "estimated_cost")
+    return JSONResponse(
+        content={"detail": "Professions imported successfully", "rows": imported},
+        status_code=200,
+    )
+
+
+def _analytics_range(start: date | None, end: date | None) -> tuple[date, date]:
+    end = end or timezone.now().date()
+    start = start or end - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if (end - start).days >= ANALYTICS_MAX_DAYS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {ANALYTICS_MAX_DAYS} days can be requested"
+        )
+    return start, end
+
+
+def _with_avg_rating(row: dict) -> dict:
+    row["avg_rating"] = row["rating_sum"] / row["rating_count"] if row["rating_count"] else None
+    return row
+
+
+@router.get("/analytics/daily")
+async def daily_analytics(
+    user: TokenData = Depends(get_current_user),
+    start: date | None = None,
+    end: date | None = None,
+    profession_id: int | None = None,
+    city: str | None = None,
+):
+    """
+    This route is used to get bookings, cancellations, revenue and average rating per profession,
+    city and day - only for admin. Reads the precomputed rollups, never the works table.
+
+    optional:
+    - start, end: inclusive date range, defaults to the last 30 days
+    - profession_id
+    - city
+    """
+    if user.role != "admin":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    start, end = _analytics_range(start, end)
+    rows = WorkRollups.filter(day__gte=start, day__lte=end)
+    if profession_id is not None:
+        rows = rows.filter(profession_id=profession_id)
+    if city is not None:
+        rows = rows.filter(city=city)
+    rows = await rows.order_by("day", "profession_id", "city").values(
+        "day", "profession_id", "city", "bookings", "cancellations", "revenue", "rating_sum", "rating_count"
+    )
+    return [_with_avg_rating(row) for row in rows]
+
+
+@router.get("/analytics/professions")
+async def profession_analytics(
+    user: TokenData = Depends(get_current_user),
+    start: date | None = None,
+    end: date | None = None,
+):
+    """
+    This route is used to get bookings, cancellations, revenue and average rating per profession
+    over a date range - only for admin. Reads the precomputed rollups, never the works table.
+
+    optional:
+    - start, end: inclusive date range, defaults to the last 30 days
+    """
+    if user.role != "admin":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    start, end = _analytics_range(start, end)
+    rows = (
+        await WorkRollups.filter(day__gte=start, day__lte=end)
+        .annotate(
+            total_bookings=Sum("bookings"),
+            total_cancellations=Sum("cancellations"),
+            total_revenue=Sum("revenue"),
+            total_rating_sum=Sum("rating_sum"),
+            total_rating_count=Sum("rating_count"),
+        )
+        .group_by("profession_id")
+        .order_by("profession_id")
+        .values(
+            "profession_id",
+            "total_bookings",
+            "total_cancellations",
+            "total_revenue",
+            "total_rating_sum",
+            "total_rating_count",
+        )
+    )
+    return [
+        _with_avg_rating(
+            {
+                "profession_id": row["profession_id"],
+                "bookings": row["total_bookings"],
+                "cancellations": row["total_cancellations"],
+                "revenue": row["total_revenue"],
+                "rating_sum": row["total_rating_sum"],
+                "rating_count": row["total_rating_count"],
+            }
+        )
+        for row in rows
+    ]
+
+
+@router.post("/analytics/rebuild")
+async def rebuild_analytics(user: TokenData = Depends(get_current_user)):
+    """
+    This route is used to recompute the analytics rollups and tag counts from the works and reviews tables - only for admin.
+    Both are kept up to date as works are booked and reviewed, this is only needed after a manual change in the database.
+    """
+    if user.role != "admin":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    rows = await rebuild_rollups()
+    tag_rows = await rebuild_tag_stats()
+    return JSONResponse(
+        content={"detail": "Analytics rebuilt successfully", "rows": rows, "tag_rows": tag_rows},
+        status_code=200,
+    )
@@ -11,6 +11,7 @@ from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from app.database.models import Users
 from app.utils.logger import msg_logger
+from app.utils.ratelimit import rate_limit
 from tortoise.expressions import Q
 from tortoise import timezone
 from tortoise.exceptions import DoesNotExist
@@ -57,18 +58,20 @@ async def create_user(user: signup_data):
     user_exists = await Users.filter(Q(username=user.username) | Q(email=user.email))
     if user_exists:
         msg_logger(
-            f"Registration Failed: {user.username} or {user.email} already exists. Registration failed.",
+            "Registration Failed: %s or %s already exists. Registration failed.",
             20,
+            user.username,
+            user.email,
         )
         raise HTTPException(status_code=400, detail="User already exists")
 
     if re.match(r"^[^@]+@[^@]+\.[^@]+$", user.email) is None:
-        msg_logger(f"Registration Failed: {user.email} is not a valid email.", 20)
+        msg_logger("Registration Failed: %s is not a valid email.", 20, user.email)
         raise HTTPException(status_code=400, detail="Invalid email")
 
     if re.match(r"^(?=.*[a-zA-Z])(?=.*\d).{8,}$", user.password) is None:
         msg_logger(
-            f"Registration Failed: {user.username} provided an invalid password.", 20
+            "Registration Failed: %s provided an invalid password.", 20, user.username
         )
         raise HTTPException(
             status_code=400,
@@ -80,7 +83,7 @@ async def create_user(user: signup_data):
         created_at=timezone.now(),
         modified_at=timezone.now(),
     )
-    msg_logger(f"Registrtion Successful: {user.username} created successfully.", 20)
+    msg_logger("Registrtion Successful: %s created successfully.", 20, user.username)
     return JSONResponse(content={"detail": "User creation sucessful"}, status_code=201)
 
 
@@ -91,7 +94,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     return TokenData(**create_user)
 
 
-@router.post("/login", response_model=Token)
+@router.post(
+    "/login", response_model=Token, dependencies=[Depends(rate_limit("login"))]
+)
 async def login_user(form_data: OAuth2PasswordRequestForm = Depends()):
     """
     This route is used to login a user.
@@ -108,14 +113,14 @@ async def login_user(form_data: OAuth2PasswordRequestForm = Depends()):
     try:
         user = await Users.get(username=form_data.username)
     except DoesNotExist:
-        msg_logger(f"Login Failed: {form_data.username} does not exist.", 20)
+        msg_logger("Login Failed: %s does not exist.", 20, form_data.username)
         return JSONResponse(
             content={"detail": "Invalid username of password"}, status_code=401
         )
 
     if not verify_password(form_data.password, user.password):
         msg_logger(
-            f"Login Failed: {form_data.username} provided an invalid password.", 20
+            "Login Failed: %s provided an invalid password.", 20, form_data.username
         )
         return JSONResponse(
             content={"detail": "Invalid username of password"}, status_code=401
@@ -124,7 +129,12 @@ async def login_user(form_data: OAuth2PasswordRequestForm = Depends()):
     token_data = TokenData(
         id=user.id, username=user.username, email=user.email, role=user.role
     )
-    msg_logger(f"Login Successful: {form_data.username} logged in successfully.", 20)
+    msg_logger(
+        "Login Successful: %s logged in successfully.",
+        20,
+        form_data.username,
+        user_id=user.id,
+    )
     return Token(
         access_token=create_access_token(token_data),
         refresh_token=create_refresh_token(token_data),
@@ -163,7 +173,7 @@ async def change_password(
     """
     if old_password is None:
         msg_logger(
-            f"Password Change Failed: {user.username} did not provide old password.", 20
+            "Password Change Failed: %s did not provide old password.", 20, user.username
         )
         raise HTTPException(status_code=400, detail="Old password not provided")
 
@@ -171,21 +181,23 @@ async def change_password(
     old_hash = curr_user.password
     if not verify_password(old_password, old_hash):
         msg_logger(
-            f"Password Change Failed: {user.username} provided an incorrect old password.",
+            "Password Change Failed: %s provided an incorrect old password.",
             20,
+            user.username,
         )
         raise HTTPException(status_code=401, detail="Incorrect old password")
 
     if new_password is None:
         msg_logger(
-            f"Password Change Failed: {user.username} did not provide new password.", 20
+            "Password Change Failed: %s did not provide new password.", 20, user.username
         )
         raise HTTPException(status_code=400, detail="New password not provided")
 
     if re.match(r"^(?=.*[a-zA-Z])(?=.*\d).{8,}$", new_password) is None:
         msg_logger(
-            f"Password Change Failed: {user.username} provided an password that did not meet required criteria.",
+            "Password Change Failed: %s provided an password that did not meet required criteria.",
             20,
+            user.username,
         )
         raise HTTPException(
             status_code=400,
@@ -196,8 +208,9 @@ async def change_password(
         password=new_password, modified_at=timezone.now()
     )
     msg_logger(
-        f"Password Change Successful: {user.username} changed password successfully.",
+        "Password Change Successful: %s changed password successfully.",
         20,
+        user.username,
     )
     return JSONResponse(
         content={"detail": "Password changed successfully"}, status_code=200
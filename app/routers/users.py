@@ -5,9 +5,11 @@ Description: This file contains the FastAPI router for user views.
 Author: github.com/pzerone
 """
 
+import heapq
 from typing import TypeAlias
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from tortoise import timezone
 from tortoise.transactions import in_transaction
@@ -17,7 +19,18 @@ from app.dependencies import TokenData
 from app.database.models import Users, UserDetails, WorkerDetails, Professions, Works
 from app.routers.auth import get_current_user
 from app.utils.logger import msg_logger
-from app.utils.recommend import dict_to_pd_df, get_top_n_recommendations
+from app.utils.recommend import predict_professions
+from app.utils.score import refresh_worker_ranking, refresh_worker_rankings
+from app.utils.cache import response_cache
+from app.utils import search
+from app.utils.ratelimit import rate_limit
+from app.utils.pool import compute_pool
+from app.utils.popularity import blend, regional_popularity
+
+# Seconds the profession catalogue is served from the cache, admin writes invalidate earlier
+PROFESSIONS_CACHE_TTL = 600
+# Professions returned by /recommend/v2
+RECOMMENDATION_COUNT = 5
 
 
 class Address(BaseModel):
@@ -50,12 +63,6 @@ professions_data: TypeAlias = pydantic_model_creator(
     # exclude_readonly=True,
 )  # type: ignore
 
-works_history: TypeAlias = pydantic_model_creator(
-    Works,
-    name="work_history_output",
-    include=("profession_id", "booked_by_id"),
-)  # type ignore
-
 
 router = APIRouter(
     prefix="/users",
@@ -124,6 +131,9 @@ async def update_address(address: Address, user: TokenData = Depends(get_current
     await UserDetails.filter(user_id=user.id).update(
         **address.model_dump(exclude_unset=True), modified_at=timezone.now()
     )
+    await refresh_worker_ranking(user.id)
+    # Workers are listed with their address
+    await response_cache.invalidate("professionals")
 
     return JSONResponse(
         content={"detail": "Address updated successfully"}, status_code=200
@@ -135,7 +145,30 @@ async def get_professions():
     """
     This route is used to get all the professions available in the database.
     """
-    return await professions_data.from_queryset(Professions.all())
+
+    async def load():
+        return jsonable_encoder(await professions_data.from_queryset(Professions.all()))
+
+    return await response_cache.get_or_set("professions", "all", PROFESSIONS_CACHE_TTL, load)
+
+
+@router.get("/professions/search")
+async def search_professions(
+    q: str = Query(min_length=2, max_length=100),
+    limit: int = Query(search.DEFAULT_SEARCH_LIMIT, ge=1, le=search.MAX_SEARCH_LIMIT),
+    offset: int = Query(0, ge=0),
+):
+    """
+    This route is used to search the professions by their name and description.
+    Results are ranked by relevance, the best match first, and include their `rank`.
+
+    requires:
+    - q: the search text
+
+    optional:
+    - limit and offset: the page of results to return
+    """
+    return await search.search_professions(q, limit, offset)
 
 
 @router.get("/professions/{profession_id}", response_model=professions_data)
@@ -148,13 +181,19 @@ async def get_profession(profession_id: int):
 
     Note: This route does not return any extra data than the /professions route, keeping this since we might have more data about a profession to be send to user in future
     """
-    try:
-        profession = await professions_data.from_queryset_single(
-            Professions.get(id=profession_id)
-        )
-    except DoesNotExist:
-        raise HTTPException(status_code=400, detail="Profession does not exist")
-    return profession
+
+    async def load():
+        try:
+            profession = await professions_data.from_queryset_single(
+                Professions.get(id=profession_id)
+            )
+        except DoesNotExist:
+            raise HTTPException(status_code=400, detail="Profession does not exist")
+        return jsonable_encoder(profession)
+
+    return await response_cache.get_or_set(
+        "professions", str(profession_id), PROFESSIONS_CACHE_TTL, load
+    )
 
 
 @router.put("/switch-to-professional")
@@ -207,13 +246,19 @@ async def switch_to_professional(
             )
     except OperationalError as e:
         msg_logger(
-            f"Switch to professional failed: {user.username} failed to switch to professional due to database error.\n{e}",
+            "Switch to professional failed: %s failed to switch to professional due to database error.\n%s",
             40,
+            user.username,
+            e,
         )
         raise HTTPException(
             status_code=500,
             detail="Failed to switch to professional. Please try again later.",
         )
+    # A new worker moves the mean hourly rate of the profession, so refresh all of its workers
+    await refresh_worker_rankings(details.profession_id)
+    # The new worker is listed, and has an estimated cost
+    await response_cache.invalidate("professionals", "estimated_cost")
     return JSONResponse(
         content={"detail": "switched to professional succesfully"}, status_code=200
     )
@@ -235,41 +280,60 @@ async def get_recommendations():
     }
 
 
-@router.get("/recommend/v2")
+@router.get("/recommend/v2", dependencies=[Depends(rate_limit("recommend"))])
 async def get_real_recommendations(user: TokenData = Depends(get_current_user)):
-
-    booked_works = await Works.filter(booked_by_id=user.id, status="closed")
-    if len(booked_works) < 1:
-        msg_logger(f"Recommend: user{user.id} does not have any booking history. count: {len(booked_works)}. skipping prediction", 20)
-        # If the user does not have any past booking history, model will not generate recommendations
-        # hence send all professions and let frontend show random professions
-        professions = await professions_data.from_queryset(Professions.all())
-        return {
-            "real": False,
-            "recomendations": professions,
-        }
-    past_works_pydantic = await works_history.from_queryset(Works.all())
-    work_history_list_of_dict = [item.dict() for item in past_works_pydantic]
-
-    user_id_list = await Users.all().values_list("id", flat=True)
-    profession_id_list = await Professions.all().values_list("id", flat=True)
-    history_df = dict_to_pd_df(
-        work_history_list_of_dict, profession_id_list, user_id_list
-    )
-
-    top_n_recommendations = get_top_n_recommendations(history_df, user.id, 5)
-    if (
-        len(top_n_recommendations) > 0
-    ):  # Only if recommendations are generated by the model
-        professions = await professions_data.from_queryset(
-            Professions.filter(id__in=top_n_recommendations)
+    """
+    This route is used to get recommended professions for a user.
+    Users without closed works get the professions popular in their city (or state),
+    as their history grows the model's predictions weigh more than the popularity.
+    """
+    closed_works = await Works.filter(booked_by_id=user.id, status="closed").count()
+    address = await UserDetails.filter(user_id=user.id).first().values("city", "state")
+    city, state = (address["city"], address["state"]) if address else (None, None)
+    popularity = await regional_popularity.get()
+
+    if closed_works < 1:
+        msg_logger("Recommend: user%s does not have any booking history. sending popular", 20, user.id)
+        # The model cannot predict for users without history, serve what is popular in their region
+        recommended = popularity.top(city, state, RECOMMENDATION_COUNT)
+        real = False
+    else:
+        booked = set(
+            await Works.filter(booked_by_id=user.id)
+            .distinct()
+            .values_list("profession_id", flat=True)
         )
+        candidates = [
+            profession_id
+            for profession_id in popularity.profession_ids
+            if profession_id not in booked
+        ]
+        # Running the model is CPU bound, keep it off the event loop
+        estimates = await compute_pool.run(predict_professions, user.id, candidates)
+        scores = blend(estimates, popularity.scores(city, state), closed_works)
+        recommended = heapq.nlargest(RECOMMENDATION_COUNT, scores, key=scores.get)
+        real = True
+
+    if len(recommended) > 0:
+        professions = {
+            profession.id: profession
+            for profession in await professions_data.from_queryset(
+                Professions.filter(id__in=recommended)
+            )
+        }
+        professions = [
+            professions[profession_id]
+            for profession_id in recommended
+            if profession_id in professions
+        ]
+        # Clients read the fallback lists from the misspelt key
         return {
-            "real": True,
-            "recommendations": professions,
+            "real": real,
+            "recommendations" if real else "recomendations": professions,
         }
+    # Nothing was booked anywhere yet, let frontend show random professions
     professions = await professions_data.from_queryset(Professions.all())
-    msg_logger(f"Recommend: Algo prediction returned empty list. count: {len(top_n_recommendations)}. sending all", 20)
+    msg_logger("Recommend: no popular or unbooked professions. sending all", 20)
     return {
         "real": False,
         "recomendations": professions,
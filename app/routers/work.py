@@ -5,14 +5,20 @@ Description: This file contains the FastAPI router for work views.
 Author: github.com/pzerone
 """
 
+import json
+import math
+import asyncio
+from datetime import date, datetime, time, timedelta
 from typing import TypeAlias
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
 from tortoise.contrib.pydantic.creator import pydantic_model_creator
-from tortoise.exceptions import DoesNotExist, OperationalError
+from tortoise.exceptions import DoesNotExist, IntegrityError, OperationalError
 from tortoise.functions import Avg
+from tortoise.expressions import Subquery
 from tortoise import timezone
-from tortoise.transactions import in_transaction
 from app.database.models import (
     UserDetails,
     Users,
@@ -20,23 +26,72 @@ from app.database.models import (
     WorkerDetails,
     Works,
     Reviews,
+    WorkerRankings,
+    WorkerSlots,
 )
 from app.dependencies import TokenData
 from app.routers.auth import get_current_user
-from app.utils.score import sort_workers_by_score
+from app.utils.score import calculate_tag_factor, rank_workers, weights
+from app.utils.tags import (
+    DEFAULT_POPULAR_TAGS,
+    MAX_POPULAR_TAGS,
+    normalize_tags,
+    popular_tags,
+    worker_tag_counts,
+)
 from app.utils.logger import msg_logger
+from app.utils.cache import response_cache
+from app.utils import outbox, search, slots
+from app.utils.events import broker
+from app.utils.work_events import emit_work
+from app.utils.ratelimit import rate_limit
+
+# Seconds an anonymous read response is served from the cache, writes invalidate earlier
+PROFESSIONALS_CACHE_TTL = 60
+ESTIMATED_COST_CACHE_TTL = 300
+# Tag counts change with every booking and are only ever invalidated by the TTL
+POPULAR_TAGS_CACHE_TTL = 60
+# Upper bound on worker ids accepted by the batch estimated cost route
+MAX_ESTIMATED_COST_BATCH = 200
+# Upper bound on works booked in one batch booking request
+MAX_BOOKING_BATCH = 20
+# Upper bound on the days covered by one availability request
+MAX_AVAILABILITY_DAYS = 14
+# Seconds between keepalive comments on an idle event stream
+EVENT_KEEPALIVE_SECONDS = 15
+# Upper bound on the tags of one work search
+MAX_SEARCH_TAGS = 20
+
+
+class TimeBlock(BaseModel):
+    starts_at: datetime
+    ends_at: datetime
+
+
+class WorkerCard(BaseModel):
+    # One flat row of WorkerRankings per worker, `id` is the worker's user id
+    id: int
+    first_name: str
+    last_name: str | None
+    profession_id: int
+    profession_name: str
+    hourly_rate: float
+    avg_rating: float
+    review_count: int
+    city: str
+    latitude: float
+    longitude: float
+
+
+worker_card_fields = tuple(field for field in WorkerCard.model_fields if field != "id")
+
+
+def worker_card(ranking: WorkerRankings) -> dict:
+    return {
+        "id": ranking.worker_id,
+        **{field: getattr(ranking, field) for field in worker_card_fields},
+    }
 
-professionals_data: TypeAlias = pydantic_model_creator(
-    Users,
-    name="Professionals Data Output",
-    include=(
-        "id",
-        "first_name",
-        "last_name",
-        "worker",
-        "user",
-    ),
-)  # type: ignore
 
 work_create_in: TypeAlias = pydantic_model_creator(
     Works,
@@ -93,25 +148,44 @@ router = APIRouter(
 )
 
 
-@router.get("/professionals/{profession_id}/filter")
+@router.get(
+    "/professionals/{profession_id}/filter", dependencies=[Depends(rate_limit("filter"))]
+)
 async def filter_professionals(
-    profession_id: int, user: TokenData = Depends(get_current_user)
+    profession_id: int,
+    user: TokenData = Depends(get_current_user),
+    city: str | None = None,
+    radius_km: float | None = None,
+    limit: int | None = None,
+    scheduled_date: date | None = None,
+    scheduled_time: time | None = None,
+    tags: list[str] | None = Query(None),
 ):
+    """
+    This route is used to get the professionals of a profession sorted by their score for the user.
+
+    requires:
+    - profession_id
+
+    optional:
+    - city: only consider professionals from this city
+    - radius_km: only consider professionals within this distance from the user
+    - limit: only return the top `limit` professionals
+    - scheduled_date and scheduled_time (UTC): only consider professionals that are free for the
+      profession's estimated time from then on
+    - tags: rank professionals whose past works carried these tags higher, e.g. ?tags=leak
+    """
+    if (scheduled_date is None) != (scheduled_time is None):
+        raise HTTPException(
+            status_code=400,
+            detail="scheduled_date and scheduled_time must be given together",
+        )
+
     try:
-        await Professions.get(id=profession_id)
+        profession = await Professions.get(id=profession_id)
     except DoesNotExist:
         raise HTTPException(status_code=404, detail="Profession does not exist")
 
-    professionals = await professionals_data.from_queryset(
-        Users.filter(worker__profession__id=profession_id)
-    )
-
-    mean_hourly_rate = (
-        await WorkerDetails.filter(profession_id=profession_id)
-        .annotate(avg_hourly_rate=Avg("hourly_rate"))
-        .values_list("avg_hourly_rate", flat=True)
-    )[0]
-
     try:
         curr_user = await UserDetails.get(user_id=user.id)
     except DoesNotExist:
@@ -119,31 +193,179 @@ async def filter_professionals(
             status_code=500,
             detail="User not in database. You should't have hit this, yet here you are.",
         )
-    user_cords = (curr_user.latitude, curr_user.longitude)
-    return await sort_workers_by_score(
-        workers=professionals,
-        user_cords=user_cords,
-        mean_hourly_rate=mean_hourly_rate,
+    user_cords = (float(curr_user.latitude), float(curr_user.longitude))
+
+    candidates = WorkerRankings.filter(profession_id=profession_id)
+    if city is not None:
+        candidates = candidates.filter(city=city)
+    if radius_km is not None:
+        # Cheap bounding box on the stored coordinates, exact distance is checked after scoring
+        lat_delta = radius_km / 111.0
+        lon_delta = radius_km / (111.0 * max(math.cos(math.radians(user_cords[0])), 0.01))
+        candidates = candidates.filter(
+            latitude__gte=user_cords[0] - lat_delta,
+            latitude__lte=user_cords[0] + lat_delta,
+            longitude__gte=user_cords[1] - lon_delta,
+            longitude__lte=user_cords[1] + lon_delta,
+        )
+    if scheduled_date is not None:
+        starts_at, ends_at = slots.slot_bounds(
+            scheduled_date, scheduled_time, profession.estimated_time_hours
+        )
+        # Anti-join against the busy slots (pending, accepted and started works and blocks), one query
+        candidates = candidates.exclude(
+            worker_id__in=Subquery(slots.overlapping(starts_at, ends_at).values("worker_id"))
+        )
+    candidates = await candidates
+    tag_factors = None
+    requested_tags = normalize_tags(tags)[:MAX_SEARCH_TAGS]
+    if requested_tags:
+        # Counted as works are booked, never read from the works table here
+        tag_counts = await worker_tag_counts(
+            [candidate.worker_id for candidate in candidates], requested_tags
+        )
+        tag_factors = {
+            worker_id: calculate_tag_factor(counts, len(requested_tags), weights)
+            for worker_id, counts in tag_counts.items()
+        }
+    ranked = await rank_workers(
+        candidates,
+        user_cords,
+        limit=limit,
+        max_distance_km=radius_km,
+        tag_factors=tag_factors,
     )
 
+    # The ranking rows are the worker cards, no other table is read
+    return [
+        {**worker_card(candidate), "score": score, "distance_to_user_in_km": distance_to_user}
+        for score, distance_to_user, candidate in ranked
+    ]
+
+
+@router.get("/professionals/search")
+async def search_professionals(
+    q: str = Query(min_length=2, max_length=100),
+    profession_id: int | None = None,
+    limit: int = Query(search.DEFAULT_SEARCH_LIMIT, ge=1, le=search.MAX_SEARCH_LIMIT),
+    offset: int = Query(0, ge=0),
+):
+    """
+    This route is used to search the professionals by their bio.
+    Results are ranked by relevance, the best match first, and include their `rank`.
+
+    requires:
+    - q: the search text
+
+    optional:
+    - profession_id: only search the professionals of this profession
+    - limit and offset: the page of results to return
+    """
+    return await search.search_workers(q, limit, offset, profession_id=profession_id)
+
 
-@router.get("/professionals/{profession_id}", response_model=list[professionals_data])
+@router.get("/professionals/{profession_id}", response_model=list[WorkerCard])
 async def get_professionals(profession_id: int):
     """
-    This route is used to get a list of professionals for a given profession id.
-    This route contains the filtering algorithm for sorting workers (Yet to be implemented)
+    This route is used to get a list of professionals for a given profession id,
+    best user independent score first. The filter route adds the distance to the user.
 
     requires:
     - profession_id
     """
-    profession_exists = await Professions.filter(id=profession_id)
-    if not profession_exists:
-        raise HTTPException(status_code=404, detail="Profession does not exist")
 
-    # TODO: Use filtering algorithm for finding professionals.
-    # TODO: Add pagination.
-    return await professionals_data.from_queryset(
-        Users.filter(worker__profession__id=profession_id)
+    async def load():
+        profession_exists = await Professions.filter(id=profession_id)
+        if not profession_exists:
+            raise HTTPException(status_code=404, detail="Profession does not exist")
+
+        # TODO: Add pagination.
+        return jsonable_encoder(
+            await WorkerRankings.filter(profession_id=profession_id)
+            .order_by("-base_score", "worker_id")
+            .values(*worker_card_fields, id="worker_id")
+        )
+
+    return await response_cache.get_or_set(
+        "professionals", str(profession_id), PROFESSIONALS_CACHE_TTL, load
+    )
+
+
+@router.get("/tags/popular")
+async def get_popular_tags(
+    profession_id: int | None = None,
+    city: str | None = None,
+    prefix: str | None = Query(None, max_length=50),
+    limit: int = Query(DEFAULT_POPULAR_TAGS, ge=1, le=MAX_POPULAR_TAGS),
+):
+    """
+    This route is used to get the most used work tags, e.g. to autocomplete the tags of a booking.
+    Reads the precomputed tag counts, never the works table.
+
+    optional:
+    - profession_id: only tags of works of this profession
+    - city: only tags of works booked from this city
+    - prefix: only tags starting with it
+    - limit: number of tags to return
+    """
+
+    async def load():
+        return await popular_tags(profession_id, city, prefix, limit)
+
+    key = f"{profession_id}:{city}:{(prefix or '').strip().lower()}:{limit}"
+    return await response_cache.get_or_set("tags", key, POPULAR_TAGS_CACHE_TTL, load)
+
+
+@router.get("/estimated-cost")
+async def get_estimated_costs(
+    worker_ids: list[int] | None = Query(None),
+    profession_id: int | None = None,
+):
+    """
+    This route is used to get the estimated cost for many workers in one call.
+
+    requires one of:
+    - worker_ids: repeated query parameter, e.g. ?worker_ids=1&worker_ids=2
+    - profession_id: every worker of the profession
+
+    returns:
+    - list of worker_id and estimated_cost. Unknown worker ids are left out.
+    """
+    if (worker_ids is None) == (profession_id is None):
+        raise HTTPException(
+            status_code=400, detail="Provide either worker_ids or profession_id"
+        )
+    if worker_ids is not None:
+        if len(worker_ids) > MAX_ESTIMATED_COST_BATCH:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {MAX_ESTIMATED_COST_BATCH} worker_ids are allowed",
+            )
+        worker_ids = sorted(set(worker_ids))
+        workers = WorkerDetails.filter(user_id__in=worker_ids)
+        key = "workers:" + ",".join(map(str, worker_ids))
+    else:
+        workers = WorkerDetails.filter(profession_id=profession_id)
+        key = f"profession:{profession_id}"
+
+    async def load():
+        rows = await workers.order_by("user_id").values(
+            "user_id", "hourly_rate", "profession__estimated_time_hours"
+        )
+        return [
+            {
+                "worker_id": row["user_id"],
+                "estimated_cost": (
+                    None
+                    if row["profession__estimated_time_hours"] is None
+                    else row["hourly_rate"] * row["profession__estimated_time_hours"]
+                ),
+            }
+            for row in rows
+        ]
+
+    return await response_cache.get_or_set(
+        "estimated_cost", key, ESTIMATED_COST_CACHE_TTL, load
     )
 
 
@@ -156,20 +378,26 @@ async def get_estimated_cost(worker_id: int):
     - Worker's user_id
 
     returns:
-    - estimated_cost
+    - estimated_cost, null if the profession has no estimated time
     """
-    try:
-        worker = await WorkerDetails.get(user__id=worker_id)
-    except:
-        raise HTTPException(status_code=404, detail="Professional does not exist")
 
-    # fetch_related() is used to fetch the profession of the worker as it is a foreign key
-    # and then we can use the profession to get the estimated time for the profession from db
-    await worker.fetch_related("profession")
+    async def load():
+        # The profession is joined in, hourly rate and estimated time come back in one query
+        worker = await WorkerDetails.filter(user_id=worker_id).first().values(
+            "hourly_rate", "profession__estimated_time_hours"
+        )
+        if worker is None:
+            raise HTTPException(status_code=404, detail="Professional does not exist")
 
-    # Estimated cost = hourly rate * estimated time
-    estimated_cost = worker.hourly_rate * worker.profession.estimated_time_hours
-    return estimated_cost
+        # Estimated cost = hourly rate * estimated time, unknown without an estimated time
+        if worker["profession__estimated_time_hours"] is None:
+            return None
+        estimated_cost = worker["hourly_rate"] * worker["profession__estimated_time_hours"]
+        return jsonable_encoder(estimated_cost)
+
+    return await response_cache.get_or_set(
+        "estimated_cost", str(worker_id), ESTIMATED_COST_CACHE_TTL, load
+    )
 
 
 @router.post("/book-a-work")
@@ -234,21 +462,356 @@ async def create_work(
             detail="Scheduled time is in the past. Only future works can be booked",
         )
 
+    starts_at, ends_at = slots.slot_bounds(
+        work.scheduled_date,
+        work.scheduled_time,
+        booked_worker.profession.estimated_time_hours,
+    )
+    if await slots.is_busy(work.assigned_to_id, starts_at, ends_at):
+        raise HTTPException(
+            status_code=409, detail="Professional is not available at the scheduled time"
+        )
+
     estimated_cost = (
         booked_worker.hourly_rate * booked_worker.profession.estimated_time_hours
     )
-    await Works.create(
-        **work.dict(exclude_unset=True),
-        booked_by_id=user.id,
-        status="pending",
-        payment_status="pending",
-        estimated_cost=estimated_cost,
-        created_at=timezone.now(),
-        modified_at=timezone.now(),
-    )
+    try:
+        async with outbox.transaction() as conn:
+            new_work = await Works.create(
+                using_db=conn,
+                **work.dict(exclude_unset=True),
+                booked_by_id=user.id,
+                status="pending",
+                payment_status="pending",
+                estimated_cost=estimated_cost,
+                created_at=timezone.now(),
+                modified_at=timezone.now(),
+            )
+            # On Postgres the exclusion constraint rejects a slot booked concurrently since the check above
+            await WorkerSlots.create(
+                using_db=conn,
+                worker_id=work.assigned_to_id,
+                work_id=new_work.id,
+                starts_at=starts_at,
+                ends_at=ends_at,
+                created_at=timezone.now(),
+            )
+            await emit_work(new_work, "work.booked", conn, status="pending")
+    except IntegrityError:
+        raise HTTPException(
+            status_code=409, detail="Professional is not available at the scheduled time"
+        )
     return JSONResponse(content={"detail": "Work creation sucessful"}, status_code=201)
 
 
+def booking_error(work, user_id: int, professions: dict, workers: dict, now) -> str | None:
+    """Validate one booking against prefetched professions and workers, returns the error detail if invalid"""
+    if work.profession_id not in professions:
+        return "Profession does not exist"
+    if professions[work.profession_id] is None:
+        return "Profession does not have an estimated time"
+    if user_id == work.assigned_to_id:
+        return "User cannot self assign work"
+    worker = workers.get(work.assigned_to_id)
+    if worker is None:
+        return "Professional does not exist"
+    if worker["profession_id"] != work.profession_id:
+        return "selected worker is not a professional of selected profession"
+    if timezone.is_aware(work.scheduled_time):
+        return "Scheduled time should not be timezone aware. Only naive time is allowed"
+    if work.scheduled_date < now.date() or (
+        work.scheduled_date == now.date() and work.scheduled_time < now.time()
+    ):
+        return "Scheduled time is in the past. Only future works can be booked"
+    return None
+
+
+async def insert_works(new_works: list[Works], user_id: int, now, conn) -> None:
+    """
+    Insert a batch of works with one INSERT and set their ids. bulk_create does not set them, so
+    they are read back with one query, keyed by worker and scheduled start: the slot check keeps
+    those unique within a batch. Backends other than Postgres and SQLite may round created_at,
+    so the rows could not be found again, there the works are saved one by one.
+    """
+    if conn.capabilities.dialect not in ("postgres", "sqlite"):
+        for new_work in new_works:
+            await new_work.save(using_db=conn)
+        return
+
+    await Works.bulk_create(new_works, using_db=conn)
+    # Times may come back with or without the time zone depending on the backend
+    ids = {
+        (worker_id, scheduled_date, scheduled_time.replace(tzinfo=None)): work_id
+        for work_id, worker_id, scheduled_date, scheduled_time in await Works.filter(
+            booked_by_id=user_id,
+            created_at=now,
+            assigned_to_id__in={new_work.assigned_to_id for new_work in new_works},
+        )
+        .using_db(conn)
+        .values_list("id", "assigned_to_id", "scheduled_date", "scheduled_time")
+    }
+    for new_work in new_works:
+        new_work.id = ids[
+            (
+                new_work.assigned_to_id,
+                new_work.scheduled_date,
+                new_work.scheduled_time.replace(tzinfo=None),
+            )
+        ]
+
+
+@router.post("/book-works")
+async def create_works(
+    works: list[work_create_in], user: TokenData = Depends(get_current_user)
+):
+    """
+    This route is used to book several works at once. Same fields and rules as /book-a-work per item.
+    All items are validated with one query per table and the valid ones are inserted in one transaction.
+
+    requires:
+    - List of works, at most MAX_BOOKING_BATCH
+
+    returns:
+    - results: one entry per item in request order, with status "created" or "rejected" and a detail.
+      Created entries also carry the work_id of the new work.
+    - 201 if at least one work was created, 400 if every item was rejected
+    """
+    if not works:
+        raise HTTPException(status_code=400, detail="No works provided")
+    if len(works) > MAX_BOOKING_BATCH:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MAX_BOOKING_BATCH} works can be booked at once"
+        )
+
+    if not await UserDetails.filter(user_id=user.id).exists():
+        raise HTTPException(
+            status_code=400, detail="User does not have valid address to create a work"
+        )
+
+    professions = dict(
+        await Professions.filter(
+            id__in={work.profession_id for work in works}
+        ).values_list("id", "estimated_time_hours")
+    )
+    workers = {
+        worker["user_id"]: worker
+        for worker in await WorkerDetails.filter(
+            user_id__in={work.assigned_to_id for work in works}
+        ).values("user_id", "profession_id", "hourly_rate")
+    }
+
+    now = timezone.now()
+    bounds = [
+        slots.slot_bounds(
+            work.scheduled_date, work.scheduled_time, professions.get(work.profession_id)
+        )
+        for work in works
+    ]
+    # Existing bookings of every requested worker over the whole span of the batch, in one query
+    busy = await slots.busy_intervals(
+        workers.keys(),
+        min(starts_at for starts_at, _ in bounds),
+        max(ends_at for _, ends_at in bounds),
+    )
+    results = []
+    created = []
+    new_works = []
+    new_slots = []
+    for work, (starts_at, ends_at) in zip(works, bounds):
+        error = booking_error(work, user.id, professions, workers, now)
+        if error is None and slots.conflicts(
+            busy.get(work.assigned_to_id, []), starts_at, ends_at
+        ):
+            error = "Professional is not available at the scheduled time"
+        if error is not None:
+            results.append({"status": "rejected", "detail": error})
+            continue
+        # Later items of the batch must not overlap this one either
+        busy.setdefault(work.assigned_to_id, []).append((starts_at, ends_at))
+        new_slots.append((work.assigned_to_id, starts_at, ends_at))
+        new_works.append(
+            Works(
+                **work.dict(exclude_unset=True),
+                booked_by_id=user.id,
+                status="pending",
+                payment_status="pending",
+                estimated_cost=workers[work.assigned_to_id]["hourly_rate"]
+                * professions[work.profession_id],
+                created_at=now,
+                modified_at=now,
+            )
+        )
+        created.append({"status": "created", "detail": "Work creation sucessful"})
+        results.append(created[-1])
+
+    if new_works:
+        try:
+            async with outbox.transaction() as conn:
+                await insert_works(new_works, user.id, now, conn)
+                await WorkerSlots.bulk_create(
+                    [
+                        WorkerSlots(
+                            worker_id=worker_id,
+                            work_id=new_work.id,
+                            starts_at=starts_at,
+                            ends_at=ends_at,
+                            created_at=now,
+                        )
+                        for new_work, (worker_id, starts_at, ends_at) in zip(new_works, new_slots)
+                    ],
+                    using_db=conn,
+                )
+                for new_work in new_works:
+                    await emit_work(new_work, "work.booked", conn, status="pending")
+        except IntegrityError:
+            raise HTTPException(
+                status_code=409,
+                detail="A professional was booked concurrently for the same time, no work was booked",
+            )
+        except OperationalError as e:
+            msg_logger("Batch booking failed: %s", 40, e)
+            raise HTTPException(status_code=500, detail="Failed to book works")
+        for result, new_work in zip(created, new_works):
+            result["work_id"] = new_work.id
+
+    status_code = 201 if new_works else 400
+    return JSONResponse(content={"results": results}, status_code=status_code)
+
+
+@router.get("/availability/{worker_id}")
+async def get_availability(worker_id: int, day: date | None = None, days: int = 1):
+    """
+    This route is used to get the busy intervals (bookings and blocked time) of a worker.
+
+    requires:
+    - worker_id
+
+    optional:
+    - day: first day (UTC), defaults to today
+    - days: number of days, at most MAX_AVAILABILITY_DAYS
+    """
+    if not 1 <= days <= MAX_AVAILABILITY_DAYS:
+        raise HTTPException(
+            status_code=400, detail=f"days must be between 1 and {MAX_AVAILABILITY_DAYS}"
+        )
+    if not await WorkerDetails.filter(user_id=worker_id).exists():
+        raise HTTPException(status_code=404, detail="Professional does not exist")
+
+    starts_at, _ = slots.slot_bounds(day or timezone.now().date(), datetime.min.time(), 0)
+    ends_at = starts_at + timedelta(days=days)
+    intervals = (await slots.busy_intervals([worker_id], starts_at, ends_at)).get(worker_id, [])
+    return {
+        "worker_id": worker_id,
+        "from": starts_at,
+        "to": ends_at,
+        "busy": [
+            {"starts_at": slot_start, "ends_at": slot_end} for slot_start, slot_end in intervals
+        ],
+    }
+
+
+@router.post("/availability/block")
+async def block_time(block: TimeBlock, user: TokenData = Depends(get_current_user)):
+    """
+    This route is used by a worker to mark time as unavailable for bookings.
+
+    requires:
+    - starts_at, ends_at: timezone aware datetimes
+    """
+    if user.role != "worker":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    if block.starts_at.tzinfo is None or block.ends_at.tzinfo is None:
+        raise HTTPException(status_code=400, detail="starts_at and ends_at must be timezone aware")
+    if block.ends_at <= block.starts_at:
+        raise HTTPException(status_code=400, detail="ends_at must be after starts_at")
+    if await slots.is_busy(user.id, block.starts_at, block.ends_at):
+        raise HTTPException(status_code=409, detail="Time overlaps an existing booking or block")
+
+    try:
+        slot = await WorkerSlots.create(
+            worker_id=user.id,
+            starts_at=block.starts_at,
+            ends_at=block.ends_at,
+            created_at=timezone.now(),
+        )
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Time overlaps an existing booking or block")
+    return JSONResponse(
+        content={"detail": "Time blocked sucessfully", "slot_id": slot.id}, status_code=201
+    )
+
+
+@router.delete("/availability/block/{slot_id}")
+async def unblock_time(slot_id: int, user: TokenData = Depends(get_current_user)):
+    """
+    This route is used by a worker to remove a time block. Booked slots are freed by cancelling or rejecting the work.
+
+    requires:
+    - slot_id
+    """
+    deleted = await WorkerSlots.filter(id=slot_id, worker_id=user.id, work_id=None).delete()
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Time block does not exist")
+    return JSONResponse(content={"detail": "Time block removed sucessfully"}, status_code=200)
+
+
+@router.get("/events")
+async def work_events(request: Request, user: TokenData = Depends(get_current_user)):
+    """
+    This route is a Server-Sent Events stream of the transitions of works the user booked or is assigned to
+    (booked, accepted, rejected, cancelled, expired, started, final_cost_quoted, payment_sent, payment_received).
+    Each event carries the type, work_id and the changed fields. Clients should refetch their works on
+    (re)connect, events that happen while disconnected are not replayed.
+    """
+
+    async def stream():
+        queue = broker.subscribe(user.id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:  # Dropped as a slow consumer or the server is shutting down
+                    return
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            broker.unsubscribe(user.id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/search")
+async def search_works(
+    tags: list[str] | None = Query(None),
+    user: TokenData = Depends(get_current_user),
+    limit: int = Query(search.DEFAULT_SEARCH_LIMIT, ge=1, le=search.MAX_SEARCH_LIMIT),
+    offset: int = Query(0, ge=0),
+):
+    """
+    This route is used to find the works booked by or assigned to the current user by their tags.
+    Works carrying more of the given tags come first, `rank` is the number of matching tags.
+
+    requires:
+    - tags: one or more tags, e.g. ?tags=leak&tags=kitchen
+    """
+    if not tags:
+        raise HTTPException(status_code=400, detail="Provide at least one tag")
+    if len(tags) > MAX_SEARCH_TAGS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MAX_SEARCH_TAGS} tags are allowed"
+        )
+    return jsonable_encoder(await search.search_works(user.id, tags, limit, offset))
+
+
 @router.get("/booked-works", response_model=list[work_details_out])
 async def get_my_works(user: TokenData = Depends(get_current_user)):
     """
@@ -274,6 +837,28 @@ async def get_assigned_works(user: TokenData = Depends(get_current_user)):
     return await work_details_out.from_queryset(Works.filter(assigned_to_id=user.id))
 
 
+async def transition(work: Works, topic: str, release_slot: bool = False, **changes):
+    """
+    Apply `changes` to a work and record the transition in the outbox, in one transaction.
+    Pass release_slot=True when the work will not happen anymore, to free the worker's time.
+
+    The update only applies if the work is still in the state the caller checked, a concurrent
+    request that moved it first gets a 409 and nothing is recorded.
+    """
+    async with outbox.transaction() as conn:
+        updated = await Works.filter(
+            id=work.id, status=work.status, payment_status=work.payment_status
+        ).using_db(conn).update(**changes, modified_at=timezone.now())
+        if updated != 1:
+            raise HTTPException(
+                status_code=409,
+                detail="Work was changed by another request. Reload it and try again",
+            )
+        if release_slot:
+            await slots.release(work.id, using_db=conn)
+        await emit_work(work, topic, conn, **changes)
+
+
 @router.post("/accept-work/{work_id}")
 async def accept_work(work_id: int, user: TokenData = Depends(get_current_user)):
     """
@@ -300,9 +885,7 @@ async def accept_work(work_id: int, user: TokenData = Depends(get_current_user))
             detail="Work is not in pending state. Only pending works can be accepted",
         )
     if work.scheduled_date < timezone.now().date():
-        await Works.filter(id=work_id).update(
-            status="expired", modified_at=timezone.now()
-        )
+        await transition(work, "work.expired", release_slot=True, status="expired")
         raise HTTPException(
             status_code=400,
             detail="Work already expired. Only future works can be accepted",
@@ -311,15 +894,13 @@ async def accept_work(work_id: int, user: TokenData = Depends(get_current_user))
     # Hence we need to convert timezone.now().time() to aware time for comparison since
     # timezone.now().time() is timezone naive
     if work.scheduled_time < timezone.make_aware(timezone.now().time()):
-        await Works.filter(id=work_id).update(
-            status="expired", modified_at=timezone.now()
-        )
+        await transition(work, "work.expired", release_slot=True, status="expired")
         raise HTTPException(
             status_code=400,
             detail="Work already expired. Only future works can be accepted",
         )
 
-    await Works.filter(id=work_id).update(status="accepted", modified_at=timezone.now())
+    await transition(work, "work.accepted", status="accepted")
     return JSONResponse(
         content={"detail": "Work accepted sucessfully"}, status_code=200
     )
@@ -351,9 +932,7 @@ async def cancel_work(work_id: int, user: TokenData = Depends(get_current_user))
             detail="Work is not in pending state. Only pending works can be cancelled",
         )
 
-    await Works.filter(id=work_id).update(
-        status="cancelled", modified_at=timezone.now()
-    )
+    await transition(work, "work.cancelled", release_slot=True, status="cancelled")
     return JSONResponse(
         content={"detail": "Work cancelled sucessfully"}, status_code=200
     )
@@ -386,23 +965,19 @@ async def reject_work(work_id: int, user: TokenData = Depends(get_current_user))
         )
 
     if work.scheduled_date < timezone.now().date():
-        await Works.filter(id=work_id).update(
-            status="expired", modified_at=timezone.now()
-        )
+        await transition(work, "work.expired", release_slot=True, status="expired")
         raise HTTPException(
             status_code=400,
             detail="Work already expired. Only future works can be rejected",
         )
     if work.scheduled_time < timezone.make_aware(timezone.now().time()):
-        await Works.filter(id=work_id).update(
-            status="expired", modified_at=timezone.now()
-        )
+        await transition(work, "work.expired", release_slot=True, status="expired")
         raise HTTPException(
             status_code=400,
             detail="Work already expired. Only future works can be rejected",
         )
 
-    await Works.filter(id=work_id).update(status="rejected", modified_at=timezone.now())
+    await transition(work, "work.rejected", release_slot=True, status="rejected")
     return JSONResponse(
         content={"detail": "Work rejected sucessfully"}, status_code=200
     )
@@ -480,7 +1055,7 @@ async def start_work(work_id: int, user: TokenData = Depends(get_current_user)):
             detail="Work is not in accepted state. Accept the work before starting it",
         )
 
-    await Works.filter(id=work_id).update(status="started", modified_at=timezone.now())
+    await transition(work, "work.started", status="started")
     return JSONResponse(content={"detail": "Work started sucessfully"}, status_code=200)
 
 
@@ -513,9 +1088,7 @@ async def quote_final_cost(
             detail="Work is not yet in started state. Only started works can be quoted",
         )
 
-    await Works.filter(id=work_id).update(
-        final_cost=final_cost, modified_at=timezone.now()
-    )
+    await transition(work, "work.final_cost_quoted", final_cost=final_cost)
     return JSONResponse(
         content={"detail": "Final cost quoted sucessfully"}, status_code=200
     )
@@ -557,16 +1130,13 @@ async def recieve_payment(work_id: int, user: TokenData = Depends(get_current_us
     if (
         work.payment_status == "sent"
     ):  # If payment is already in "sent" state, the client has marked it as paid.
-        await Works.filter(
-            id=work_id
-        ).update(  # Hence the worker cam mark it as received and close the work.
-            payment_status="received", status="closed", modified_at=timezone.now()
+        # Hence the worker cam mark it as received and close the work.
+        await transition(
+            work, "work.payment_received", payment_status="received", status="closed"
         )
 
     else:  # If not, the worker can only update payment status.
-        await Works.filter(id=work_id).update(
-            payment_status="received", modified_at=timezone.now()
-        )
+        await transition(work, "work.payment_received", payment_status="received")
 
     return JSONResponse(
         content={"detail": "Payment recieved sucessfully"}, status_code=200
@@ -606,16 +1176,11 @@ async def send_payment(work_id: int, user: TokenData = Depends(get_current_user)
         )
 
     if work.payment_status == "received":
-        await Works.filter(
-            id=work_id
-        ).update(  # If payment is already in "received" state, the worker has marked it as paid.
-            status="closed", modified_at=timezone.now()
-        )
+        # If payment is already in "received" state, the worker has marked it as paid.
+        await transition(work, "work.payment_sent", status="closed")
 
     else:  # If not, the client can only update payment status.
-        await Works.filter(id=work_id).update(
-            payment_status="sent", modified_at=timezone.now()
-        )
+        await transition(work, "work.payment_sent", payment_status="sent")
 
     return JSONResponse(content={"detail": "Payment sent sucessfully"}, status_code=200)
 
@@ -673,7 +1238,7 @@ async def review_work(
     new_avg_rating = reviews_sum / reviews_count
 
     try:
-        async with in_transaction() as conn:
+        async with outbox.transaction() as conn:
             await Reviews.create(
                 using_db=conn,
                 **review.dict(exclude_unset=True),
@@ -686,13 +1251,20 @@ async def review_work(
             await WorkerDetails.filter(user_id=work.assigned_to_id).using_db(
                 conn
             ).update(avg_rating=new_avg_rating)
+            # Rollups, the worker's ranking and cached listings are updated by the outbox dispatcher
+            await emit_work(work, "review.created", conn, rating=review.rating)
     except OperationalError as e:
         msg_logger(
-            f"Failed to review work. Tried new average rating: {new_avg_rating}", 40
+            "Failed to review work. Tried new average rating: %s", 40, new_avg_rating
         )
         raise HTTPException(status_code=500, detail="Failed to review work")
 
-    msg_logger(f"Work reviewed sucessfully. New Average Rating: {new_avg_rating}", 20)
+    msg_logger(
+        "Work reviewed sucessfully. New Average Rating: %s",
+        20,
+        new_avg_rating,
+        work_id=work_id,
+    )
 
     return JSONResponse(
         content={"detail": "Work reviewed sucessfully"}, status_code=200
@@ -731,7 +1303,7 @@ async def update_review(
             detail="Work id does not correspond to a valid work booking",
         )
 
-    if work.booked_by != user.id:
+    if work.booked_by_id != user.id:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     try:
@@ -742,11 +1314,29 @@ async def update_review(
             detail="Work is not reviewed yet. Review the work first",
         )
 
-    await Reviews.filter(id=review_obj.id).update(
-        **review.dict(exclude_unset=True),
-        edited=True,
-        modified_at=timezone.now(),
-    )
+    async with outbox.transaction() as conn:
+        await Reviews.filter(id=review_obj.id).using_db(conn).update(
+            **review.dict(exclude_unset=True),
+            edited=True,
+            modified_at=timezone.now(),
+        )
+        new_avg_rating = (
+            await Reviews.filter(worker_id=work.assigned_to_id)
+            .using_db(conn)
+            .annotate(avg_rating=Avg("rating"))
+            .values_list("avg_rating", flat=True)
+        )[0]
+        await WorkerDetails.filter(user_id=work.assigned_to_id).using_db(conn).update(
+            avg_rating=new_avg_rating
+        )
+        await emit_work(
+            work,
+            "review.updated",
+            conn,
+            rating=review.rating,
+            previous_rating=review_obj.rating,
+            reviewed_on=review_obj.created_at.date().isoformat(),
+        )
     return JSONResponse(
         content={"detail": "Work review updated sucessfully"}, status_code=200
     )
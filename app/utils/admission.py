@@ -0,0 +1,124 @@
+import os
+import asyncio
+from app.utils.metrics import Counter, Gauge
+
+# Requests in flight in this process past which normal traffic is shed, low priority traffic is
+# shed from LOW_PRIORITY_SHARE of it. Critical requests (work transitions, payments) are never shed.
+MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", 100))
+LOW_PRIORITY_SHARE = 0.5
+# Event loop lag past which low priority traffic is shed, normal traffic is shed from twice of it
+MAX_LOOP_LAG_SECONDS = float(os.environ.get("ADMISSION_MAX_LAG_MS", 250)) / 1000
+LAG_PROBE_INTERVAL_SECONDS = 0.1
+LAG_DECAY = 0.7
+RETRY_AFTER_SECONDS = 1
+
+CRITICAL = "critical"
+NORMAL = "normal"
+LOW = "low"
+# Admitted like low priority traffic but not counted in flight, it stays open for a long time
+STREAM = "stream"
+EXEMPT = "exempt"
+
+_WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+# First match wins, anything else is normal
+PRIORITY_RULES = (
+    # Probes and metrics have to answer especially when overloaded
+    (None, ("/healthz", "/readyz", "/metrics"), EXEMPT),
+    (("GET",), ("/work/events",), STREAM),
+    # Bookings, work transitions, payments and reviews
+    (_WRITE_METHODS, ("/work/",), CRITICAL),
+    # Recommendations, listings, searches and reports, clients can retry them later
+    (
+        ("GET",),
+        (
+            "/users/recommend",
+            "/users/professions",
+            "/work/professionals",
+            "/work/tags",
+            "/work/search",
+            "/admin/analytics",
+            "/admin/work/history",
+        ),
+        LOW,
+    ),
+)
+
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight", "HTTP requests being served by this process", ("priority",)
+)
+http_requests_shed_total = Counter(
+    "http_requests_shed_total",
+    "HTTP requests rejected by admission control",
+    ("priority", "reason"),
+)
+event_loop_lag_seconds = Gauge(
+    "event_loop_lag_seconds", "Event loop lag seen by the lag probe, decaying over a few probes"
+)
+
+
+def classify(method: str, path: str) -> str:
+    for methods, prefixes, priority in PRIORITY_RULES:
+        if (methods is None or method in methods) and path.startswith(prefixes):
+            return priority
+    return NORMAL
+
+
+class AdmissionController:
+    """
+    Decides whether a request is served, from the requests in flight and the event loop lag.
+    Lag is measured by a task that sleeps for a fixed interval and records how late it wakes up.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self.loop_lag = 0.0
+        self.task: asyncio.Task | None = None
+
+    def rejection(self, priority: str) -> str | None:
+        """Why a request of `priority` has to be shed right now, None if it can be served"""
+        if priority in (CRITICAL, EXEMPT):
+            return None
+        if priority in (LOW, STREAM):
+            if self.in_flight >= MAX_IN_FLIGHT * LOW_PRIORITY_SHARE:
+                return "in_flight"
+            if self.loop_lag >= MAX_LOOP_LAG_SECONDS:
+                return "loop_lag"
+            return None
+        if self.in_flight >= MAX_IN_FLIGHT:
+            return "in_flight"
+        if self.loop_lag >= 2 * MAX_LOOP_LAG_SECONDS:
+            return "loop_lag"
+        return None
+
+    def enter(self, priority: str) -> None:
+        self.in_flight += 1
+        http_requests_in_flight.inc(priority)
+
+    def leave(self, priority: str) -> None:
+        self.in_flight -= 1
+        http_requests_in_flight.dec(priority)
+
+    async def probe_loop_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + LAG_PROBE_INTERVAL_SECONDS
+            await asyncio.sleep(LAG_PROBE_INTERVAL_SECONDS)
+            # Rises at once and decays over a few probes, so a single quick probe doesn't clear it
+            self.loop_lag = max(loop.time() - scheduled, self.loop_lag * LAG_DECAY, 0.0)
+            event_loop_lag_seconds.set(self.loop_lag)
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.probe_loop_lag())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            task, self.task = self.task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+admission = AdmissionController()
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from app.utils.metrics import Counter
+
+cache_requests_total = Counter(
+    "cache_requests_total", "Response cache lookups", ("namespace", "result")
+)
+
+
+class MemoryBackend:
+    """Per-process LRU cache with per entry expiry"""
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.counters: dict[str, int] = {}
+
+    async def get(self, key: str):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value, ttl: float) -> None:
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get_counter(self, key: str) -> int:
+        return self.counters.get(key, 0)
+
+    async def incr(self, key: str) -> int:
+        self.counters[key] = self.counters.get(key, 0) + 1
+        return self.counters[key]
+
+
+class RedisBackend:
+    """
+    Shared cache for all workers on any Redis compatible server.
+    Requires the optional `redis` package.
+    """
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_URL points to redis but the redis package is not installed") from e
+        self.client = redis.from_url(url)
+
+    async def get(self, key: str):
+        value = await self.client.get(key)
+        return None if value is None else json.loads(value)
+
+    async def set(self, key: str, value, ttl: float) -> None:
+        await self.client.set(key, json.dumps(value), px=int(ttl * 1000))
+
+    async def get_counter(self, key: str) -> int:
+        value = await self.client.get(key)
+        return 0 if value is None else int(value)
+
+    async def incr(self, key: str) -> int:
+        return await self.client.incr(key)
+
+
+class _LoaderCancelled(Exception):
+    """Set on a coalesced load whose request was cancelled, its waiters retry"""
+
+
+class ResponseCache:
+    """
+    Caches JSON-able route results per namespace.
+
+    Concurrent misses for the same key share one loader call. Invalidating a namespace bumps its
+    version, which is part of every key, so stale entries are never read again and simply expire.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.in_flight: dict[str, asyncio.Future] = {}
+
+    async def version(self, namespace: str) -> int:
+        """Changes whenever the namespace is invalidated, lets other caches follow the same invalidations"""
+        return await self.backend.get_counter(f"cache:version:{namespace}")
+
+    async def _key(self, namespace: str, key: str) -> str:
+        return f"cache:{namespace}:{await self.version(namespace)}:{key}"
+
+    async def get_or_set(self, namespace: str, key: str, ttl: float, loader):
+        while True:
+            full_key = await self._key(namespace, key)
+            value = await self.backend.get(full_key)
+            if value is not None:
+                cache_requests_total.inc(namespace, "hit")
+                return value
+
+            future = self.in_flight.get(full_key)
+            if future is not None:
+                cache_requests_total.inc(namespace, "coalesced")
+                try:
+                    return await asyncio.shield(future)
+                except _LoaderCancelled:
+                    continue  # The request loading it went away, one of the waiters loads it
+
+            cache_requests_total.inc(namespace, "miss")
+            future = asyncio.get_running_loop().create_future()
+            self.in_flight[full_key] = future
+            try:
+                value = await loader()
+                await self.backend.set(full_key, value, ttl)
+                future.set_result(value)
+                return value
+            except asyncio.CancelledError:
+                # Only this request was cancelled (e.g. the client disconnected), not the waiters
+                future.set_exception(_LoaderCancelled())
+                future.exception()
+                raise
+            except BaseException as e:
+                future.set_exception(e)
+                future.exception()  # Mark as retrieved, waiters (if any) get it raised
+                raise
+            finally:
+                del self.in_flight[full_key]
+
+    async def invalidate(self, *namespaces: str) -> None:
+        for namespace in namespaces:
+            await self.backend.incr(f"cache:version:{namespace}")
+
+
+def backend_from_url(url: str):
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    if url.startswith("memory://"):
+        return MemoryBackend(int(os.environ.get("CACHE_MAX_ENTRIES", 10_000)))
+    raise ValueError(f"unsupported CACHE_URL: {url}")
+
+
+response_cache = ResponseCache(backend_from_url(os.environ.get("CACHE_URL", "memory://")))
@@ -0,0 +1,175 @@
+import os
+import json
+import asyncio
+from tortoise import BaseDBAsyncClient, connections
+from app.utils.logger import msg_logger
+from app.utils.metrics import Counter, Gauge
+
+CHANNEL = "work_events"
+# Events buffered per connection before a slow client is disconnected
+SUBSCRIBER_QUEUE_SIZE = 100
+# Backoff between attempts to reconnect the LISTEN connection
+RECONNECT_MIN_SECONDS = 0.5
+RECONNECT_MAX_SECONDS = 30
+# The LISTEN connection is also checked this often, in case its termination went unnoticed
+LISTENER_CHECK_SECONDS = 30
+
+event_subscribers = Gauge("event_subscribers", "Open event stream connections in this process")
+events_published_total = Counter("events_published_total", "Events published", ("type",))
+events_dropped_total = Counter(
+    "events_dropped_total", "Subscribers disconnected because their queue was full"
+)
+event_listener_reconnects_total = Counter(
+    "event_listener_reconnects_total", "LISTEN connections reopened after they were lost"
+)
+
+
+def _end_stream(queue: asyncio.Queue) -> None:
+    """Make the stream of `queue` close, dropping an event to make room if it is full"""
+    try:
+        queue.put_nowait(None)
+    except asyncio.QueueFull:
+        queue.get_nowait()
+        queue.put_nowait(None)
+
+
+class EventBroker:
+    """
+    Delivers events to the event streams of users.
+
+    Subscriptions are kept per process. On Postgres, events are published with NOTIFY and every
+    process LISTENs on the channel, so an event reaches the user whichever worker holds the stream.
+    On other backends (and until start() is called) events are only delivered within the process.
+
+    A supervising task reconnects the LISTEN connection when it is lost. Events notified while it
+    was down are missed, so the open streams are closed and their clients reconnect and refetch.
+    """
+
+    def __init__(self):
+        self.subscribers: dict[int, set[asyncio.Queue]] = {}
+        self.notify = False
+        self.listener = None
+        self.listener_lost: asyncio.Event | None = None
+        self.supervisor: asyncio.Task | None = None
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        event_subscribers.inc()
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        queues = self.subscribers.get(user_id)
+        if queues is None or queue not in queues:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[user_id]
+        event_subscribers.dec()
+
+    def deliver(self, user_ids, event: dict) -> None:
+        for user_id in user_ids:
+            for queue in list(self.subscribers.get(user_id, ())):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    # The stream sees None and closes, the client reconnects and refetches
+                    events_dropped_total.inc()
+                    self.unsubscribe(user_id, queue)
+                    _end_stream(queue)
+
+    def close_streams(self) -> None:
+        for user_id, queues in list(self.subscribers.items()):
+            for queue in list(queues):
+                self.unsubscribe(user_id, queue)
+                _end_stream(queue)
+
+    async def publish(self, user_ids, event: dict, using_db: BaseDBAsyncClient | None = None) -> None:
+        """
+        Deliver `event` to the streams of `user_ids`. On Postgres, pass the connection of an open
+        transaction to only notify once (and if) it commits.
+        """
+        user_ids = sorted(set(user_ids))
+        events_published_total.inc(event.get("type", "unknown"))
+        if not self.notify:
+            self.deliver(user_ids, event)
+            return
+        payload = json.dumps({"user_ids": user_ids, "event": event}, default=str)
+        await (using_db or connections.get("default")).execute_query(
+            "SELECT pg_notify($1, $2)", [CHANNEL, payload]
+        )
+
+    def _on_notification(self, connection, pid, channel, payload) -> None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            msg_logger("Events: malformed notification: %s", 40, payload)
+            return
+        self.deliver(message["user_ids"], message["event"])
+
+    async def _listen(self) -> None:
+        import asyncpg
+
+        listener = await asyncpg.connect(os.environ["DB_URL"])
+        listener.add_termination_listener(lambda connection: self.listener_lost.set())
+        await listener.add_listener(CHANNEL, self._on_notification)
+        self.listener = listener
+
+    async def _close_listener(self) -> None:
+        listener, self.listener = self.listener, None
+        if listener is not None and not listener.is_closed():
+            try:
+                await listener.close(timeout=5)
+            except Exception:
+                listener.terminate()
+
+    async def _supervise(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self.listener_lost.wait(), LISTENER_CHECK_SECONDS)
+            except asyncio.TimeoutError:
+                if self.listener is not None and not self.listener.is_closed():
+                    continue
+            self.listener_lost.clear()
+            msg_logger("Events: LISTEN connection lost, reconnecting", 30)
+            await self._close_listener()
+            self.close_streams()
+            delay = RECONNECT_MIN_SECONDS
+            while True:
+                try:
+                    await self._listen()
+                    break
+                except Exception as e:
+                    msg_logger("Events: LISTEN reconnect failed, retrying in %ss: %s", 40, delay, e)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+            event_listener_reconnects_total.inc()
+
+    async def start(self) -> None:
+        """LISTEN for events of other processes. Only on Postgres, needs a dedicated connection."""
+        if connections.get("default").capabilities.dialect != "postgres" or self.notify:
+            return
+        self.notify = True
+        self.listener_lost = asyncio.Event()
+        try:
+            await self._listen()
+        except Exception as e:
+            msg_logger("Events: LISTEN connection failed, retrying in the background: %s", 40, e)
+            self.listener_lost.set()
+        self.supervisor = asyncio.get_running_loop().create_task(self._supervise())
+
+    async def stop(self) -> None:
+        if self.supervisor is not None:
+            supervisor, self.supervisor = self.supervisor, None
+            supervisor.cancel()
+            try:
+                await supervisor
+            except asyncio.CancelledError:
+                pass
+        self.notify = False
+        await self._close_listener()
+        self.close_streams()
+
+
+broker = EventBroker()
+
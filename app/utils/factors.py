@@ -0,0 +1,165 @@
+"""
+Memory mapped export of the recommendation model.
+
+`model.bin` is a pickled surprise SVDpp model. Unpickling it is slow, runs arbitrary code and
+gives every process its own copy. The export keeps only what predictions need, as .npy files
+opened with `mmap_mode="r"`, so the server workers and the compute pool share the pages:
+
+- user_ids.npy, item_ids.npy: raw ids, sorted, looked up with a binary search
+- bu.npy, bi.npy: user and item biases, in the order of the ids
+- user_vectors.npy: per user pu + |Iu|^-1/2 * sum(yj), the implicit feedback folded in
+- qi.npy: item factors
+- meta.json: global mean and rating scale
+
+Convert with `python -m app.utils.factors model.bin model_factors --verify`
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+from collections import namedtuple
+import numpy as np
+
+FORMAT_VERSION = 1
+# Largest difference to the pickled model's predictions `--verify` accepts
+VERIFY_TOLERANCE = 1e-9
+
+# Same fields as the surprise predictions read by the recommendation code
+Prediction = namedtuple("Prediction", ["uid", "iid", "est"])
+
+
+class FactorModel:
+    """SVDpp predictions from the exported arrays, like `AlgoBase.predict` with clipping"""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json")) as file:
+            meta = json.load(file)
+        if meta["format_version"] != FORMAT_VERSION:
+            raise ValueError(f"unsupported model export version {meta['format_version']}")
+        self.global_mean = meta["global_mean"]
+        self.rating_scale = tuple(meta["rating_scale"])
+
+        def load(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+        self.user_ids = load("user_ids")
+        self.item_ids = load("item_ids")
+        self.bu = load("bu")
+        self.bi = load("bi")
+        self.user_vectors = load("user_vectors")
+        self.qi = load("qi")
+
+    @staticmethod
+    def _index(ids: np.ndarray, raw_id) -> int | None:
+        index = int(np.searchsorted(ids, raw_id))
+        if index < len(ids) and ids[index] == raw_id:
+            return index
+        return None
+
+    def estimate(self, user_id, item_id) -> float:
+        user = self._index(self.user_ids, user_id)
+        item = self._index(self.item_ids, item_id)
+        est = self.global_mean
+        if user is not None:
+            est += self.bu[user]
+        if item is not None:
+            est += self.bi[item]
+        if user is not None and item is not None:
+            est += np.dot(self.qi[item], self.user_vectors[user])
+        lower_bound, higher_bound = self.rating_scale
+        return float(min(higher_bound, max(lower_bound, est)))
+
+    def predict(self, user_id, item_id) -> Prediction:
+        return Prediction(user_id, item_id, self.estimate(user_id, item_id))
+
+
+def export_factors(model, path: str) -> None:
+    """Write the arrays of a fitted surprise SVDpp `model` to the directory `path`"""
+    trainset = model.trainset
+    users = sorted(trainset._raw2inner_id_users.items())
+    items = sorted(trainset._raw2inner_id_items.items())
+    user_order = [inner for _, inner in users]
+    item_order = [inner for _, inner in items]
+
+    user_vectors = np.array(model.pu, dtype=np.float64)
+    for inner, ratings in trainset.ur.items():
+        if ratings:
+            implicit = [model.yj[item] for item, _ in ratings]
+            user_vectors[inner] += np.sum(implicit, axis=0) / np.sqrt(len(ratings))
+
+    arrays = {
+        "user_ids": np.array([raw for raw, _ in users], dtype=np.int64),
+        "item_ids": np.array([raw for raw, _ in items], dtype=np.int64),
+        "bu": np.asarray(model.bu, dtype=np.float64)[user_order],
+        "bi": np.asarray(model.bi, dtype=np.float64)[item_order],
+        "user_vectors": user_vectors[user_order],
+        "qi": np.asarray(model.qi, dtype=np.float64)[item_order],
+    }
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "global_mean": float(trainset.global_mean),
+        "rating_scale": list(trainset.rating_scale),
+    }
+
+    # Written next to the target and swapped in with two renames, so no process ever opens half an
+    # export. Only one starting between the renames finds no directory and loads model.bin instead.
+    partial = f"{path.rstrip(os.sep)}.partial"
+    previous = f"{path.rstrip(os.sep)}.previous"
+    shutil.rmtree(partial, ignore_errors=True)
+    shutil.rmtree(previous, ignore_errors=True)
+    os.makedirs(partial)
+    for name, array in arrays.items():
+        np.save(os.path.join(partial, f"{name}.npy"), np.ascontiguousarray(array))
+    with open(os.path.join(partial, "meta.json"), "w") as file:
+        json.dump(meta, file, indent=2)
+    if os.path.exists(path):
+        os.rename(path, previous)
+    os.rename(partial, path)
+    # Servers that mapped the old arrays keep reading them, unlinked files stay readable
+    shutil.rmtree(previous, ignore_errors=True)
+
+
+def verify_factors(model, factor_model: FactorModel) -> float:
+    """Largest difference between the predictions of both models, over every known user and item"""
+    trainset = model.trainset
+    # One unknown id of each kind, they only get the biases
+    user_ids = [*trainset._raw2inner_id_users, -1]
+    item_ids = [*trainset._raw2inner_id_items, -1]
+    return max(
+        abs(model.predict(user_id, item_id).est - factor_model.estimate(user_id, item_id))
+        for user_id in user_ids
+        for item_id in item_ids
+    )
+
+
+def main() -> int:
+    import pickle
+
+    parser = argparse.ArgumentParser(description="Export the pickled model to memory mapped arrays")
+    parser.add_argument("model", help="pickled surprise SVDpp model, e.g. model.bin")
+    parser.add_argument("output", help="directory to write the arrays to, e.g. model_factors")
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="check the export predicts what the pickled model predicts",
+    )
+    args = parser.parse_args()
+
+    with open(args.model, "rb") as file:
+        model = pickle.load(file)
+    export_factors(model, args.output)
+    print(f"Exported {model.trainset.n_users} users and {model.trainset.n_items} items to {args.output}")
+
+    if args.verify:
+        difference = verify_factors(model, FactorModel(args.output))
+        if difference > VERIFY_TOLERANCE:
+            print(f"Verification failed, predictions differ by up to {difference:.3g}")
+            return 1
+        print(f"Verified, predictions differ by up to {difference:.3g}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
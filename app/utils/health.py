@@ -0,0 +1,58 @@
+import time
+import asyncio
+from tortoise import connections
+from app.utils import warmup
+
+CHECK_TIMEOUT_SECONDS = 1.0
+# Probes from the orchestrator and load balancer share one result for this long
+CHECK_CACHE_SECONDS = 2.0
+
+
+async def check_database() -> tuple[bool, str]:
+    await connections.get("default").execute_query("SELECT 1")
+    return True, "ok"
+
+
+async def check_warm_up() -> tuple[bool, str]:
+    cold = [name for name, ready in warmup.components.items() if not ready]
+    if cold:
+        return False, "loading: " + ", ".join(cold)
+    return True, "ok"
+
+
+checks = {
+    "database": check_database,
+    "warm_up": check_warm_up,
+}
+
+_cached_at = 0.0
+_cached_result: dict | None = None
+_lock = asyncio.Lock()
+
+
+async def _run_check(check) -> dict:
+    try:
+        ok, detail = await asyncio.wait_for(check(), timeout=CHECK_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        ok, detail = False, f"timed out after {CHECK_TIMEOUT_SECONDS}s"
+    except Exception as e:
+        ok, detail = False, f"{type(e).__name__}: {e}"
+    return {"ok": ok, "detail": detail}
+
+
+async def readiness() -> dict:
+    """
+    Run every readiness check concurrently, each bounded by CHECK_TIMEOUT_SECONDS.
+    Results are cached for CHECK_CACHE_SECONDS and concurrent callers wait for the same run.
+    """
+    global _cached_at, _cached_result
+    async with _lock:
+        if _cached_result is None or time.monotonic() - _cached_at > CHECK_CACHE_SECONDS:
+            results = await asyncio.gather(*(_run_check(check) for check in checks.values()))
+            checks_result = dict(zip(checks.keys(), results))
+            _cached_result = {
+                "ready": all(result["ok"] for result in results),
+                "checks": checks_result,
+            }
+            _cached_at = time.monotonic()
+    return _cached_result
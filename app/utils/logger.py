@@ -1,24 +1,93 @@
+import os
+import json
+import queue
+import atexit
 import logging
 import logging.handlers
+from contextvars import ContextVar
+
+# Set per request by RequestContextMiddleware, read when a record is queued
+request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+_RECORD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line.
+    Runs on the listener thread, so the message is only interpolated there and never for filtered levels.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None) is not None:
+            payload["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and key != "request_id":
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that keeps the record lazy.
+
+    The stock handler formats the message on the calling thread so the record can be pickled.
+    Records never leave this process, so only the request id (a context variable that is not
+    visible from the listener thread) is attached here.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = request_id.get()
+        return record
+
 
 console_logger = logging.getLogger("console_logger")
+console_logger.setLevel(os.environ.get("LOG_LEVEL", "DEBUG").upper())
+console_logger.propagate = False
 
-console_logger.setLevel(logging.DEBUG)
-formatter = logging.Formatter("%(levelname)-10s%(message)s")
+log_queue: queue.SimpleQueue = queue.SimpleQueue()
 console_handler = logging.StreamHandler()
-console_handler.setFormatter(formatter)
-console_logger.addHandler(console_handler)
+console_handler.setFormatter(JSONFormatter())
+console_logger.addHandler(ContextQueueHandler(log_queue))
+
+# Writes to stderr happen on the listener thread instead of the event loop
+log_listener = logging.handlers.QueueListener(log_queue, console_handler)
+log_listener.start()
+_listener_running = True
 
 
-def msg_logger(message: str, level: int) -> None:
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread. Safe to call more than once."""
+    global _listener_running
+    if _listener_running:
+        _listener_running = False
+        log_listener.stop()
+
+
+atexit.register(stop_logging)
+
+
+def msg_logger(message: str, level: int, *args, **fields) -> None:
     """
     Levels:
     - 10: DEBUG
     - 20: INFO
     - 30: WARNING
     - 40: ERROR
+
+    `args` are interpolated into `message` %-style and `fields` are added to the JSON output.
+    Both are only formatted when the level is enabled, so avoid f-strings in `message`.
     """
     levels = (10, 20, 30, 40)
     if level not in levels:
         raise ValueError("invalid log level")
-    console_logger.log(level, message)
+    if console_logger.isEnabledFor(level):
+        console_logger.log(level, message, *args, extra=fields)
@@ -0,0 +1,191 @@
+import time
+import functools
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_registry: list = []
+
+
+def _format_labels(labelnames: tuple, labelvalues: tuple, extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in zip(labelnames, labelvalues)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: dict[tuple, float] = {}
+        _registry.append(self)
+
+    def inc(self, *labelvalues, amount: float = 1) -> None:
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labelvalues, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: dict[tuple, float] = {}
+        _registry.append(self)
+
+    def set(self, value: float, *labelvalues) -> None:
+        self.values[labelvalues] = value
+
+    def inc(self, *labelvalues, amount: float = 1) -> None:
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount: float = 1) -> None:
+        self.inc(*labelvalues, amount=-amount)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for labelvalues, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # labelvalues -> [bucket counts..., sum, count]
+        self.values: dict[tuple, list] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, *labelvalues) -> None:
+        series = self.values.get(labelvalues)
+        if series is None:
+            series = self.values[labelvalues] = [0] * (len(self.buckets) + 2)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labelvalues, series in self.values.items():
+            for bound, bucket_count in zip(self.buckets, series):
+                labels = _format_labels(self.labelnames, labelvalues, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labelnames, labelvalues, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+http_requests_total = Counter(
+    "http_requests_total", "Total HTTP requests", ("method", "route", "status")
+)
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route")
+)
+http_request_db_queries = Histogram(
+    "http_request_db_queries",
+    "Database queries issued per HTTP request",
+    ("method", "route"),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+http_request_db_duration_seconds = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent in the database per HTTP request",
+    ("method", "route"),
+)
+db_queries_total = Counter("db_queries_total", "Total database queries", ("operation",))
+
+
+@dataclass
+class DBStats:
+    queries: int = 0
+    seconds: float = 0.0
+
+
+# Set by the instrumentation middleware for the duration of a request
+request_db_stats: ContextVar[DBStats | None] = ContextVar("request_db_stats", default=None)
+# Guards against counting twice when an instrumented client method calls another one
+_in_db_call: ContextVar[bool] = ContextVar("in_db_call", default=False)
+
+_DB_METHODS = (
+    "execute_insert",
+    "execute_many",
+    "execute_query",
+    "execute_query_dict",
+    "execute_script",
+)
+
+
+def _instrument_method(method, operation: str):
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        if _in_db_call.get():
+            return await method(self, *args, **kwargs)
+        token = _in_db_call.set(True)
+        start = time.perf_counter()
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            _in_db_call.reset(token)
+            db_queries_total.inc(operation)
+            stats = request_db_stats.get()
+            if stats is not None:
+                stats.queries += 1
+                stats.seconds += elapsed
+
+    wrapper.__instrumented__ = True
+    return wrapper
+
+
+def _subclasses(cls) -> list:
+    classes = [cls]
+    for subclass in cls.__subclasses__():
+        classes.extend(_subclasses(subclass))
+    return classes
+
+
+def instrument_db_clients(clients) -> None:
+    """
+    Wrap the query methods of the given tortoise connections (and their transaction wrappers)
+    so every query is counted against the request that issued it. Safe to call more than once.
+    """
+    for client in clients:
+        for cls in _subclasses(type(client)):
+            for name in _DB_METHODS:
+                method = cls.__dict__.get(name)
+                if method is None or getattr(method, "__instrumented__", False):
+                    continue
+                setattr(cls, name, _instrument_method(method, name))
@@ -0,0 +1,200 @@
+import os
+import asyncio
+import fnmatch
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from tortoise import BaseDBAsyncClient, connections, timezone
+from tortoise.transactions import in_transaction
+from app.database.models import OutboxEvents
+from app.utils.logger import msg_logger
+from app.utils.metrics import Counter, Histogram
+
+# Events handled per drain, a drain is one transaction on Postgres
+BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", 100))
+# Backstop poll interval, committing writes wake the dispatcher of their own process right away
+POLL_SECONDS = float(os.environ.get("OUTBOX_POLL_SECONDS", 1.0))
+# An event that keeps failing is given up on (kept with its last_error) so it doesn't block the rest
+MAX_ATTEMPTS = 5
+RETENTION = timedelta(hours=24)
+# pg_try_advisory_xact_lock key, only one process drains at a time so events stay in order
+ADVISORY_LOCK_KEY = 4_201_733
+
+outbox_events_total = Counter("outbox_events_total", "Outbox events handled", ("topic", "result"))
+outbox_lag_seconds = Histogram("outbox_lag_seconds", "Time from emit to handled", ("topic",))
+
+_handlers: list[tuple[str, object]] = []
+
+
+def handles(pattern: str):
+    """
+    Register `async def handler(event, conn)` for topics matching `pattern` (fnmatch).
+    `event` holds the topic, payload and created_at, `conn` is the connection of the drain transaction.
+    """
+
+    def register(handler):
+        _handlers.append((pattern, handler))
+        return handler
+
+    return register
+
+
+async def emit(topic: str, payload: dict, using_db: BaseDBAsyncClient | None = None) -> None:
+    """
+    Store an event. Pass the connection of the `transaction()` that makes the change it describes,
+    the dispatcher is woken once it commits.
+    """
+    await OutboxEvents.create(
+        topic=topic, payload=payload, created_at=timezone.now(), using_db=using_db
+    )
+    if using_db is None:
+        dispatcher.wake()  # Already committed
+
+
+@asynccontextmanager
+async def transaction():
+    """
+    `in_transaction()` for writes that emit events. Waking the dispatcher before the commit would
+    let it poll before the events are visible, so it is only woken after a successful commit.
+    """
+    async with in_transaction() as conn:
+        yield conn
+    dispatcher.wake()
+
+
+async def _handle(event: dict, conn: BaseDBAsyncClient) -> None:
+    for pattern, handler in _handlers:
+        if fnmatch.fnmatchcase(event["topic"], pattern):
+            await handler(event, conn)
+
+
+async def _next_events(conn: BaseDBAsyncClient) -> list[dict]:
+    return (
+        await OutboxEvents.filter(processed_at=None)
+        .using_db(conn)
+        .order_by("id")
+        .limit(BATCH_SIZE)
+        .values("id", "topic", "payload", "attempts", "created_at")
+    )
+
+
+async def _process_event(event: dict, conn: BaseDBAsyncClient) -> None:
+    """Run the handlers of `event` and mark it processed, `conn` must be in a transaction"""
+    try:
+        await _handle(event, conn)
+    except Exception as e:
+        # Raised out of the transaction, so the counters the handlers incremented are rolled back
+        raise _HandlerFailed(event, e) from e
+    now = timezone.now()
+    await OutboxEvents.filter(id=event["id"]).using_db(conn).update(processed_at=now)
+    outbox_events_total.inc(event["topic"], "ok")
+    outbox_lag_seconds.observe((now - event["created_at"]).total_seconds(), event["topic"])
+
+
+async def _process_batch(conn: BaseDBAsyncClient) -> int:
+    """Postgres, the whole batch runs in the transaction holding the advisory lock"""
+    events = await _next_events(conn)
+    for event in events:
+        await _process_event(event, conn)
+    return len(events)
+
+
+async def _process_each() -> int:
+    """Other backends have no advisory lock, every event gets its own transaction"""
+    events = await _next_events(connections.get("default"))
+    for event in events:
+        async with in_transaction() as conn:
+            await _process_event(event, conn)
+    return len(events)
+
+
+class _HandlerFailed(Exception):
+    def __init__(self, event: dict, error: Exception):
+        super().__init__(str(error))
+        self.event = event
+        self.error = error
+
+
+async def drain_once() -> int:
+    """Handle the next batch of events, returns how many were handled"""
+    try:
+        if connections.get("default").capabilities.dialect != "postgres":
+            return await _process_each()
+        async with in_transaction() as conn:
+            locked = await conn.execute_query_dict(
+                "SELECT pg_try_advisory_xact_lock($1) AS locked", [ADVISORY_LOCK_KEY]
+            )
+            if not locked[0]["locked"]:
+                return 0  # Another process is draining
+            return await _process_batch(conn)
+    except _HandlerFailed as failure:
+        event = failure.event
+        attempts = event["attempts"] + 1
+        given_up = attempts >= MAX_ATTEMPTS
+        await OutboxEvents.filter(id=event["id"]).update(
+            attempts=attempts,
+            last_error=f"{type(failure.error).__name__}: {failure.error}",
+            processed_at=timezone.now() if given_up else None,
+        )
+        outbox_events_total.inc(event["topic"], "failed" if given_up else "retry")
+        msg_logger(
+            "Outbox: %s event %s failed (attempt %s): %s",
+            40,
+            event["topic"],
+            event["id"],
+            attempts,
+            failure.error,
+        )
+        return 0
+
+
+async def purge_processed() -> None:
+    await OutboxEvents.filter(
+        processed_at__lt=timezone.now() - RETENTION, last_error=None
+    ).delete()
+
+
+class Dispatcher:
+    def __init__(self):
+        self.task: asyncio.Task | None = None
+        self.wake_event: asyncio.Event | None = None
+
+    def wake(self) -> None:
+        if self.wake_event is not None:
+            self.wake_event.set()
+
+    async def run(self) -> None:
+        drains = 0
+        while True:
+            try:
+                await asyncio.wait_for(self.wake_event.wait(), timeout=POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self.wake_event.clear()
+            try:
+                # Keep going while full batches come back
+                while await drain_once() == BATCH_SIZE:
+                    pass
+                drains += 1
+                if drains % 3600 == 0:
+                    await purge_processed()
+            except Exception as e:
+                msg_logger("Outbox: drain failed: %s", 40, e)
+                await asyncio.sleep(POLL_SECONDS)
+
+    def start(self) -> None:
+        if self.task is None:
+            self.wake_event = asyncio.Event()
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            task, self.task = self.task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            self.wake_event = None
+
+
+dispatcher = Dispatcher()
@@ -0,0 +1,121 @@
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException
+from app.utils.logger import msg_logger
+from app.utils.metrics import Counter, Gauge, Histogram
+
+# Processes running CPU bound jobs (model predictions, distance ranking), 0 runs them on a thread instead
+WORKERS = int(os.environ.get("COMPUTE_POOL_WORKERS", min(4, os.cpu_count() or 1)))
+# Jobs waiting or running per worker before new ones are turned away
+QUEUE_PER_WORKER = 4
+TIMEOUT_SECONDS = float(os.environ.get("COMPUTE_POOL_TIMEOUT_SECONDS", 10))
+RETRY_AFTER_SECONDS = 2
+
+compute_jobs_total = Counter("compute_jobs_total", "Compute pool jobs", ("job", "result"))
+compute_job_duration_seconds = Histogram(
+    "compute_job_duration_seconds", "Compute pool job latency, queueing included", ("job",)
+)
+compute_jobs_pending = Gauge("compute_jobs_pending", "Compute pool jobs waiting or running")
+
+
+def _preload() -> None:
+    """Runs once in every worker process, so that the first job doesn't pay for the imports"""
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+    from geopy.distance import geodesic  # noqa: F401
+    from app.utils.recommend import get_model
+
+    get_model()
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class ComputePool:
+    """
+    A process pool for CPU bound work, so it runs on other cores instead of blocking the event loop.
+
+    Workers are spawned (not forked, the server has threads running) and preloaded with the model.
+    The number of jobs waiting or running is bounded and every job has a timeout. Both turn into a
+    503 for the client. A job that timed out keeps its worker busy until it finishes.
+    """
+
+    def __init__(self, workers: int, timeout: float):
+        self.workers = workers
+        self.max_pending = workers * QUEUE_PER_WORKER
+        self.timeout = timeout
+        self.pending = 0
+        self.executor: ProcessPoolExecutor | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def start(self) -> None:
+        if self.enabled and self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_preload,
+            )
+
+    async def warm_up(self) -> None:
+        """Start every worker and wait until it has loaded the model"""
+        if self.executor is not None:
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(
+                *(loop.run_in_executor(self.executor, _ping) for _ in range(self.workers))
+            )
+
+    def _busy(self, job: str, result: str, detail: str) -> HTTPException:
+        compute_jobs_total.inc(job, result)
+        return HTTPException(
+            status_code=503, detail=detail, headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+        )
+
+    async def run(self, function, *args):
+        """Run `function(*args)` in a worker process, both have to be picklable"""
+        job = function.__name__
+        if self.executor is None:
+            # Pool disabled (or not started, e.g. without the app lifespan), keep the loop free anyway
+            return await asyncio.to_thread(function, *args)
+        if self.pending >= self.max_pending:
+            raise self._busy(job, "rejected", "Server is busy, try again later")
+
+        self.pending += 1
+        compute_jobs_pending.set(self.pending)
+        start = time.perf_counter()
+        executor = self.executor
+        try:
+            future = executor.submit(function, *args)
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()  # Only helps if it is still queued
+            raise self._busy(job, "timeout", "Request took too long, try again later")
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory), the pool can't be used anymore
+            # Concurrent jobs of the broken pool all get here, only the first one restarts it
+            if self.executor is executor:
+                msg_logger("Compute pool: a worker died, restarting the pool", 40)
+                self.stop()  # Reaps the broken pool's remaining workers and management thread
+                self.start()
+            raise self._busy(job, "broken", "Server is busy, try again later")
+        finally:
+            self.pending -= 1
+            compute_jobs_pending.set(self.pending)
+        compute_jobs_total.inc(job, "ok")
+        compute_job_duration_seconds.observe(time.perf_counter() - start, job)
+        return result
+
+    def stop(self) -> None:
+        if self.executor is not None:
+            executor, self.executor = self.executor, None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+compute_pool = ComputePool(WORKERS, TIMEOUT_SECONDS)
@@ -0,0 +1,159 @@
+import time
+import asyncio
+from collections import Counter, defaultdict
+from datetime import timedelta
+from tortoise import timezone
+from tortoise.functions import Sum
+from app.database.models import Professions, UserDetails, WorkRollups
+from app.utils.cache import response_cache
+
+# Bookings of the last POPULARITY_WINDOW_DAYS count towards popularity
+POPULARITY_WINDOW_DAYS = 180
+# Rebuilt when the professions cache is invalidated (e.g. a new profession), and at least this often
+POPULARITY_MAX_AGE_SECONDS = 600
+# A city's bookings are smoothed towards its state's popularity as if the state added this many
+# bookings, and a state's towards the overall popularity, so few works don't decide a small region
+PRIOR_BOOKINGS = 20
+# Closed works at which the model and the regional popularity weigh the same in a recommendation
+HALF_MODEL_WEIGHT_WORKS = 5
+
+
+def _smoothed(counts: Counter, prior: dict) -> dict:
+    total = sum(counts.values())
+    return {
+        profession_id: (counts.get(profession_id, 0) + PRIOR_BOOKINGS * share)
+        / (total + PRIOR_BOOKINGS)
+        for profession_id, share in prior.items()
+    }
+
+
+def _ranked(shares: dict) -> tuple[dict, list[int]]:
+    """
+    Shares scaled so the most popular profession of the region is 1 (like a model estimate),
+    and the professions ordered by them. Professions nobody booked are left out.
+    """
+    best = max(shares.values(), default=0)
+    if best <= 0:
+        return {}, []
+    scores = {profession_id: share / best for profession_id, share in shares.items() if share > 0}
+    return scores, sorted(scores, key=lambda profession_id: (-scores[profession_id], profession_id))
+
+
+class RegionalPopularity:
+    """
+    How popular every profession is with the clients of a city, of a state and overall, from the
+    booking rollups. Every region's ranking is computed once when built, lookups are dict reads.
+    """
+
+    def __init__(self, profession_ids: list[int], city_counts: dict, city_states: dict):
+        self.profession_ids = profession_ids
+        overall_counts = Counter()
+        state_counts = defaultdict(Counter)
+        for city, counts in city_counts.items():
+            overall_counts.update(counts)
+            state_counts[city_states.get(city)].update(counts)
+
+        total = sum(overall_counts.values())
+        overall = {
+            profession_id: overall_counts.get(profession_id, 0) / total if total else 0
+            for profession_id in profession_ids
+        }
+        states = {state: _smoothed(counts, overall) for state, counts in state_counts.items()}
+        cities = {
+            city: _smoothed(counts, states[city_states.get(city)])
+            for city, counts in city_counts.items()
+        }
+
+        # Region -> (popularity per profession, profession ids most popular first)
+        self.overall = _ranked(overall)
+        self.states = {state: _ranked(shares) for state, shares in states.items()}
+        self.cities = {city: _ranked(shares) for city, shares in cities.items()}
+
+    def _region(self, city: str | None, state: str | None) -> tuple[dict, list[int]]:
+        """The most specific region known, the city, then the state, then everywhere"""
+        if city in self.cities:
+            return self.cities[city]
+        if state in self.states:
+            return self.states[state]
+        return self.overall
+
+    def scores(self, city: str | None, state: str | None) -> dict:
+        """Popularity of the booked professions in the region, from 0 to 1"""
+        return self._region(city, state)[0]
+
+    def top(self, city: str | None, state: str | None, count: int) -> list[int]:
+        """Ids of the `count` most popular professions of the region, most popular first"""
+        return self._region(city, state)[1][:count]
+
+
+async def build_regional_popularity() -> RegionalPopularity:
+    since = timezone.now().date() - timedelta(days=POPULARITY_WINDOW_DAYS)
+    city_counts = defaultdict(Counter)
+    for profession_id, city, bookings in (
+        await WorkRollups.filter(day__gte=since)
+        .annotate(total=Sum("bookings"))
+        .group_by("profession_id", "city")
+        .values_list("profession_id", "city", "total")
+    ):
+        if bookings:
+            city_counts[city][profession_id] += bookings
+
+    # Rollups are keyed by city only, a city belongs to the state most of its users live in
+    city_states = {}
+    pairs = Counter(
+        await UserDetails.filter(city__in=list(city_counts)).values_list("city", "state")
+    )
+    for (city, state), _ in sorted(pairs.items(), key=lambda item: item[1]):
+        city_states[city] = state
+
+    profession_ids = await Professions.all().order_by("id").values_list("id", flat=True)
+    # Rollups outlive deleted professions
+    known = set(profession_ids)
+    for counts in city_counts.values():
+        for profession_id in set(counts) - known:
+            del counts[profession_id]
+    return RegionalPopularity(profession_ids, city_counts, city_states)
+
+
+class PopularityCache:
+    """The latest RegionalPopularity, rebuilt when professions are invalidated or it is too old"""
+
+    def __init__(self):
+        self.popularity: RegionalPopularity | None = None
+        self.version = None
+        self.built_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def _is_fresh(self, version) -> bool:
+        return (
+            self.popularity is not None
+            and self.version == version
+            and time.monotonic() - self.built_at < POPULARITY_MAX_AGE_SECONDS
+        )
+
+    async def get(self) -> RegionalPopularity:
+        version = await response_cache.version("professions")
+        if not self._is_fresh(version):
+            async with self.lock:
+                # Concurrent requests share one rebuild
+                if not self._is_fresh(version):
+                    self.popularity = await build_regional_popularity()
+                    self.version = version
+                    self.built_at = time.monotonic()
+        return self.popularity
+
+
+def blend(model_scores: dict, popularity: dict, closed_works: int) -> dict:
+    """
+    Mix the model's estimates with the regional popularity. The model's weight grows with the
+    user's history: none without closed works, half at HALF_MODEL_WEIGHT_WORKS.
+    """
+    model_weight = closed_works / (closed_works + HALF_MODEL_WEIGHT_WORKS)
+    return {
+        profession_id: model_weight * estimate
+        + (1 - model_weight) * popularity.get(profession_id, 0)
+        for profession_id, estimate in model_scores.items()
+    }
+
+
+regional_popularity = PopularityCache()
@@ -0,0 +1,69 @@
+import sys
+import time
+import threading
+from collections import Counter
+
+
+class SamplingProfiler:
+    """
+    Minimal statistical profiler for a single request.
+
+    A background thread samples the stack of the event loop thread at a fixed interval.
+    Other requests served concurrently on the same loop show up in the samples too,
+    so profiles are most useful on an otherwise idle instance.
+    """
+
+    def __init__(self, interval: float = 0.001, thread_id: int | None = None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.duration = 0.0
+        self._started_at = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.samples[tuple(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def start(self) -> None:
+        self._started_at = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._started_at
+
+    def render(self, limit: int = 40) -> str:
+        """Plain text report: hottest functions by self and total samples, then collapsed stacks"""
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in self.samples.items():
+            if stack:
+                self_counts[stack[-1]] += count
+            for function in set(stack):
+                total_counts[function] += count
+
+        lines = [
+            f"duration: {self.duration * 1000:.1f} ms, samples: {self.sample_count}, "
+            f"interval: {self.interval * 1000:.1f} ms",
+            "",
+            "self samples:",
+        ]
+        lines += [f"{count:8d}  {function}" for function, count in self_counts.most_common(limit)]
+        lines += ["", "total samples:"]
+        lines += [f"{count:8d}  {function}" for function, count in total_counts.most_common(limit)]
+        lines += ["", "collapsed stacks (flamegraph input):"]
+        lines += [
+            ";".join(stack) + f" {count}" for stack, count in self.samples.most_common(limit)
+        ]
+        return "\n".join(lines) + "\n"
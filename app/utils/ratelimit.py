@@ -0,0 +1,175 @@
+import os
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from fastapi import HTTPException, Request
+from app.dependencies import decode_token
+from app.utils.metrics import Counter
+
+rate_limited_total = Counter(
+    "rate_limited_total", "Requests rejected by the rate limiter", ("cost_class", "reason")
+)
+
+
+@dataclass(frozen=True)
+class Limit:
+    capacity: float  # Burst size, requests a client can make at once
+    per_second: float  # Sustained rate the bucket refills at
+    concurrency: int  # Requests a client can have in flight at once, per process
+
+
+# Cost classes of the expensive routes, every client gets a bucket per class
+limits = {
+    # bcrypt verification, keyed per IP since the client has no token yet
+    "login": Limit(capacity=5, per_second=10 / 60, concurrency=2),
+    # Reads the whole work history and runs the model
+    "recommend": Limit(capacity=3, per_second=6 / 60, concurrency=1),
+    # Distance to every candidate of a profession
+    "filter": Limit(capacity=20, per_second=1, concurrency=4),
+}
+
+
+class MemoryBackend:
+    """Per-process buckets, the least recently used ones are dropped (refilled) past `max_keys`"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self.buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: str, limit: Limit) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self.buckets.get(key, (limit.capacity, now))
+        tokens = min(limit.capacity, tokens + (now - updated_at) * limit.per_second)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / limit.per_second
+        self.buckets[key] = (tokens, now)
+        self.buckets.move_to_end(key)
+        while len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return wait
+
+
+# Refill and take in one step on the server, so concurrent workers never both spend the last token.
+# The wait is returned as a string, Redis would truncate a Lua number to an integer.
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local per_second = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * per_second)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / per_second
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / per_second * 1000))
+return tostring(wait)
+"""
+
+
+class RedisBackend:
+    """
+    Buckets shared by all workers on any Redis compatible server.
+    Requires the optional `redis` package.
+    """
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(
+                "RATE_LIMIT_URL points to redis but the redis package is not installed"
+            ) from e
+        self.client = redis.from_url(url)
+        self.script = self.client.register_script(_TAKE_SCRIPT)
+
+    async def take(self, key: str, limit: Limit) -> float:
+        return float(await self.script(keys=[key], args=[limit.capacity, limit.per_second]))
+
+
+class RateLimiter:
+    def __init__(self, backend):
+        self.backend = backend
+        self.in_flight: dict[str, int] = {}
+
+    async def acquire(self, cost_class: str, client: str) -> str:
+        """Take a token and a concurrency slot, raises 429 when either is exhausted"""
+        limit = limits[cost_class]
+        key = f"ratelimit:{cost_class}:{client}"
+        if self.in_flight.get(key, 0) >= limit.concurrency:
+            rate_limited_total.inc(cost_class, "concurrency")
+            raise HTTPException(
+                status_code=429,
+                detail="Too many concurrent requests",
+                headers={"Retry-After": "1"},
+            )
+        wait = await self.backend.take(key, limit)
+        if wait > 0:
+            rate_limited_total.inc(cost_class, "rate")
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+        self.in_flight[key] = self.in_flight.get(key, 0) + 1
+        return key
+
+    def release(self, key: str) -> None:
+        remaining = self.in_flight.get(key, 0) - 1
+        if remaining > 0:
+            self.in_flight[key] = remaining
+        else:
+            self.in_flight.pop(key, None)
+
+
+def client_key(request: Request) -> str:
+    """The user of the bearer token if there is a valid one, the client address otherwise"""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        claims = decode_token(token)
+        if claims is not None and claims.get("id") is not None:
+            return f"user:{claims['id']}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def rate_limit(cost_class: str):
+    """
+    Dependency limiting every client to the `limits[cost_class]` budget, e.g.
+    `@router.get("/x", dependencies=[Depends(rate_limit("filter"))])`
+    """
+    if cost_class not in limits:
+        raise ValueError(f"unknown cost class: {cost_class}")
+
+    async def dependency(request: Request):
+        if rate_limiter is None:
+            yield
+            return
+        key = await rate_limiter.acquire(cost_class, client_key(request))
+        try:
+            yield
+        finally:
+            rate_limiter.release(key)
+
+    return dependency
+
+
+def limiter_from_url(url: str) -> RateLimiter | None:
+    if url == "off":
+        return None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RateLimiter(RedisBackend(url))
+    if url.startswith("memory://"):
+        return RateLimiter(MemoryBackend())
+    raise ValueError(f"unsupported RATE_LIMIT_URL: {url}")
+
+
+rate_limiter = limiter_from_url(os.environ.get("RATE_LIMIT_URL", "memory://"))
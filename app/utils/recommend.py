@@ -1,9 +1,39 @@
+import os
 import pickle
+import threading
 from itertools import product
-import pandas as pd
+from typing import TYPE_CHECKING
 
-with open("model.bin", "rb") as file:
-    model = pickle.load(file)
+if TYPE_CHECKING:
+    import pandas as pd
+
+MODEL_PATH = "model.bin"
+# Memory mapped export of the model (see app.utils.factors), used instead of the pickle when present
+FACTORS_PATH = os.environ.get("MODEL_FACTORS_PATH", "model_factors")
+
+# Unpickling the model and importing pandas take seconds, so both are deferred until first use
+# (or until the startup warm up task runs) instead of happening when the app is imported.
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                if os.path.isdir(FACTORS_PATH):
+                    from app.utils.factors import FactorModel
+
+                    _model = FactorModel(FACTORS_PATH)
+                else:
+                    with open(MODEL_PATH, "rb") as file:
+                        _model = pickle.load(file)
+    return _model
+
+
+def is_model_loaded() -> bool:
+    return _model is not None
 
 
 def handle_zero_division(prediction):
@@ -15,12 +45,13 @@ def handle_zero_division(prediction):
 
 
 def get_top_n_recommendations(
-    history: pd.DataFrame, user_id: int, count: int
+    history: "pd.DataFrame", user_id: int, count: int
 ) -> list[tuple]:
     past_selections = set(history[history["booked_by_id"] == user_id]["profession_id"])
     all_professions = set(history["profession_id"])
     unconsidered_professions = all_professions - past_selections
 
+    model = get_model()
     predictions = [
         (
             profession_id,
@@ -47,7 +78,9 @@ def have_booked(user, profession, history: list):
 
 def dict_to_pd_df(
     history: list, unique_profession_ids: list, unique_user_ids: list
-) -> pd.DataFrame:
+) -> "pd.DataFrame":
+    import pandas as pd
+
     cols = ["booked_by_id", "profession_id", "booked_or_not"]
     df = pd.DataFrame(
         [
@@ -60,3 +93,12 @@ def dict_to_pd_df(
     )
     df.to_csv("extracted_dataset.csv", index=False)
     return df
+
+
+def predict_professions(user_id: int, profession_ids: list) -> dict:
+    """Model estimate of every profession of `profession_ids` for the user, runs in the compute pool"""
+    model = get_model()
+    return {
+        profession_id: handle_zero_division(model.predict(user_id, profession_id))
+        for profession_id in profession_ids
+    }
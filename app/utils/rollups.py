@@ -0,0 +1,112 @@
+from collections import defaultdict
+from datetime import date
+from tortoise import BaseDBAsyncClient, connections, timezone
+from tortoise.transactions import in_transaction
+from app.database.models import Reviews, UserDetails, Works, WorkRollups
+from app.utils.streaming import iter_chunks
+
+ROLLUP_COUNTERS = ("bookings", "cancellations", "revenue", "rating_sum", "rating_count")
+UNKNOWN_CITY = "unknown"
+
+# Postgres and SQLite (3.24+) share the upsert syntax, only the placeholders differ
+_UPSERT_SQL = """
+INSERT INTO "workrollups" ("profession_id", "city", "day", {columns}, "modified_at")
+VALUES ({placeholders})
+ON CONFLICT ("profession_id", "city", "day") DO UPDATE SET {increments}, "modified_at" = excluded."modified_at"
+"""
+
+
+async def record(
+    profession_id: int,
+    city: str,
+    day: date,
+    using_db: BaseDBAsyncClient | None = None,
+    **deltas,
+) -> None:
+    """
+    Add `deltas` (e.g. bookings=1, revenue=250.0) to the rollup row of a profession, city and day.
+    A single atomic upsert, so concurrent requests never lose an increment.
+    """
+    unknown = set(deltas) - set(ROLLUP_COUNTERS)
+    if unknown:
+        raise ValueError(f"unknown rollup counters: {', '.join(sorted(unknown))}")
+    conn = using_db or connections.get("default")
+    columns = list(deltas)
+    values = [profession_id, city, day, *deltas.values(), timezone.now()]
+    if conn.capabilities.dialect == "postgres":
+        placeholders = ", ".join(f"${index}" for index in range(1, len(values) + 1))
+    else:
+        placeholders = ", ".join("?" for _ in values)
+    sql = _UPSERT_SQL.format(
+        columns=", ".join(f'"{column}"' for column in columns),
+        placeholders=placeholders,
+        increments=", ".join(
+            f'"{column}" = "workrollups"."{column}" + excluded."{column}"' for column in columns
+        ),
+    )
+    await conn.execute_query(sql, values)
+
+
+async def get_city(user_id: int) -> str:
+    city = await UserDetails.filter(user_id=user_id).first().values_list("city", flat=True)
+    return city or UNKNOWN_CITY
+
+
+async def get_cities(user_ids) -> dict:
+    """City of every user of `user_ids` that has an address"""
+    return dict(
+        await UserDetails.filter(user_id__in=set(user_ids)).values_list("user_id", "city")
+    )
+
+
+async def rebuild_rollups() -> int:
+    """
+    Recompute every rollup row from Works and Reviews, e.g. after a manual change in the database.
+    Both tables are read in chunks, only the aggregates are kept in memory. Returns the row count.
+
+    Bookings are bucketed by the day the work was created, cancellations and revenue by the day the
+    work reached its final state and ratings by the day the review was written.
+    """
+    totals = defaultdict(lambda: dict.fromkeys(ROLLUP_COUNTERS, 0))
+
+    async for works in iter_chunks(
+        Works.all(),
+        ["profession_id", "booked_by_id", "status", "final_cost", "created_at", "modified_at"],
+    ):
+        cities = await get_cities(work["booked_by_id"] for work in works)
+        for work in works:
+            city = cities.get(work["booked_by_id"], UNKNOWN_CITY)
+            totals[(work["profession_id"], city, work["created_at"].date())]["bookings"] += 1
+            closed_on = (work["profession_id"], city, work["modified_at"].date())
+            if work["status"] == "cancelled":
+                totals[closed_on]["cancellations"] += 1
+            elif work["status"] == "closed" and work["final_cost"] is not None:
+                totals[closed_on]["revenue"] += work["final_cost"]
+
+    async for reviews in iter_chunks(
+        Reviews.all(), ["rating", "user_id", "work__profession_id", "created_at"]
+    ):
+        cities = await get_cities(review["user_id"] for review in reviews)
+        for review in reviews:
+            key = (
+                review["work__profession_id"],
+                cities.get(review["user_id"], UNKNOWN_CITY),
+                review["created_at"].date(),
+            )
+            totals[key]["rating_sum"] += review["rating"]
+            totals[key]["rating_count"] += 1
+
+    now = timezone.now()
+    async with in_transaction() as conn:
+        await WorkRollups.all().using_db(conn).delete()
+        await WorkRollups.bulk_create(
+            [
+                WorkRollups(
+                    profession_id=profession_id, city=city, day=day, modified_at=now, **counters
+                )
+                for (profession_id, city, day), counters in totals.items()
+            ],
+            batch_size=1000,
+            using_db=conn,
+        )
+    return len(totals)
@@ -1,18 +1,26 @@
 import os
-from geopy.distance import geodesic
-import numpy as np
-from app.database.models import Reviews
+import math
+import heapq
+from tortoise import BaseDBAsyncClient, timezone
+from tortoise.functions import Avg, Count
+from tortoise.transactions import in_transaction
+from tortoise.exceptions import DoesNotExist
+from app.database.models import Reviews, UserDetails, WorkerDetails, WorkerRankings
+from app.utils.pool import compute_pool
 
 weights = {
     "distance": float(os.environ["DISTANCE_WEIGHT"]),
     "review_count": float(os.environ["REVIEW_COUNT_WEIGHT"]),
     "cost": float(os.environ["COST_WEIGHT"]),
     "rating": float(os.environ["RATING_WEIGHT"]),
+    # Optional, older deployments do not set it
+    "tags": float(os.environ.get("TAG_WEIGHT", 0.2)),
 }
+# Candidate lists at least this long are ranked in the compute pool instead of on the event loop
+POOL_MIN_CANDIDATES = 200
 
 
-def calculate_score(
-    distance: float,
+def calculate_base_score(
     rating: float,
     review_count: int,
     hourly_cost: float,
@@ -20,10 +28,13 @@ def calculate_score(
     weights: dict,
 ) -> float:
     """
-    Calculate the score for a worker based on various factors.
+    Calculate the user independent part of a worker's score.
+
+    This is the score without the distance term, so it only changes when the
+    worker's rating, review count or hourly rate (or the mean rate of the profession) changes.
+    It is precomputed and stored per worker in `WorkerRankings`.
 
     Args:
-    - distance: Distance between the worker and the user (in meters)
     - rating: Average rating of the worker from previous bookings
     - review_count: Number of reviews that made up the average rating
     - hourly_cost: Hourly cost of the worker
@@ -31,23 +42,74 @@ def calculate_score(
     - weights: Dictionary containing weights for each factor
 
     Returns:
-    - score: Calculated score for the worker
+    - base_score: Score of the worker without the distance factor
     """
-    if distance > 0:
-        distance_factor = weights['distance'] * (1 / np.square(distance))
-    else:
-        distance_factor = 0
-
     if review_count > 0:
-        review_count_factor = weights['review_count'] * (1 / np.sqrt(review_count))
+        review_count_factor = weights['review_count'] * (1 / math.sqrt(review_count))
     else:
         review_count_factor = 0
 
     cost_factor = weights["cost"] * (mean_hourly_cost_other / hourly_cost)
 
-    score = (
-        weights["rating"] * rating + review_count_factor + cost_factor + distance_factor
-    )
+    return weights["rating"] * rating + review_count_factor + cost_factor
+
+
+def calculate_distance_factor(distance: float, weights: dict) -> float:
+    """
+    Calculate the user dependent part of a worker's score.
+
+    Args:
+    - distance: Distance between the worker and the user (in meters)
+    - weights: Dictionary containing weights for each factor
+    """
+    if distance > 0:
+        return weights['distance'] * (1 / (distance * distance))
+    return 0
+
+
+def calculate_tag_factor(tag_counts: dict, requested_tags: int, weights: dict) -> float:
+    """
+    Calculate how much a worker's past works match the tags a user is looking for.
+
+    Every requested tag adds up to 1, saturating with the number of the worker's works that
+    carried it (1 work: 0.5, 3 works: 0.75, ...), so the factor is between 0 and the tags weight.
+
+    Args:
+    - tag_counts: Works of the worker per requested tag, from `WorkerTagStats`
+    - requested_tags: Number of tags the user is looking for
+    - weights: Dictionary containing weights for each factor
+    """
+    if requested_tags == 0:
+        return 0
+    matched = sum(1 - 1 / (1 + count) for count in tag_counts.values())
+    return weights["tags"] * matched / requested_tags
+
+
+def calculate_score(
+    distance: float,
+    rating: float,
+    review_count: int,
+    hourly_cost: float,
+    mean_hourly_cost_other: float,
+    weights: dict,
+) -> float:
+    """
+    Calculate the score for a worker based on various factors.
+
+    Args:
+    - distance: Distance between the worker and the user (in meters)
+    - rating: Average rating of the worker from previous bookings
+    - review_count: Number of reviews that made up the average rating
+    - hourly_cost: Hourly cost of the worker
+    - mean_hourly_cost_other: Mean hourly cost of other workers in the same profession
+    - weights: Dictionary containing weights for each factor
+
+    Returns:
+    - score: Calculated score for the worker
+    """
+    score = calculate_base_score(
+        rating, review_count, hourly_cost, mean_hourly_cost_other, weights
+    ) + calculate_distance_factor(distance, weights)
     return score
 
 
@@ -56,35 +118,199 @@ async def get_review_count(worker_id: int):
 
 
 def calulate_distane_in_km(cords_1: tuple, cords_2: tuple) -> float:
+    from geopy.distance import geodesic  # geopy pulls in all of its geocoders, keep it off the import path
+
     return geodesic(cords_1, cords_2).kilometers
 
 
-async def sort_workers_by_score(
-    workers: list, user_cords: tuple, mean_hourly_rate: float
+async def get_mean_hourly_rate(
+    profession_id: int, using_db: BaseDBAsyncClient | None = None
+) -> float | None:
+    return (
+        await WorkerDetails.filter(profession_id=profession_id)
+        .using_db(using_db)
+        .annotate(avg_hourly_rate=Avg("hourly_rate"))
+        .values_list("avg_hourly_rate", flat=True)
+    )[0]
+
+
+async def refresh_worker_rankings(
+    profession_id: int,
+    worker_ids: list | None = None,
+    using_db: BaseDBAsyncClient | None = None,
 ):
-    sorted_workers = []
+    """
+    Recompute the stored ranking rows (and worker cards) of a profession.
+
+    Changing a worker's hourly rate moves the mean rate of the whole profession, so callers
+    must refresh every worker of the profession in that case. Rating and address changes only
+    affect the worker itself and can pass `worker_ids` to limit the refresh.
+    Pass `using_db` to refresh inside a transaction of the caller, e.g. an outbox handler's.
+    """
+    mean_hourly_rate = await get_mean_hourly_rate(profession_id, using_db)
+    workers = WorkerDetails.filter(profession_id=profession_id).using_db(using_db)
+    if worker_ids is not None:
+        workers = workers.filter(user_id__in=worker_ids)
+    workers = await workers.values(
+        "user_id",
+        "hourly_rate",
+        "avg_rating",
+        "user__first_name",
+        "user__last_name",
+        "profession__name",
+    )
+    if not workers:
+        return
+
+    ids = [worker["user_id"] for worker in workers]
+    addresses = {
+        address["user_id"]: address
+        for address in await UserDetails.filter(user_id__in=ids).using_db(using_db).values(
+            "user_id", "city", "state", "latitude", "longitude"
+        )
+    }
+    review_counts = dict(
+        await Reviews.filter(worker_id__in=ids)
+        .using_db(using_db)
+        .annotate(review_count=Count("id"))
+        .group_by("worker_id")
+        .values_list("worker_id", "review_count")
+    )
+
+    rankings = []
     for worker in workers:
-        worker_dict = worker.model_dump()
-        worker_avg_rating = worker_dict.get("worker")[0].get("avg_rating")
-        worker_review_count = await get_review_count(worker_dict.get("id"))
-        worker_hourly_rate = worker_dict.get("worker")[0].get("hourly_rate")
-        worker_cords = (
-            float(
-                worker_dict.get("user")[0].get("latitude")
-            ),  # why did the serializer put the json inside a list when there is nothing else there
-            float(worker_dict.get("user")[0].get("longitude")),
+        address = addresses.get(worker["user_id"])
+        if address is None:  # Workers always have an address, but do not break the refresh if one is missing
+            continue
+        review_count = review_counts.get(worker["user_id"], 0)
+        rankings.append(
+            WorkerRankings(
+                worker_id=worker["user_id"],
+                first_name=worker["user__first_name"],
+                last_name=worker["user__last_name"],
+                profession_id=profession_id,
+                profession_name=worker["profession__name"],
+                city=address["city"],
+                state=address["state"],
+                latitude=float(address["latitude"]),
+                longitude=float(address["longitude"]),
+                hourly_rate=worker["hourly_rate"],
+                avg_rating=worker["avg_rating"],
+                review_count=review_count,
+                base_score=calculate_base_score(
+                    worker["avg_rating"],
+                    review_count,
+                    worker["hourly_rate"],
+                    mean_hourly_rate,
+                    weights,
+                ),
+                modified_at=timezone.now(),
+            )
         )
-        distance_to_user = calulate_distane_in_km(user_cords, worker_cords)
-        score =  calculate_score(
-            distance_to_user,
-            worker_avg_rating,
-            worker_review_count,
-            worker_hourly_rate,
-            mean_hourly_rate,
-            weights
+
+    if using_db is not None:
+        await _replace_rankings(ids, rankings, using_db)
+    else:
+        async with in_transaction() as conn:
+            await _replace_rankings(ids, rankings, conn)
+
+
+async def _replace_rankings(
+    worker_ids: list, rankings: list[WorkerRankings], conn: BaseDBAsyncClient
+) -> None:
+    await WorkerRankings.filter(worker_id__in=worker_ids).using_db(conn).delete()
+    await WorkerRankings.bulk_create(rankings, using_db=conn)
+
+
+async def refresh_worker_ranking(worker_id: int, using_db: BaseDBAsyncClient | None = None):
+    try:
+        worker = await WorkerDetails.get(user_id=worker_id, using_db=using_db)
+    except DoesNotExist:
+        return
+    await refresh_worker_rankings(worker.profession_id, [worker_id], using_db)
+
+
+async def refresh_all_rankings():
+    profession_ids = await WorkerDetails.all().distinct().values_list(
+        "profession_id", flat=True
+    )
+    for profession_id in profession_ids:
+        await refresh_worker_rankings(profession_id)
+
+
+def rank_points(
+    points: list[tuple],
+    user_cords: tuple,
+    limit: int | None = None,
+    max_distance_km: float | None = None,
+) -> list[tuple]:
+    """
+    Rank (key, score without distance, latitude, longitude) points for a user. Plain tuples in and
+    out, so that it can run in the compute pool.
+
+    returns:
+    - List of (score, distance_to_user_in_km, key) tuples, best first
+    """
+    scored = []
+    for key, score, latitude, longitude in points:
+        distance_to_user = calulate_distane_in_km(user_cords, (latitude, longitude))
+        if max_distance_km is not None and distance_to_user > max_distance_km:
+            continue
+        scored.append(
+            (score + calculate_distance_factor(distance_to_user, weights), distance_to_user, key)
+        )
+
+    if limit is not None:
+        return heapq.nlargest(limit, scored, key=lambda item: item[0])
+    return sorted(scored, key=lambda item: item[0], reverse=True)
+
+
+def _points(candidates: list[WorkerRankings], tag_factors: dict | None) -> list[tuple]:
+    tag_factors = tag_factors or {}
+    return [
+        (
+            index,
+            candidate.base_score + tag_factors.get(candidate.worker_id, 0),
+            candidate.latitude,
+            candidate.longitude,
         )
-        worker_dict["score"] = score
-        worker_dict["distance_to_user_in_km"] = distance_to_user
-        if 'user' in worker_dict: del worker_dict['user']
-        sorted_workers.append(worker_dict)
-    return sorted_workers
+        for index, candidate in enumerate(candidates)
+    ]
+
+
+def sort_workers_by_score(
+    candidates: list[WorkerRankings],
+    user_cords: tuple,
+    limit: int | None = None,
+    max_distance_km: float | None = None,
+    tag_factors: dict | None = None,
+) -> list[tuple]:
+    """
+    Rank precomputed worker rows for a user. Only the distance factor is computed here,
+    the rest of the score comes from `WorkerRankings.base_score` and, when the user asked for
+    tags, `tag_factors` (worker_id to `calculate_tag_factor`).
+
+    returns:
+    - List of (score, distance_to_user_in_km, candidate) tuples, best first
+    """
+    ranked = rank_points(_points(candidates, tag_factors), user_cords, limit, max_distance_km)
+    return [(score, distance, candidates[index]) for score, distance, index in ranked]
+
+
+async def rank_workers(
+    candidates: list[WorkerRankings],
+    user_cords: tuple,
+    limit: int | None = None,
+    max_distance_km: float | None = None,
+    tag_factors: dict | None = None,
+) -> list[tuple]:
+    """
+    `sort_workers_by_score` that runs in the compute pool for large candidate lists.
+    Small lists are ranked inline, sending them to a worker would cost more than ranking them.
+    """
+    if len(candidates) < POOL_MIN_CANDIDATES:
+        return sort_workers_by_score(candidates, user_cords, limit, max_distance_km, tag_factors)
+    ranked = await compute_pool.run(
+        rank_points, _points(candidates, tag_factors), user_cords, limit, max_distance_km
+    )
+    return [(score, distance, candidates[index]) for score, distance, index in ranked]
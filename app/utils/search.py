@@ -0,0 +1,276 @@
+import re
+import math
+import time
+import asyncio
+from bisect import bisect_left
+from collections import defaultdict
+from tortoise import connections
+from tortoise.expressions import Q
+from app.database.models import Professions, WorkerDetails, Works
+from app.utils.cache import response_cache
+from app.utils.streaming import iter_chunks
+
+# The in-process indexes (used when the database has no full-text search) are rebuilt when the
+# professions or professionals caches are invalidated, and at least this often
+FALLBACK_MAX_AGE_SECONDS = 300
+# A word in a profession name counts as much as this many words in its description
+NAME_WEIGHT = 3
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Page size bounds of the search routes
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+# Postgres searches are served by the GIN indexes of the search_indexes migration, the expressions
+# below have to stay identical to the indexed ones
+_PROFESSIONS_SQL = """
+SELECT p."id", p."name", p."description", p."estimated_time_hours",
+    ts_rank(to_tsvector('english', p."name" || ' ' || COALESCE(p."description", '')), q."query")
+        + similarity(p."name", $1) AS "rank"
+FROM "professions" p, websearch_to_tsquery('english', $1) AS q("query")
+WHERE to_tsvector('english', p."name" || ' ' || COALESCE(p."description", '')) @@ q."query"
+    OR p."name" % $1
+ORDER BY "rank" DESC, p."id"
+LIMIT $2 OFFSET $3
+"""
+
+_WORKERS_SQL = """
+SELECT w."user_id" AS "id", u."first_name", u."last_name", w."profession_id", w."hourly_rate",
+    w."avg_rating", w."worker_bio",
+    ts_rank(to_tsvector('english', w."worker_bio"), q."query")
+        + word_similarity($1, w."worker_bio") AS "rank"
+FROM "workerdetails" w JOIN "users" u ON u."id" = w."user_id",
+    websearch_to_tsquery('english', $1) AS q("query")
+WHERE (to_tsvector('english', w."worker_bio") @@ q."query" OR $1 <% w."worker_bio")
+    AND ($4::INT IS NULL OR w."profession_id" = $4)
+ORDER BY "rank" DESC, w."user_id"
+LIMIT $2 OFFSET $3
+"""
+
+_WORKS_SQL = """
+SELECT "id", "tags", "user_description", "profession_id", "scheduled_date", "scheduled_time",
+    "status",
+    cardinality(ARRAY(SELECT unnest("tags") INTERSECT SELECT unnest($2::TEXT[]))) AS "rank"
+FROM "works"
+WHERE "tags" && $2::TEXT[] AND ("booked_by_id" = $1 OR "assigned_to_id" = $1)
+ORDER BY "rank" DESC, "id" DESC
+LIMIT $3 OFFSET $4
+"""
+
+_WORD = re.compile(r"[^\W_]+")
+# Words websearch_to_tsquery('english', ...) ignores as well
+_STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it of on or that the this to was with"
+    .split()
+)
+
+
+def tokenize(text: str | None) -> list[str]:
+    """Lowercased words without stop words and plural 's', roughly Postgres' english config"""
+    terms = []
+    for word in _WORD.findall((text or "").lower()):
+        if len(word) < 2 or word in _STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+class InvertedIndex:
+    """
+    BM25 ranked search over documents held in memory, for databases without full-text search.
+    Every word of a query has to match a document, the last one as a prefix since it may still
+    be typed.
+    Documents can be put in a group (e.g. their profession) to restrict a search to it.
+    """
+
+    def __init__(self):
+        self.postings: dict[str, dict[int, int]] = defaultdict(dict)
+        self.lengths: dict[int, int] = {}
+        self.groups: dict[int, int] = {}
+        self.terms: list[str] = []
+        self.avg_length = 1.0
+
+    def add(self, doc_id: int, text: str | None, weight: int = 1, group: int | None = None) -> None:
+        self.lengths.setdefault(doc_id, 0)
+        if group is not None:
+            self.groups[doc_id] = group
+        for term in tokenize(text):
+            postings = self.postings[term]
+            postings[doc_id] = postings.get(doc_id, 0) + weight
+            self.lengths[doc_id] += weight
+
+    def freeze(self) -> "InvertedIndex":
+        """Call once every document is added"""
+        self.terms = sorted(self.postings)
+        self.avg_length = max(1.0, sum(self.lengths.values()) / max(1, len(self.lengths)))
+        return self
+
+    def _expand(self, term: str, prefix: bool) -> list[str]:
+        if not prefix:
+            return [term] if term in self.postings else []
+        matches = []
+        for candidate in self.terms[bisect_left(self.terms, term):]:
+            if not candidate.startswith(term):
+                break
+            matches.append(candidate)
+        return matches
+
+    def search(self, query: str, group: int | None = None) -> list[tuple[float, int]]:
+        """(score, doc_id) of every matching document, best first"""
+        terms = tokenize(query)
+        scores = None
+        for position, term in enumerate(terms):
+            term_scores = defaultdict(float)
+            for candidate in self._expand(term, prefix=position == len(terms) - 1):
+                postings = self.postings[candidate]
+                documents = len(self.lengths)
+                idf = math.log(1 + (documents - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    if group is not None and self.groups.get(doc_id) != group:
+                        continue
+                    length = self.lengths[doc_id] / self.avg_length
+                    term_scores[doc_id] += idf * frequency * (BM25_K1 + 1) / (
+                        frequency + BM25_K1 * (1 - BM25_B + BM25_B * length)
+                    )
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    doc_id: score + term_scores[doc_id]
+                    for doc_id, score in scores.items()
+                    if doc_id in term_scores
+                }
+            if not scores:
+                return []
+        hits = [(score, doc_id) for doc_id, score in (scores or {}).items()]
+        return sorted(hits, key=lambda hit: (-hit[0], hit[1]))
+
+
+class FallbackIndex:
+    """An InvertedIndex made by `build`, rebuilt when a cache of `namespaces` is invalidated"""
+
+    def __init__(self, namespaces: tuple[str, ...], build):
+        self.namespaces = namespaces
+        self.build = build
+        self.index: InvertedIndex | None = None
+        self.versions = None
+        self.built_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def _is_fresh(self, versions) -> bool:
+        return (
+            self.index is not None
+            and self.versions == versions
+            and time.monotonic() - self.built_at < FALLBACK_MAX_AGE_SECONDS
+        )
+
+    async def get(self) -> InvertedIndex:
+        versions = [await response_cache.version(namespace) for namespace in self.namespaces]
+        if not self._is_fresh(versions):
+            async with self.lock:
+                # Concurrent searches share one rebuild
+                if not self._is_fresh(versions):
+                    self.index = await self.build()
+                    self.versions = versions
+                    self.built_at = time.monotonic()
+        return self.index
+
+
+async def _build_professions_index() -> InvertedIndex:
+    index = InvertedIndex()
+    async for rows in iter_chunks(Professions.all(), ["name", "description"]):
+        for row in rows:
+            index.add(row["id"], row["name"], weight=NAME_WEIGHT)
+            index.add(row["id"], row["description"])
+    return index.freeze()
+
+
+async def _build_workers_index() -> InvertedIndex:
+    index = InvertedIndex()
+    async for rows in iter_chunks(WorkerDetails.all(), ["user_id", "profession_id", "worker_bio"]):
+        for row in rows:
+            index.add(row["user_id"], row["worker_bio"], group=row["profession_id"])
+    return index.freeze()
+
+
+professions_index = FallbackIndex(("professions",), _build_professions_index)
+# Worker bios change when a user switches to professional, which invalidates "professionals"
+workers_index = FallbackIndex(("professionals",), _build_workers_index)
+
+
+def _has_full_text_search() -> bool:
+    return connections.get("default").capabilities.dialect == "postgres"
+
+
+def _in_order(rows: list[dict], hits: list[tuple[float, int]]) -> list[dict]:
+    rows = {row["id"]: row for row in rows}
+    return [{**rows[doc_id], "rank": score} for score, doc_id in hits if doc_id in rows]
+
+
+async def search_professions(query: str, limit: int, offset: int = 0) -> list[dict]:
+    if _has_full_text_search():
+        return await connections.get("default").execute_query_dict(
+            _PROFESSIONS_SQL, [query, limit, offset]
+        )
+    hits = (await professions_index.get()).search(query)[offset : offset + limit]
+    rows = await Professions.filter(id__in=[doc_id for _, doc_id in hits]).values(
+        "id", "name", "description", "estimated_time_hours"
+    )
+    return _in_order(rows, hits)
+
+
+async def search_workers(
+    query: str, limit: int, offset: int = 0, profession_id: int | None = None
+) -> list[dict]:
+    if _has_full_text_search():
+        return await connections.get("default").execute_query_dict(
+            _WORKERS_SQL, [query, limit, offset, profession_id]
+        )
+    hits = (await workers_index.get()).search(query, group=profession_id)[offset : offset + limit]
+    rows = await WorkerDetails.filter(user_id__in=[doc_id for _, doc_id in hits]).values(
+        "user_id",
+        "user__first_name",
+        "user__last_name",
+        "profession_id",
+        "hourly_rate",
+        "avg_rating",
+        "worker_bio",
+    )
+    rows = [
+        {
+            "id": row.pop("user_id"),
+            "first_name": row.pop("user__first_name"),
+            "last_name": row.pop("user__last_name"),
+            **row,
+        }
+        for row in rows
+    ]
+    return _in_order(rows, hits)
+
+
+async def search_works(user_id: int, tags: list[str], limit: int, offset: int = 0) -> list[dict]:
+    """Works booked by or assigned to the user, ranked by how many of `tags` they carry"""
+    if _has_full_text_search():
+        return await connections.get("default").execute_query_dict(
+            _WORKS_SQL, [user_id, tags, limit, offset]
+        )
+    # The works of one user are few, match them here
+    works = await Works.filter(Q(booked_by_id=user_id) | Q(assigned_to_id=user_id)).values(
+        "id",
+        "tags",
+        "user_description",
+        "profession_id",
+        "scheduled_date",
+        "scheduled_time",
+        "status",
+    )
+    wanted = set(tags)
+    ranked = [
+        {**work, "rank": len(wanted.intersection(work["tags"] or ()))} for work in works
+    ]
+    ranked = sorted(
+        (work for work in ranked if work["rank"]), key=lambda work: (-work["rank"], -work["id"])
+    )
+    return ranked[offset : offset + limit]
@@ -0,0 +1,61 @@
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from tortoise import BaseDBAsyncClient
+from app.database.models import WorkerSlots
+
+# Slot length for professions without an estimated time
+DEFAULT_SLOT_HOURS = 1.0
+# Statuses of a work that keep its worker busy
+BUSY_STATUSES = ("pending", "accepted", "started")
+
+
+def slot_bounds(
+    scheduled_date: date, scheduled_time: time, estimated_time_hours: float | None
+) -> tuple[datetime, datetime]:
+    """
+    Start and end of the slot for a work. scheduled_time is in UTC, naive times are taken as UTC.
+    """
+    if scheduled_time.tzinfo is None:
+        scheduled_time = scheduled_time.replace(tzinfo=dt_timezone.utc)
+    starts_at = datetime.combine(scheduled_date, scheduled_time).astimezone(dt_timezone.utc)
+    hours = estimated_time_hours if estimated_time_hours is not None else DEFAULT_SLOT_HOURS
+    return starts_at, starts_at + timedelta(hours=hours)
+
+
+def overlapping(starts_at: datetime, ends_at: datetime):
+    """Slots that overlap [starts_at, ends_at)"""
+    return WorkerSlots.filter(starts_at__lt=ends_at, ends_at__gt=starts_at)
+
+
+async def is_busy(
+    worker_id: int,
+    starts_at: datetime,
+    ends_at: datetime,
+    using_db: BaseDBAsyncClient | None = None,
+) -> bool:
+    return (
+        await overlapping(starts_at, ends_at)
+        .filter(worker_id=worker_id)
+        .using_db(using_db)
+        .exists()
+    )
+
+
+async def busy_intervals(
+    worker_ids, starts_at: datetime, ends_at: datetime
+) -> dict[int, list[tuple[datetime, datetime]]]:
+    """Busy intervals per worker within [starts_at, ends_at), in one query"""
+    intervals: dict[int, list] = {}
+    for worker_id, slot_start, slot_end in await overlapping(starts_at, ends_at).filter(
+        worker_id__in=set(worker_ids)
+    ).order_by("starts_at").values_list("worker_id", "starts_at", "ends_at"):
+        intervals.setdefault(worker_id, []).append((slot_start, slot_end))
+    return intervals
+
+
+def conflicts(intervals: list[tuple[datetime, datetime]], starts_at: datetime, ends_at: datetime) -> bool:
+    return any(slot_start < ends_at and starts_at < slot_end for slot_start, slot_end in intervals)
+
+
+async def release(work_id: int, using_db: BaseDBAsyncClient | None = None) -> None:
+    """Free the slot of a work that will not happen (cancelled, rejected or expired)"""
+    await WorkerSlots.filter(work_id=work_id).using_db(using_db).delete()
@@ -0,0 +1,129 @@
+import csv
+import io
+import json
+from datetime import date, datetime, time
+from tortoise.queryset import QuerySet
+
+# Rows fetched from the database per round trip when exporting
+EXPORT_CHUNK_SIZE = 5000
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+async def iter_chunks(queryset: QuerySet, fields: list[str], chunk_size: int = EXPORT_CHUNK_SIZE):
+    """
+    Yield the rows of `queryset` as lists of dicts, fetched with keyset pagination on the primary key.
+    Only one chunk is held in memory and every chunk is an index range scan, however deep into the table.
+    """
+    last_id = None
+    while True:
+        chunk = queryset.order_by("id").limit(chunk_size)
+        if last_id is not None:
+            chunk = chunk.filter(id__gt=last_id)
+        rows = await chunk.values("id", *[field for field in fields if field != "id"])
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1]["id"]
+
+
+async def iter_rows(queryset: QuerySet, fields: list[str], chunk_size: int = EXPORT_CHUNK_SIZE):
+    async for rows in iter_chunks(queryset, fields, chunk_size):
+        for row in rows:
+            yield row
+
+
+async def to_ndjson(rows, fields: list[str]):
+    async for row in rows:
+        yield json.dumps({field: row[field] for field in fields}, default=_json_default) + "\n"
+
+
+async def to_json_array(rows, fields: list[str]):
+    separator = "["
+    async for row in rows:
+        yield separator + json.dumps({field: row[field] for field in fields}, default=_json_default)
+        separator = ","
+    yield "[]" if separator == "[" else "]"
+
+
+async def to_csv(rows, fields: list[str]):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    async for row in rows:
+        writer.writerow([row[field] for field in fields])
+        # Flush roughly every 64KB instead of once per row
+        if buffer.tell() > 65536:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+formatters = {
+    "json": (to_json_array, "application/json"),
+    "ndjson": (to_ndjson, "application/x-ndjson"),
+    "csv": (to_csv, "text/csv"),
+}
+
+
+async def iter_lines(chunks):
+    """Split a stream of byte chunks (e.g. a request body) into decoded lines without reading it whole"""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode().rstrip("\r")
+    if pending:
+        yield pending.decode().rstrip("\r")
+
+
+async def read_ndjson(chunks):
+    """Yield (line number, dict) for every non empty line"""
+    line_number = 0
+    async for line in iter_lines(chunks):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"line {line_number}: {e}") from None
+        yield line_number, row
+
+
+async def read_csv(chunks):
+    """
+    Yield (line number, dict) for every record, keyed by the header row. Empty values become None.
+    Quoted values may span lines: a record is complete once it holds an even number of quotes.
+    """
+    header = None
+    record, line_number, record_start = "", 0, 1
+    async for line in iter_lines(chunks):
+        line_number += 1
+        record = line if not record else record + "\n" + line
+        if record.count('"') % 2:
+            continue
+        values = next(csv.reader([record]), [])
+        record, start = "", record_start
+        record_start = line_number + 1
+        if not values:
+            continue
+        if header is None:
+            header = values
+            continue
+        yield start, {key: value or None for key, value in zip(header, values)}
+    if record:
+        raise ValueError(f"line {record_start}: unterminated quoted value")
+
+
+readers = {
+    "ndjson": read_ndjson,
+    "csv": read_csv,
+}
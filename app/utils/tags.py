@@ -0,0 +1,146 @@
+from collections import Counter
+from tortoise import BaseDBAsyncClient, connections, timezone
+from tortoise.functions import Sum
+from tortoise.transactions import in_transaction
+from app.database.models import TagStats, WorkerTagStats, Works
+from app.utils.rollups import UNKNOWN_CITY, get_cities
+from app.utils.streaming import iter_chunks
+
+# Longer tags are not counted, they are free text rather than tags
+MAX_TAG_LENGTH = 50
+DEFAULT_POPULAR_TAGS = 10
+MAX_POPULAR_TAGS = 50
+
+_UPSERT_SQL = """
+INSERT INTO "{table}" ({keys}, "tag", "count", "modified_at")
+VALUES {rows}
+ON CONFLICT ({keys}, "tag") DO UPDATE
+SET "count" = "{table}"."count" + excluded."count", "modified_at" = excluded."modified_at"
+"""
+
+
+def normalize_tags(tags) -> list[str]:
+    """Lowercased, stripped and unique tags of a work, sorted. Empty and long tags are dropped."""
+    return sorted(
+        {
+            tag.strip().lower()
+            for tag in tags or ()
+            if tag and tag.strip() and len(tag.strip()) <= MAX_TAG_LENGTH
+        }
+    )
+
+
+async def _increment(
+    conn: BaseDBAsyncClient, table: str, keys: dict, tags: list[str], now
+) -> None:
+    """Add one to the count of every tag of `tags` in the rows of `table` identified by `keys`"""
+    values = []
+    rows = []
+    for tag in tags:
+        row = [*keys.values(), tag, 1, now]
+        if conn.capabilities.dialect == "postgres":
+            first = len(values) + 1
+            placeholders = [f"${index}" for index in range(first, first + len(row))]
+        else:
+            placeholders = ["?"] * len(row)
+        rows.append(f"({', '.join(placeholders)})")
+        values += row
+    sql = _UPSERT_SQL.format(
+        table=table, keys=", ".join(f'"{key}"' for key in keys), rows=", ".join(rows)
+    )
+    await conn.execute_query(sql, values)
+
+
+async def record_tags(
+    profession_id: int,
+    city: str,
+    worker_id: int,
+    tags,
+    using_db: BaseDBAsyncClient | None = None,
+) -> None:
+    """
+    Count the tags of a booked work, per profession and city of the client and per worker.
+    One atomic upsert per table, so concurrent bookings never lose a count.
+    """
+    tags = normalize_tags(tags)
+    if not tags:
+        return
+    conn = using_db or connections.get("default")
+    now = timezone.now()
+    await _increment(conn, "tagstats", {"profession_id": profession_id, "city": city}, tags, now)
+    await _increment(conn, "workertagstats", {"worker_id": worker_id}, tags, now)
+
+
+async def popular_tags(
+    profession_id: int | None = None,
+    city: str | None = None,
+    prefix: str | None = None,
+    limit: int = DEFAULT_POPULAR_TAGS,
+) -> list[dict]:
+    """Most used tags first, optionally only of a profession, a city and starting with `prefix`"""
+    rows = TagStats.all()
+    if profession_id is not None:
+        rows = rows.filter(profession_id=profession_id)
+    if city is not None:
+        rows = rows.filter(city=city)
+    if prefix:
+        rows = rows.filter(tag__startswith=prefix.strip().lower())
+    return (
+        await rows.annotate(total=Sum("count"))
+        .group_by("tag")
+        .order_by("-total", "tag")
+        .limit(limit)
+        .values("tag", "total")
+    )
+
+
+async def worker_tag_counts(worker_ids, tags) -> dict[int, dict[str, int]]:
+    """Per worker, how often each of `tags` was given to their works"""
+    counts = {}
+    for worker_id, tag, count in await WorkerTagStats.filter(
+        worker_id__in=list(worker_ids), tag__in=normalize_tags(tags)
+    ).values_list("worker_id", "tag", "count"):
+        counts.setdefault(worker_id, {})[tag] = count
+    return counts
+
+
+async def rebuild_tag_stats() -> int:
+    """
+    Recompute every tag count from Works, e.g. after a manual change in the database.
+    The table is read in chunks, only the counts are kept in memory. Returns the row count.
+    """
+    totals = Counter()
+    worker_totals = Counter()
+    async for works in iter_chunks(
+        Works.all(), ["profession_id", "booked_by_id", "assigned_to_id", "tags"]
+    ):
+        cities = await get_cities(work["booked_by_id"] for work in works)
+        for work in works:
+            city = cities.get(work["booked_by_id"], UNKNOWN_CITY)
+            for tag in normalize_tags(work["tags"]):
+                totals[(work["profession_id"], city, tag)] += 1
+                worker_totals[(work["assigned_to_id"], tag)] += 1
+
+    now = timezone.now()
+    async with in_transaction() as conn:
+        await TagStats.all().using_db(conn).delete()
+        await WorkerTagStats.all().using_db(conn).delete()
+        await TagStats.bulk_create(
+            [
+                TagStats(
+                    profession_id=profession_id, city=city, tag=tag, count=count, modified_at=now
+                )
+                for (profession_id, city, tag), count in totals.items()
+            ],
+            batch_size=1000,
+            using_db=conn,
+        )
+        await WorkerTagStats.bulk_create(
+            [
+                WorkerTagStats(worker_id=worker_id, tag=tag, count=count, modified_at=now)
+                for (worker_id, tag), count in worker_totals.items()
+            ],
+            batch_size=1000,
+            using_db=conn,
+        )
+    return len(totals) + len(worker_totals)
@@ -0,0 +1,70 @@
+import asyncio
+from app.utils.logger import msg_logger
+from app.utils.recommend import get_model
+from app.utils.pool import compute_pool
+
+# Heavy components that are loaded after the server starts accepting connections
+components = {
+    "pandas": False,
+    "geopy": False,
+}
+if not compute_pool.enabled:
+    # Otherwise predictions run in the compute pool workers, which load their own copy of the model
+    components["recommendation_model"] = False
+_warm_up_task: asyncio.Task | None = None
+_background_tasks: set = set()
+
+
+def _load_pandas():
+    import pandas  # noqa: F401
+
+
+def _load_geopy():
+    from geopy.distance import geodesic  # noqa: F401
+
+
+_loaders = {
+    "pandas": _load_pandas,
+    "geopy": _load_geopy,
+}
+if not compute_pool.enabled:
+    _loaders["recommendation_model"] = get_model
+
+
+def warm_up() -> None:
+    """Load every heavy component. Blocking, run it in a thread."""
+    for name, loader in _loaders.items():
+        try:
+            loader()
+        except Exception as e:
+            msg_logger("Warm up: failed to load %s: %s", 40, name, e)
+            continue
+        components[name] = True
+
+
+def start_warm_up() -> None:
+    """Schedule the warm up on a worker thread so startup is not blocked by it"""
+    global _warm_up_task
+    if _warm_up_task is None:
+        _warm_up_task = asyncio.get_running_loop().create_task(asyncio.to_thread(warm_up))
+
+
+def start_background(name: str, coroutine_function) -> None:
+    """Run an async warm up step (e.g. filling a cache from the database) as its own readiness component"""
+    components[name] = False
+
+    async def run():
+        try:
+            await coroutine_function()
+        except Exception as e:
+            msg_logger("Warm up: %s failed: %s", 40, name, e)
+            return
+        components[name] = True
+
+    task = asyncio.get_running_loop().create_task(run())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def is_warm() -> bool:
+    return all(components.values())
@@ -0,0 +1,118 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+import weakref
+from app.utils.logger import msg_logger
+from app.utils.metrics import Counter, Histogram
+
+# A callback that holds the event loop for longer than this is reported, 0 turns the watchdog off
+SLOW_CALLBACK_SECONDS = float(os.environ.get("LOOP_WATCHDOG_MS", 100)) / 1000
+HEARTBEAT_SECONDS = 0.02
+# Innermost frames of the blocked stack that are logged
+STACK_LIMIT = 30
+
+slow_callbacks_total = Counter(
+    "slow_callbacks_total", "Callbacks that blocked the event loop past the threshold", ("route",)
+)
+event_loop_blocked_seconds = Histogram(
+    "event_loop_blocked_seconds", "How long slow callbacks blocked the event loop", ("route",)
+)
+
+
+class LoopWatchdog:
+    """
+    Finds code that blocks the event loop (CPU work or blocking calls in async handlers).
+
+    A heartbeat on the loop records when the loop last got to run callbacks. A thread checks it,
+    and when the loop has been stuck for longer than the threshold it logs the loop thread's stack
+    and the request being served at that moment, once per stall. The stall is counted per route
+    and its duration observed when the loop catches up.
+    """
+
+    def __init__(self):
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.loop_thread_id: int | None = None
+        self.last_beat = 0.0
+        self.stalled_route: str | None = None
+        # Request task -> (scope, request id), registered by the instrumentation middleware
+        self.requests: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self.stop_event = threading.Event()
+        self.thread: threading.Thread | None = None
+        self.heartbeat: asyncio.TimerHandle | None = None
+
+    def track(self, scope: dict, request_id: str | None) -> None:
+        """Remember which request the current task serves"""
+        if self.thread is None:
+            return
+        task = asyncio.current_task()
+        if task is not None:
+            self.requests[task] = (scope, request_id)
+
+    def _beat(self) -> None:
+        now = time.monotonic()
+        stalled_route, self.stalled_route = self.stalled_route, None
+        if stalled_route is not None:
+            blocked_for = now - self.last_beat - HEARTBEAT_SECONDS
+            event_loop_blocked_seconds.observe(blocked_for, stalled_route)
+        self.last_beat = now
+        self.heartbeat = self.loop.call_later(HEARTBEAT_SECONDS, self._beat)
+
+    def _blocked_request(self) -> tuple[str, str | None]:
+        task = asyncio.current_task(self.loop)
+        if task is None:
+            return "callback", None
+        request = self.requests.get(task)
+        if request is None:
+            return f"task:{task.get_name()}", None
+        scope, request_id = request
+        route = scope.get("route")
+        return f"{scope['method']} {getattr(route, 'path', None) or scope['path']}", request_id
+
+    def _watch(self) -> None:
+        reported_beat = None
+        while not self.stop_event.wait(HEARTBEAT_SECONDS):
+            last_beat = self.last_beat
+            blocked_for = time.monotonic() - last_beat - HEARTBEAT_SECONDS
+            if blocked_for < SLOW_CALLBACK_SECONDS or last_beat == reported_beat:
+                continue
+            reported_beat = last_beat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT)) if frame else ""
+            route, request_id = self._blocked_request()
+            self.stalled_route = route
+            slow_callbacks_total.inc(route)
+            msg_logger(
+                "Event loop blocked for over %.0f ms by %s",
+                30,
+                blocked_for * 1000,
+                route,
+                blocked_request_id=request_id,
+                stack=stack,
+            )
+
+    def start(self) -> None:
+        """Call from the event loop thread"""
+        if self.thread is not None or SLOW_CALLBACK_SECONDS <= 0:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.stop_event.clear()
+        self._beat()
+        self.thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        if self.heartbeat is not None:
+            self.heartbeat.cancel()
+            self.heartbeat = None
+
+
+watchdog = LoopWatchdog()
@@ -0,0 +1,102 @@
+from datetime import date
+from tortoise import BaseDBAsyncClient
+from app.utils import outbox, rollups, tags
+from app.utils.cache import response_cache
+from app.utils.events import broker
+from app.utils.score import refresh_worker_ranking
+
+# Side effects of work and review writes. Routes only emit() inside the outbox.transaction() of
+# the write, the handlers below run later from the outbox dispatcher, in emit order.
+
+
+async def emit_work(
+    work, topic: str, using_db: BaseDBAsyncClient | None = None, **changes
+) -> None:
+    """Record a transition of `work`, e.g. emit_work(work, "work.accepted", conn, status="accepted")"""
+    await outbox.emit(
+        topic,
+        {
+            "work_id": work.id,
+            "booked_by_id": work.booked_by_id,
+            "assigned_to_id": work.assigned_to_id,
+            "profession_id": work.profession_id,
+            "final_cost": work.final_cost,
+            "tags": work.tags,
+            "changes": changes,
+        },
+        using_db=using_db,
+    )
+
+
+@outbox.handles("work.*")
+async def notify_parties(event: dict, conn: BaseDBAsyncClient) -> None:
+    payload = event["payload"]
+    await broker.publish(
+        [payload["booked_by_id"], payload["assigned_to_id"]],
+        {"type": event["topic"], "work_id": payload["work_id"], **payload["changes"]},
+        using_db=conn,
+    )
+
+
+async def _record_rollup(event: dict, conn: BaseDBAsyncClient, day=None, **deltas) -> None:
+    payload = event["payload"]
+    await rollups.record(
+        payload["profession_id"],
+        await rollups.get_city(payload["booked_by_id"]),
+        day or event["created_at"].date(),
+        using_db=conn,
+        **deltas,
+    )
+
+
+@outbox.handles("work.booked")
+async def count_booking(event: dict, conn: BaseDBAsyncClient) -> None:
+    await _record_rollup(event, conn, bookings=1)
+
+
+@outbox.handles("work.booked")
+async def count_tags(event: dict, conn: BaseDBAsyncClient) -> None:
+    payload = event["payload"]
+    await tags.record_tags(
+        payload["profession_id"],
+        await rollups.get_city(payload["booked_by_id"]),
+        payload["assigned_to_id"],
+        payload.get("tags"),
+        using_db=conn,
+    )
+
+
+@outbox.handles("work.cancelled")
+async def count_cancellation(event: dict, conn: BaseDBAsyncClient) -> None:
+    await _record_rollup(event, conn, cancellations=1)
+
+
+@outbox.handles("work.payment_*")
+async def count_revenue(event: dict, conn: BaseDBAsyncClient) -> None:
+    if event["payload"]["changes"].get("status") == "closed":
+        await _record_rollup(event, conn, revenue=event["payload"]["final_cost"])
+
+
+@outbox.handles("review.created")
+async def count_rating(event: dict, conn: BaseDBAsyncClient) -> None:
+    await _record_rollup(event, conn, rating_sum=event["payload"]["changes"]["rating"], rating_count=1)
+
+
+@outbox.handles("review.updated")
+async def adjust_rating(event: dict, conn: BaseDBAsyncClient) -> None:
+    changes = event["payload"]["changes"]
+    # The rating stays in the rollup of the day it was first given
+    await _record_rollup(
+        event,
+        conn,
+        day=date.fromisoformat(changes["reviewed_on"]),
+        rating_sum=changes["rating"] - changes["previous_rating"],
+    )
+
+
+@outbox.handles("review.*")
+async def refresh_worker(event: dict, conn: BaseDBAsyncClient) -> None:
+    # In the drain transaction, so the ranking row follows the handled review exactly once
+    await refresh_worker_ranking(event["payload"]["assigned_to_id"], using_db=conn)
+    # Workers are listed with their average rating
+    await response_cache.invalidate("professionals")
@@ -0,0 +1,60 @@
+"""
+Title: Benchmark helpers
+File: /benchmarks/common.py
+Description: Shared setup for the benchmark scripts. Runs the app in-process against a throwaway
+SQLite database unless DB_URL is already set.
+Author: github.com/pzerone
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # model.bin is loaded relative to the repository root
+
+BENCH_ENV = {
+    "DB_URL": "sqlite://" + os.path.join(tempfile.gettempdir(), "neighbourpro_bench.sqlite3"),
+    "JWT_SECRET": "bench-secret",
+    "JWT_REFRESH_SECRET": "bench-refresh-secret",
+    "JWT_ALGORITHM": "HS256",
+    "JWT_AT_EXPIRE_MINUTES": "60",
+    "JWT_RT_EXPIRE_MINUTES": "600",
+    "DISTANCE_WEIGHT": "0.4",
+    "RATING_WEIGHT": "0.3",
+    "REVIEW_COUNT_WEIGHT": "0.2",
+    "COST_WEIGHT": "0.1",
+    # Traces replay a handful of users, the limiter would reject most of their requests
+    "RATE_LIMIT_URL": "off",
+}
+for key, value in BENCH_ENV.items():
+    os.environ.setdefault(key, value)
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile, values need not be sorted"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def init_db(reset: bool = True) -> None:
+    from tortoise import Tortoise
+    from app.database.settings import TORTOISE_ORM
+
+    db_url = os.environ["DB_URL"]
+    if reset and db_url.startswith("sqlite://"):
+        path = db_url[len("sqlite://"):]
+        if os.path.exists(path):
+            os.remove(path)
+    await Tortoise.init(config=TORTOISE_ORM)
+    await Tortoise.generate_schemas(safe=True)
+
+
+def asgi_client(app):
+    import httpx
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
@@ -0,0 +1,184 @@
+"""
+Title: Event stream benchmark
+File: /benchmarks/event_stream.py
+Description: Opens many concurrent /work/events streams against a real uvicorn server, then books works
+for the subscribed workers and measures how long the events take to arrive and how much memory
+the open connections cost the server.
+Author: github.com/pzerone
+
+Usage:
+    python benchmarks/event_stream.py [--connections 500] [--events 100] [--server-workers 1]
+
+With more than one server worker, events cross processes through Postgres LISTEN/NOTIFY, so set DB_URL
+to a Postgres database (whose tables exist) in that case.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import subprocess
+import sys
+import time
+
+import common  # noqa: F401  sets up env and sys.path
+from common import ROOT, init_db, percentile
+from seed import seed
+
+
+def rss_kb(pid: int) -> int:
+    """Resident memory of a process and its children (uvicorn workers), Linux only"""
+    total = 0
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as children:
+            pids += [int(child) for child in children.read().split()]
+    except OSError:
+        pass
+    for current in pids:
+        try:
+            with open(f"/proc/{current}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total
+
+
+async def wait_until_up(client, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get("/healthz")).status_code == 200:
+                return
+        except Exception:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("server did not start")
+        await asyncio.sleep(0.2)
+
+
+async def subscribe(client, token: str, worker_id: int, opened: asyncio.Event, received: dict, stop: asyncio.Event):
+    async with client.stream(
+        "GET", "/work/events", headers={"Authorization": f"Bearer {token}"}
+    ) as response:
+        response.raise_for_status()
+        opened.set()
+        async for line in response.aiter_lines():
+            if line.startswith("data:"):
+                event = json.loads(line[len("data:"):])
+                if event["type"] == "work.booked":
+                    received[worker_id] = time.perf_counter()
+            if stop.is_set():
+                return
+
+
+async def run(args) -> None:
+    import httpx
+    from tortoise import Tortoise
+    from app.database.models import Users, WorkerDetails
+    from app.dependencies import TokenData, create_access_token
+
+    await init_db(reset=True)
+    await seed(users=50, workers=args.connections, professions=10, works=0)
+    workers = await WorkerDetails.all().order_by("user_id").limit(args.connections).values(
+        "user_id", "profession_id"
+    )
+    accounts = {
+        account["id"]: account
+        for account in await Users.filter(
+            id__in=[worker["user_id"] for worker in workers]
+        ).values("id", "username", "email", "role")
+    }
+    client_account = await Users.filter(role="user", user__isnull=False).first().values(
+        "id", "username", "email", "role"
+    )
+    await Tortoise.close_connections()
+
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--port", str(args.port), "--workers", str(args.server_workers), "--log-level", "warning",
+        ],
+        cwd=ROOT,
+        env={**os.environ, "LOG_LEVEL": "WARNING"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    limits = httpx.Limits(max_connections=args.connections + 20, max_keepalive_connections=20)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{args.port}", timeout=None, limits=limits
+        ) as client:
+            await wait_until_up(client)
+            await asyncio.sleep(1)
+            idle_rss = rss_kb(server.pid)
+
+            received: dict[int, float] = {}
+            stop = asyncio.Event()
+            tasks = []
+            open_start = time.perf_counter()
+            for worker in workers:
+                opened = asyncio.Event()
+                token = create_access_token(TokenData(**accounts[worker["user_id"]]))
+                tasks.append(
+                    asyncio.create_task(
+                        subscribe(client, token, worker["user_id"], opened, received, stop)
+                    )
+                )
+                await opened.wait()
+            open_seconds = time.perf_counter() - open_start
+            open_rss = rss_kb(server.pid)
+
+            headers = {"Authorization": f"Bearer {create_access_token(TokenData(**client_account))}"}
+            scheduled_date = str(datetime.date.today() + datetime.timedelta(days=60))
+            sent: dict[int, float] = {}
+            for worker in workers[: args.events]:
+                sent[worker["user_id"]] = time.perf_counter()
+                response = await client.post(
+                    "/work/book-a-work",
+                    headers=headers,
+                    json={
+                        "tags": None,
+                        "user_description": "event stream benchmark",
+                        "profession_id": worker["profession_id"],
+                        "scheduled_date": scheduled_date,
+                        "scheduled_time": "10:00:00",
+                        "assigned_to_id": worker["user_id"],
+                    },
+                )
+                response.raise_for_status()
+            deadline = time.monotonic() + 10
+            while len(received) < len(sent) and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+
+            stop.set()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = [(received[worker_id] - start) * 1000 for worker_id, start in sent.items() if worker_id in received]
+    print(f"{len(workers)} streams opened in {open_seconds:.2f} s")
+    print(
+        f"server RSS: {idle_rss / 1024:.1f} MB idle, {open_rss / 1024:.1f} MB with streams open "
+        f"({(open_rss - idle_rss) / max(1, len(workers)):.1f} KB per stream)"
+    )
+    print(
+        f"events delivered: {len(latencies)}/{len(sent)}, latency from booking request "
+        f"p50 {percentile(latencies, 50):.1f} ms, p95 {percentile(latencies, 95):.1f} ms, "
+        f"p99 {percentile(latencies, 99):.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=500)
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--server-workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8799)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,126 @@
+"""
+Title: Logging overhead benchmark
+File: /benchmarks/logging_overhead.py
+Description: Measures the cost of msg_logger on the calling thread, and of logging on the /auth/login path.
+Author: github.com/pzerone
+
+Usage:
+    python benchmarks/logging_overhead.py [--calls 100000] [--logins 50]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+import common  # noqa: F401  sets up env and sys.path
+from common import asgi_client, init_db, percentile
+
+
+def bench_calls(calls: int) -> None:
+    from app.utils.logger import console_logger, console_handler, msg_logger
+
+    # Both pipelines write to a real file descriptor so the synchronous one pays for its syscalls,
+    # but the terminal does not skew the numbers
+    devnull = open(os.devnull, "w")
+    console_handler.setStream(devnull)
+
+    sync_logger = logging.getLogger("bench_sync_logger")
+    sync_logger.propagate = False
+    sync_handler = logging.StreamHandler(devnull)
+    sync_handler.setFormatter(logging.Formatter("%(levelname)-10s%(message)s"))
+    sync_logger.addHandler(sync_handler)
+    sync_logger.setLevel(logging.DEBUG)
+
+    username = "bench_user"
+    cases = {
+        "sync StreamHandler + f-string": lambda: sync_logger.log(
+            20, f"Login Successful: {username} logged in successfully."
+        ),
+        "queue pipeline": lambda: msg_logger(
+            "Login Successful: %s logged in successfully.", 20, username
+        ),
+        "queue pipeline, level filtered": lambda: msg_logger(
+            "Login Successful: %s logged in successfully.", 10, username
+        ),
+    }
+    previous_level = console_logger.level
+    console_logger.setLevel(logging.INFO)
+    try:
+        for name, call in cases.items():
+            _time_calls(name, call, calls)
+
+        # A stalled stderr pipe (e.g. a busy log driver) blocks the synchronous handler on the caller
+        slow_sink = SlowStream(delay=0.001)
+        sync_handler.setStream(slow_sink)
+        console_handler.setStream(slow_sink)
+        slow_calls = max(1, calls // 200)
+        _time_calls("sync, 1 ms sink", cases["sync StreamHandler + f-string"], slow_calls)
+        _time_calls("queue pipeline, 1 ms sink", cases["queue pipeline"], slow_calls)
+        console_handler.setStream(devnull)
+    finally:
+        console_logger.setLevel(previous_level)
+
+
+class SlowStream:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def write(self, text: str) -> None:
+        time.sleep(self.delay)
+
+    def flush(self) -> None:
+        pass
+
+
+def _time_calls(name: str, call, calls: int) -> None:
+    start = time.perf_counter()
+    for _ in range(calls):
+        call()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<34} {elapsed / calls * 1e6:8.2f} us/call on the caller")
+
+
+async def bench_login(logins: int) -> None:
+    from tortoise import Tortoise, timezone
+    from app.main import app
+    from app.database.models import Users
+    from app.dependencies import get_hashed_password
+    from app.utils.logger import console_logger
+
+    await init_db()
+    await Users.create(
+        username="bench_user",
+        first_name="Bench",
+        email="bench@example.com",
+        password=get_hashed_password("benchpass1"),
+        created_at=timezone.now(),
+        modified_at=timezone.now(),
+    )
+
+    async with asgi_client(app) as client:
+        for label, level in (("login, logging on", logging.INFO), ("login, logging off", logging.WARNING)):
+            console_logger.setLevel(level)
+            timings = []
+            for _ in range(logins):
+                start = time.perf_counter()
+                response = await client.post(
+                    "/auth/login", data={"username": "bench_user", "password": "benchpass1"}
+                )
+                timings.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.text
+            print(
+                f"{label:<34} p50 {percentile(timings, 50) * 1000:7.2f} ms"
+                f"  p95 {percentile(timings, 95) * 1000:7.2f} ms"
+            )
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=100_000)
+    parser.add_argument("--logins", type=int, default=50)
+    args = parser.parse_args()
+    bench_calls(args.calls)
+    asyncio.run(bench_login(args.logins))
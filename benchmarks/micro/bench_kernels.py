@@ -0,0 +1,180 @@
+"""
+Title: Scoring and recommendation kernel benchmarks
+File: /benchmarks/micro/bench_kernels.py
+Description: pytest-benchmark suite for the scoring and recommender hot paths at 10/1k/100k candidates.
+Author: github.com/pzerone
+
+Usage:
+    cd benchmarks/micro && pytest [--bench-slow] [--benchmark-compare]
+
+Results are saved under benchmarks/micro/.benchmarks for comparison between runs.
+"""
+
+import random
+from collections import namedtuple
+from types import SimpleNamespace
+
+import pytest
+from conftest import SCALES
+
+Prediction = namedtuple("Prediction", ["uid", "iid", "r_ui", "est", "details"])
+USER_CORDS = (9.9312, 76.2673)
+
+
+class SyntheticModel:
+    """Stands in for the pickled recommender, with a deterministic and cheap predict()"""
+
+    def predict(self, uid, iid):
+        return Prediction(uid, iid, None, ((uid * 7919 + iid * 104729) % 1000) / 1000, {})
+
+
+def make_candidates(count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    return [
+        SimpleNamespace(
+            worker_id=index,
+            latitude=USER_CORDS[0] + rng.uniform(-0.5, 0.5),
+            longitude=USER_CORDS[1] + rng.uniform(-0.5, 0.5),
+            avg_rating=rng.uniform(0, 5),
+            review_count=rng.randint(0, 200),
+            hourly_rate=rng.uniform(200, 1500),
+            base_score=rng.uniform(0, 3),
+        )
+        for index in range(count)
+    ]
+
+
+def make_history(cells: int, seed: int = 1) -> tuple[list, list, list]:
+    """Booking history for a users x professions grid with roughly `cells` cells"""
+    rng = random.Random(seed)
+    profession_ids = list(range(1, max(2, int(cells**0.5 / 4)) + 1))
+    user_ids = list(range(1, cells // len(profession_ids) + 1))
+    history = [
+        {"booked_by_id": rng.choice(user_ids), "profession_id": rng.choice(profession_ids)}
+        for _ in range(max(1, cells // 10))
+    ]
+    return history, profession_ids, user_ids
+
+
+@pytest.mark.parametrize("scale", SCALES)
+def bench_calculate_score(benchmark, scale):
+    from app.utils.score import calculate_score, weights
+
+    benchmark.group = f"calculate_score[{scale}]"
+    candidates = make_candidates(scale)
+
+    def run():
+        for candidate in candidates:
+            calculate_score(
+                1.5,
+                candidate.avg_rating,
+                candidate.review_count,
+                candidate.hourly_rate,
+                800.0,
+                weights,
+            )
+
+    benchmark(run)
+
+
+@pytest.mark.parametrize("scale", SCALES)
+def bench_calulate_distane_in_km(benchmark, scale):
+    from app.utils.score import calulate_distane_in_km
+
+    benchmark.group = f"calulate_distane_in_km[{scale}]"
+    candidates = make_candidates(scale)
+
+    def run():
+        for candidate in candidates:
+            calulate_distane_in_km(USER_CORDS, (candidate.latitude, candidate.longitude))
+
+    benchmark.pedantic(run, rounds=3 if scale >= 100_000 else 10, iterations=1)
+
+
+@pytest.mark.parametrize("scale", SCALES)
+def bench_sort_workers_by_score(benchmark, scale):
+    from app.utils.score import sort_workers_by_score
+
+    benchmark.group = f"sort_workers_by_score[{scale}]"
+    candidates = make_candidates(scale)
+    benchmark.pedantic(
+        sort_workers_by_score,
+        args=(candidates, USER_CORDS),
+        kwargs={"limit": 20},
+        rounds=3 if scale >= 100_000 else 10,
+        iterations=1,
+    )
+
+
+@pytest.mark.parametrize("scale", SCALES)
+def bench_get_top_n_recommendations(benchmark, monkeypatch, scale):
+    import pandas as pd
+    from app.utils import recommend
+
+    benchmark.group = f"get_top_n_recommendations[{scale}]"
+    monkeypatch.setattr(recommend, "_model", SyntheticModel())
+    rng = random.Random(1)
+    # `scale` distinct professions, a handful of them already booked by the user
+    history = pd.DataFrame(
+        {
+            "booked_by_id": [1 if index % 50 == 0 else rng.randint(2, 1000) for index in range(scale)],
+            "profession_id": list(range(scale)),
+        }
+    )
+    benchmark(recommend.get_top_n_recommendations, history, 1, 5)
+
+
+@pytest.mark.parametrize("scale", SCALES)
+def bench_dict_to_pd_df(benchmark, monkeypatch, tmp_path, bench_slow, scale):
+    from app.utils import recommend
+
+    if scale >= 100_000 and not bench_slow:
+        pytest.skip("quadratic in the current implementation, run with --bench-slow")
+    benchmark.group = f"dict_to_pd_df[{scale}]"
+    monkeypatch.chdir(tmp_path)  # dict_to_pd_df writes a CSV into the working directory
+    history, profession_ids, user_ids = make_history(scale)
+    benchmark.pedantic(
+        recommend.dict_to_pd_df,
+        args=(history, profession_ids, user_ids),
+        rounds=3 if scale >= 1_000 else 10,
+        iterations=1,
+    )
+
+
+def make_svdpp(users: int, items: int, factors: int = 20, seed: int = 1) -> SimpleNamespace:
+    """Fitted SVDpp lookalike with the attributes `export_factors` reads"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    ratings = {
+        inner: [(int(item), 1.0) for item in rng.choice(items, size=min(3, items), replace=False)]
+        for inner in range(users)
+    }
+    trainset = SimpleNamespace(
+        _raw2inner_id_users={raw * 3: inner for inner, raw in enumerate(rng.permutation(users))},
+        _raw2inner_id_items={raw + 1: raw for raw in range(items)},
+        ur=ratings,
+        global_mean=0.5,
+        rating_scale=(0, 1),
+    )
+    return SimpleNamespace(
+        trainset=trainset,
+        bu=rng.normal(0, 0.1, users),
+        bi=rng.normal(0, 0.1, items),
+        pu=rng.normal(0, 0.1, (users, factors)),
+        qi=rng.normal(0, 0.1, (items, factors)),
+        yj=rng.normal(0, 0.1, (items, factors)),
+    )
+
+
+@pytest.mark.parametrize("scale", SCALES)
+def bench_factor_model_predict(benchmark, tmp_path, scale):
+    from app.utils.factors import FactorModel, export_factors
+
+    benchmark.group = f"factor_model_predict[{scale}]"
+    path = str(tmp_path / "model_factors")
+    export_factors(make_svdpp(scale, 50), path)
+    model = FactorModel(path)
+    rng = random.Random(1)
+    pairs = [(rng.randrange(scale) * 3, rng.randint(1, 50)) for _ in range(1_000)]
+    benchmark(lambda: [model.predict(user_id, item_id) for user_id, item_id in pairs])
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import common  # noqa: E402,F401  sets up env and sys.path for the app imports
+
+SCALES = (10, 1_000, 100_000)
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--bench-slow",
+        action="store_true",
+        help="also run kernels at scales where the current implementation takes minutes",
+    )
+
+
+@pytest.fixture
+def bench_slow(request) -> bool:
+    return request.config.getoption("--bench-slow")
@@ -0,0 +1,223 @@
+"""
+Title: Trace replay load test
+File: /benchmarks/replay.py
+Description: Replays a request trace against the ASGI app in-process and reports throughput and latency per route.
+Author: github.com/pzerone
+
+Trace files are JSON lines with:
+- method, path: path may contain {profession_id}, {worker_id}, {user_id}, {work_id} placeholders
+- auth: null, "user", "worker" or "admin"
+- params / json / form (optional): request data, string values may contain {username} and {password}
+- weight (optional): how many times the line is issued per pass, defaults to 1
+
+Usage:
+    python benchmarks/replay.py [--trace benchmarks/traces/default.jsonl] [--concurrency 10] [--repeat 5]
+                                [--no-seed] [--output results.json] [--baseline results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import common  # noqa: F401  sets up env and sys.path
+from common import asgi_client, init_db, percentile
+
+DEFAULT_TRACE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces", "default.jsonl")
+
+
+def load_trace(path: str) -> list[dict]:
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+async def build_context(tokens_per_role: int = 50) -> dict:
+    """Ids and tokens to fill trace placeholders with, taken from whatever is in the database"""
+    from app.database.models import Users, Professions, Works
+    from app.dependencies import TokenData, create_access_token
+    from seed import PASSWORD
+
+    context = {
+        "profession_id": list(await Professions.all().values_list("id", flat=True)),
+        "work_id": list(await Works.all().limit(10000).values_list("id", flat=True)),
+        "tokens": {},
+        "usernames": [],
+    }
+    for role in ("user", "worker", "admin"):
+        accounts = await Users.filter(role=role).limit(tokens_per_role).values(
+            "id", "username", "email", "role"
+        )
+        context[f"{role}_id"] = [account["id"] for account in accounts]
+        context["tokens"][role] = [
+            create_access_token(TokenData(**account)) for account in accounts
+        ]
+        if role == "user":
+            context["usernames"] = [account["username"] for account in accounts]
+    context["password"] = PASSWORD
+    return context
+
+
+def _fill(value, values: dict):
+    if isinstance(value, str):
+        return value.format(**values)
+    if isinstance(value, dict):
+        return {key: _fill(item, values) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill(item, values) for item in value]
+    return value
+
+
+def build_request(entry: dict, context: dict, rng: random.Random) -> dict:
+    values = {
+        "profession_id": rng.choice(context["profession_id"] or [0]),
+        "worker_id": rng.choice(context["worker_id"] or [0]),
+        "user_id": rng.choice(context["user_id"] or [0]),
+        "work_id": rng.choice(context["work_id"] or [0]),
+        "username": rng.choice(context["usernames"] or [""]),
+        "password": context["password"],
+    }
+    request = {
+        "method": entry["method"],
+        "url": entry["path"].format(**values),
+        "headers": {},
+    }
+    for key in ("params", "json"):
+        if key in entry:
+            request[key] = _fill(entry[key], values)
+    if "form" in entry:
+        request["data"] = _fill(entry["form"], values)
+    if entry.get("auth"):
+        tokens = context["tokens"].get(entry["auth"]) or [""]
+        request["headers"]["Authorization"] = f"Bearer {rng.choice(tokens)}"
+    return request
+
+
+async def replay(app, trace: list[dict], context: dict, concurrency: int, repeat: int, seed: int):
+    rng = random.Random(seed)
+    jobs = []
+    for _ in range(repeat):
+        for entry in trace:
+            jobs.extend([entry] * entry.get("weight", 1))
+    rng.shuffle(jobs)
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for entry in jobs:
+        queue.put_nowait((f"{entry['method']} {entry['path']}", build_request(entry, context, rng)))
+
+    timings: dict[str, list] = {}
+    errors: dict[str, int] = {}
+
+    async def worker(client):
+        while not queue.empty():
+            route, request = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.request(**request)
+            timings.setdefault(route, []).append(time.perf_counter() - start)
+            if response.status_code >= 500:
+                errors[route] = errors.get(route, 0) + 1
+
+    async with asgi_client(app) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return timings, errors, elapsed
+
+
+def summarize(timings: dict, errors: dict, elapsed: float) -> dict:
+    from app.utils.metrics import http_request_db_queries
+
+    db_queries = {}
+    for (method, route), series in http_request_db_queries.values.items():
+        db_queries[f"{method} {route}"] = series[-2] / series[-1] if series[-1] else 0
+
+    routes = {}
+    for route, values in sorted(timings.items()):
+        routes[route] = {
+            "requests": len(values),
+            "errors": errors.get(route, 0),
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "db_queries_per_request": db_queries.get(route, 0),
+        }
+    total = sum(len(values) for values in timings.values())
+    return {"elapsed_s": elapsed, "requests": total, "throughput_rps": total / elapsed, "routes": routes}
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"{report['requests']} requests in {report['elapsed_s']:.2f} s, "
+        f"{report['throughput_rps']:.1f} req/s"
+    )
+    print(f"{'route':<52}{'n':>6}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'db q':>6}")
+    for route, stats in report["routes"].items():
+        print(
+            f"{route:<52}{stats['requests']:>6}{stats['errors']:>5}"
+            f"{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}"
+            f"{stats['db_queries_per_request']:>6.1f}"
+        )
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list[str]:
+    """Routes whose p95 got slower than `threshold` times the baseline"""
+    regressions = []
+    for route, stats in report["routes"].items():
+        previous = baseline.get("routes", {}).get(route)
+        if previous and previous["p95_ms"] > 0 and stats["p95_ms"] > previous["p95_ms"] * threshold:
+            regressions.append(
+                f"{route}: p95 {previous['p95_ms']:.2f} ms -> {stats['p95_ms']:.2f} ms"
+            )
+    return regressions
+
+
+async def main(args) -> int:
+    from tortoise import Tortoise, connections
+    from app.main import app
+    from app.utils.metrics import instrument_db_clients
+    from app.utils.logger import console_logger
+    from seed import seed
+
+    console_logger.setLevel("WARNING")
+    await init_db(reset=not args.no_seed)
+    if not args.no_seed:
+        await seed(args.users, args.workers, args.professions, args.works, args.seed)
+    instrument_db_clients(connections.all())
+
+    context = await build_context()
+    timings, errors, elapsed = await replay(
+        app, load_trace(args.trace), context, args.concurrency, args.repeat, args.seed
+    )
+    await Tortoise.close_connections()
+
+    report = summarize(timings, errors, elapsed)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trace", default=DEFAULT_TRACE)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-seed", action="store_true", help="replay against the existing database")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=200)
+    parser.add_argument("--professions", type=int, default=20)
+    parser.add_argument("--works", type=int, default=5000)
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--baseline", help="JSON report to compare p95 latencies against")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,235 @@
+"""
+Title: Synthetic data seeding
+File: /benchmarks/seed.py
+Description: Fills the database with synthetic users, workers, professions, works and reviews for benchmarks.
+Author: github.com/pzerone
+
+Usage:
+    python benchmarks/seed.py [--users 1000] [--workers 200] [--professions 20] [--works 5000]
+"""
+
+import argparse
+import asyncio
+import datetime
+import random
+from dataclasses import dataclass, field
+
+import common  # noqa: F401  sets up env and sys.path
+from common import init_db
+
+PASSWORD = "benchpass1"
+CITIES = (
+    ("Kochi", "Kerala", 9.9312, 76.2673),
+    ("Thrissur", "Kerala", 10.5276, 76.2144),
+    ("Bengaluru", "Karnataka", 12.9716, 77.5946),
+    ("Chennai", "Tamil Nadu", 13.0827, 80.2707),
+)
+TAGS = ("urgent", "weekend", "repair", "install", "inspection", "cleaning", "leak", "wiring")
+BATCH_SIZE = 1000
+
+
+@dataclass
+class SeedResult:
+    admin_id: int = 0
+    user_ids: list = field(default_factory=list)
+    worker_ids: list = field(default_factory=list)
+    profession_ids: list = field(default_factory=list)
+    work_ids: list = field(default_factory=list)
+
+
+async def seed(
+    users: int = 1000,
+    workers: int = 200,
+    professions: int = 20,
+    works: int = 5000,
+    random_seed: int = 42,
+) -> SeedResult:
+    """
+    Seed a freshly initialized database. `users` counts plain users, workers are created on top of them.
+    Every account shares the same password so only one bcrypt hash has to be computed.
+    """
+    from tortoise import connections, timezone
+    from app.database.models import (
+        Users,
+        UserDetails,
+        WorkerDetails,
+        Professions,
+        Works,
+        Reviews,
+    )
+    from app.dependencies import get_hashed_password
+    from app.utils.score import refresh_all_rankings
+
+    rng = random.Random(random_seed)
+    now = timezone.now()
+    password = get_hashed_password(PASSWORD)
+    supports_arrays = connections.get("default").capabilities.dialect == "postgres"
+    result = SeedResult()
+
+    admin = await Users.create(
+        username="bench_admin",
+        first_name="Admin",
+        email="admin@bench.local",
+        password=password,
+        role="admin",
+        created_at=now,
+        modified_at=now,
+    )
+    result.admin_id = admin.id
+
+    await Users.bulk_create(
+        [
+            Users(
+                username=f"bench_{index}",
+                first_name=f"First{index}",
+                last_name=f"Last{index}",
+                email=f"bench_{index}@bench.local",
+                password=password,
+                role="worker" if index < workers else "user",
+                created_at=now,
+                modified_at=now,
+            )
+            for index in range(users + workers)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    account_ids = await Users.filter(username__startswith="bench_").exclude(
+        id=admin.id
+    ).order_by("id").values_list("id", flat=True)
+    result.worker_ids = list(account_ids[:workers])
+    result.user_ids = list(account_ids[workers:])
+
+    addresses = []
+    for index, user_id in enumerate(account_ids):
+        city, state, latitude, longitude = rng.choice(CITIES)
+        addresses.append(
+            UserDetails(
+                user_id=user_id,
+                phone_number=f"+91{9000000000 + index}",
+                house_name=f"House {index}",
+                street=f"Street {index % 50}",
+                city=city,
+                state=state,
+                pincode=680000 + index % 1000,
+                latitude=round(latitude + rng.uniform(-0.1, 0.1), 6),
+                longitude=round(longitude + rng.uniform(-0.1, 0.1), 6),
+                created_at=now,
+                modified_at=now,
+            )
+        )
+    await UserDetails.bulk_create(addresses, batch_size=BATCH_SIZE)
+
+    await Professions.bulk_create(
+        [
+            Professions(
+                name=f"profession_{index}",
+                description=f"Synthetic profession {index} for repair and install work",
+                estimated_time_hours=rng.choice((1, 1.5, 2, 3, 4)),
+                created_at=now,
+                modified_at=now,
+                created_by_id=admin.id,
+                modified_by_id=admin.id,
+            )
+            for index in range(professions)
+        ]
+    )
+    result.profession_ids = list(
+        await Professions.all().order_by("id").values_list("id", flat=True)
+    )
+
+    worker_profession = {
+        worker_id: rng.choice(result.profession_ids) for worker_id in result.worker_ids
+    }
+    await WorkerDetails.bulk_create(
+        [
+            WorkerDetails(
+                user_id=worker_id,
+                profession_id=profession_id,
+                hourly_rate=rng.randrange(200, 1500, 50),
+                worker_bio=f"Experienced professional number {worker_id}",
+                created_at=now,
+                modified_at=now,
+            )
+            for worker_id, profession_id in worker_profession.items()
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+    today = now.date()
+    statuses = ("pending", "accepted", "rejected", "cancelled", "closed", "closed", "closed")
+    work_rows = []
+    for _ in range(works):
+        worker_id = rng.choice(result.worker_ids)
+        status = rng.choice(statuses)
+        work_rows.append(
+            Works(
+                tags=rng.sample(TAGS, 2) if supports_arrays else None,
+                user_description="Synthetic booking",
+                profession_id=worker_profession[worker_id],
+                scheduled_date=today + datetime.timedelta(days=rng.randint(-60, 30)),
+                scheduled_time=datetime.time(rng.randint(7, 19), 0),
+                status=status,
+                payment_status="received" if status == "closed" else "pending",
+                estimated_cost=500.0,
+                final_cost=rng.uniform(300, 3000) if status == "closed" else None,
+                booked_by_id=rng.choice(result.user_ids),
+                assigned_to_id=worker_id,
+                created_at=now,
+                modified_at=now,
+            )
+        )
+    await Works.bulk_create(work_rows, batch_size=BATCH_SIZE)
+    closed_works = await Works.filter(status="closed").values(
+        "id", "booked_by_id", "assigned_to_id"
+    )
+    result.work_ids = list(await Works.all().values_list("id", flat=True))
+
+    reviews = [
+        Reviews(
+            rating=rng.randint(1, 5),
+            review="Synthetic review",
+            work_id=work["id"],
+            user_id=work["booked_by_id"],
+            worker_id=work["assigned_to_id"],
+            created_at=now,
+            modified_at=now,
+        )
+        for work in closed_works
+        if rng.random() < 0.7
+    ]
+    await Reviews.bulk_create(reviews, batch_size=BATCH_SIZE)
+
+    ratings: dict = {}
+    for review in reviews:
+        ratings.setdefault(review.worker_id, []).append(review.rating)
+    for worker_id, worker_ratings in ratings.items():
+        await WorkerDetails.filter(user_id=worker_id).update(
+            avg_rating=sum(worker_ratings) / len(worker_ratings)
+        )
+
+    await refresh_all_rankings()
+    return result
+
+
+async def main(args) -> None:
+    from tortoise import Tortoise
+
+    await init_db(reset=not args.keep)
+    result = await seed(args.users, args.workers, args.professions, args.works, args.seed)
+    print(
+        f"seeded {len(result.user_ids)} users, {len(result.worker_ids)} workers, "
+        f"{len(result.profession_ids)} professions, {len(result.work_ids)} works"
+    )
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=200)
+    parser.add_argument("--professions", type=int, default=20)
+    parser.add_argument("--works", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="do not drop an existing SQLite database")
+    main_args = parser.parse_args()
+    asyncio.run(main(main_args))
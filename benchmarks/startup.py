@@ -0,0 +1,75 @@
+"""
+Title: Startup benchmark
+File: /benchmarks/startup.py
+Description: Measures how long `import app.main` takes using `python -X importtime` and lists the slowest imports.
+Author: github.com/pzerone
+
+Usage:
+    python benchmarks/startup.py [--runs 5] [--top 15]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+import common  # noqa: F401  sets up env and sys.path
+from common import ROOT
+
+HEAVY_MODULES = ("pandas", "numpy", "geopy", "surprise")
+
+
+def run_once() -> tuple[float, list[str], list[tuple[int, int, str]]]:
+    """
+    Returns the wall time of the import in seconds, the heavy modules that got imported,
+    and (self us, cumulative us, module) per import
+    """
+    code = (
+        "import time, sys; start = time.perf_counter(); import app.main; "
+        "print(time.perf_counter() - start); "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")]))}
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        imports.append((int(self_us), int(cumulative_us), module.rstrip()))
+    wall_time, heavy = process.stdout.split("\n")[-3:-1]
+    return float(wall_time), [module for module in heavy.split(",") if module], imports
+
+
+def main(args) -> None:
+    wall_times = []
+    heavy = imports = []
+    for _ in range(args.runs):
+        wall_time, heavy, imports = run_once()
+        wall_times.append(wall_time)
+
+    print(
+        f"import app.main: median {statistics.median(wall_times) * 1000:.1f} ms, "
+        f"min {min(wall_times) * 1000:.1f} ms over {args.runs} runs"
+    )
+    print(f"heavy modules imported at startup: {', '.join(heavy) or 'none'}")
+    print("\nslowest direct imports of app.main (cumulative, last run):")
+    # -X importtime indents nested imports by two spaces per level
+    direct = [entry for entry in imports if entry[2].startswith("   ") and not entry[2].startswith("    ")]
+    for self_us, cumulative_us, module in sorted(direct, key=lambda entry: -entry[1])[: args.top]:
+        print(f"{cumulative_us / 1000:10.1f} ms  {module.strip()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    main(parser.parse_args())
@@ -8,11 +8,12 @@ if [ $# -eq 0 ]; then
     exit 1
 fi
 
-# delay for 5 seconds to allow the database to start up in production.
-# This is a temporary fix to allow the database to start up before the migration is run
-# This should be replaced with health check of docker without exposing database credentials on the compose file
-if [ "$1" == "prod" ]; then
-    sleep 5
+# Wait until the database accepts queries before running migrations.
+# Polls with exponential backoff, so a database that is already up costs no delay.
+echo -e "\e[92mWaiting for database:\e[0m python -m app.database.wait_for_db --timeout ${DB_WAIT_TIMEOUT:-60}"
+if ! python -m app.database.wait_for_db --timeout "${DB_WAIT_TIMEOUT:-60}"; then
+    echo -e "\e[91mError: Database did not become ready in ${DB_WAIT_TIMEOUT:-60} seconds\e[0m" >&2
+    exit 1
 fi
 
 # Apply database migrations using Aerich
@@ -0,0 +1,125 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+# The app reads its settings at import time. Tests run against a fresh in memory SQLite database,
+# without the rate limiter, and run the compute pool jobs on a thread.
+TEST_ENV = {
+    "DB_URL": "sqlite://:memory:",
+    "JWT_SECRET": "test-secret",
+    "JWT_REFRESH_SECRET": "test-refresh-secret",
+    "JWT_ALGORITHM": "HS256",
+    "JWT_AT_EXPIRE_MINUTES": "60",
+    "JWT_RT_EXPIRE_MINUTES": "600",
+    "DISTANCE_WEIGHT": "0.4",
+    "RATING_WEIGHT": "0.3",
+    "REVIEW_COUNT_WEIGHT": "0.2",
+    "COST_WEIGHT": "0.1",
+    "RATE_LIMIT_URL": "off",
+    "COMPUTE_POOL_WORKERS": "0",
+    "CACHE_URL": "memory://",
+}
+os.environ.update(TEST_ENV)
+
+# Initializes the models before the routers build their request schemas, as the server does
+import app.main  # noqa: E402,F401
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db(monkeypatch):
+    """A fresh database, and an empty response cache so no test reads another one's rows"""
+    from tortoise import Tortoise
+    from app.database.settings import TORTOISE_ORM
+    from app.utils.cache import MemoryBackend, response_cache
+
+    monkeypatch.setattr(response_cache, "backend", MemoryBackend())
+    await Tortoise.init(config=TORTOISE_ORM)
+    await Tortoise.generate_schemas()
+    yield
+    await Tortoise.close_connections()
+
+
+@pytest.fixture
+async def seed(db):
+    """An admin, a plumbing profession, a client and two plumbers, each with an address"""
+    from tortoise import timezone
+    from app.database.models import Professions, UserDetails, Users, WorkerDetails
+
+    now = timezone.now()
+
+    async def user(username: str, role: str, city: str) -> Users:
+        new_user = await Users.create(
+            username=username,
+            first_name=username.title(),
+            email=f"{username}@example.com",
+            password="not-a-hash",
+            role=role,
+            created_at=now,
+            modified_at=now,
+        )
+        await UserDetails.create(
+            user=new_user,
+            phone_number="1234567890",
+            house_name="House",
+            street="Street",
+            city=city,
+            state="Kerala",
+            pincode=682001,
+            latitude=9.93,
+            longitude=76.26,
+            created_at=now,
+            modified_at=now,
+        )
+        return new_user
+
+    admin = await user("admin", "admin", "Kochi")
+    profession = await Professions.create(
+        name="plumber",
+        description="Fixes pipes and leaks",
+        estimated_time_hours=2,
+        created_at=now,
+        modified_at=now,
+        created_by=admin,
+        modified_by=admin,
+    )
+    client = await user("client", "user", "Kochi")
+    workers = []
+    for index in range(2):
+        worker = await user(f"plumber{index}", "worker", "Kochi")
+        await WorkerDetails.create(
+            user=worker,
+            profession=profession,
+            hourly_rate=500,
+            worker_bio="Experienced plumber",
+            created_at=now,
+            modified_at=now,
+        )
+        workers.append(worker)
+    return SimpleNamespace(admin=admin, profession=profession, client=client, workers=workers)
+
+
+def auth_headers(user) -> dict:
+    from app.dependencies import TokenData, create_access_token
+
+    token = create_access_token(
+        TokenData(id=user.id, username=user.username, email=user.email, role=user.role)
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+async def api(db):
+    """Client calling the app in process. The startup handlers (pool, dispatcher, warmup) don't run."""
+    import httpx
+    from app.main import app
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        yield client
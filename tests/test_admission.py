@@ -0,0 +1,130 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.middleware import AdmissionMiddleware
+from app.utils.admission import (
+    CRITICAL,
+    EXEMPT,
+    LOW,
+    LOW_PRIORITY_SHARE,
+    MAX_IN_FLIGHT,
+    MAX_LOOP_LAG_SECONDS,
+    NORMAL,
+    STREAM,
+    AdmissionController,
+    admission,
+    classify,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize(
+    "method, path, priority",
+    [
+        ("GET", "/healthz", EXEMPT),
+        ("GET", "/readyz", EXEMPT),
+        ("GET", "/metrics", EXEMPT),
+        ("GET", "/work/events", STREAM),
+        ("POST", "/work/book-a-work", CRITICAL),
+        ("POST", "/work/book-works", CRITICAL),
+        ("POST", "/work/accept-work/1", CRITICAL),
+        ("POST", "/work/recieved-payment/1", CRITICAL),
+        ("POST", "/work/sent-payment/1", CRITICAL),
+        ("PUT", "/work/review-work/1", CRITICAL),
+        ("DELETE", "/work/availability/block/1", CRITICAL),
+        ("GET", "/users/recommend", LOW),
+        ("GET", "/users/recommend/v2", LOW),
+        ("GET", "/users/professions", LOW),
+        ("GET", "/work/professionals/1", LOW),
+        ("GET", "/work/professionals/1/filter", LOW),
+        ("GET", "/work/tags/popular", LOW),
+        ("GET", "/work/search", LOW),
+        ("GET", "/admin/analytics/daily", LOW),
+        ("GET", "/admin/work/history", LOW),
+        ("GET", "/work/booked-works", NORMAL),
+        ("GET", "/work/estimated-cost/1", NORMAL),
+        ("POST", "/auth/login", NORMAL),
+        ("PUT", "/users/address", NORMAL),
+        ("POST", "/admin/professions/import", NORMAL),
+        ("GET", "/", NORMAL),
+    ],
+)
+def test_classify(method, path, priority):
+    assert classify(method, path) == priority
+
+
+def controller(in_flight: int = 0, loop_lag: float = 0.0) -> AdmissionController:
+    controller = AdmissionController()
+    controller.in_flight = in_flight
+    controller.loop_lag = loop_lag
+    return controller
+
+
+@pytest.mark.parametrize(
+    "in_flight, loop_lag, low, normal",
+    [
+        (0, 0.0, None, None),
+        (int(MAX_IN_FLIGHT * LOW_PRIORITY_SHARE) - 1, 0.0, None, None),
+        (int(MAX_IN_FLIGHT * LOW_PRIORITY_SHARE), 0.0, "in_flight", None),
+        (MAX_IN_FLIGHT - 1, 0.0, "in_flight", None),
+        (MAX_IN_FLIGHT, 0.0, "in_flight", "in_flight"),
+        (0, MAX_LOOP_LAG_SECONDS * 0.9, None, None),
+        (0, MAX_LOOP_LAG_SECONDS, "loop_lag", None),
+        (0, MAX_LOOP_LAG_SECONDS * 1.9, "loop_lag", None),
+        (0, MAX_LOOP_LAG_SECONDS * 2, "loop_lag", "loop_lag"),
+    ],
+)
+def test_rejection_thresholds(in_flight, loop_lag, low, normal):
+    state = controller(in_flight, loop_lag)
+    assert state.rejection(LOW) == low
+    assert state.rejection(STREAM) == low
+    assert state.rejection(NORMAL) == normal
+    # Never shed, however loaded
+    assert state.rejection(CRITICAL) is None
+    assert state.rejection(EXEMPT) is None
+
+
+def test_critical_and_probes_are_served_when_overloaded():
+    overloaded = controller(MAX_IN_FLIGHT * 10, MAX_LOOP_LAG_SECONDS * 10)
+    assert overloaded.rejection(CRITICAL) is None
+    assert overloaded.rejection(EXEMPT) is None
+
+
+async def test_middleware_sheds_with_retry_after_and_serves_critical(monkeypatch):
+    app = FastAPI()
+
+    @app.get("/work/professionals/1")
+    async def professionals():
+        return []
+
+    @app.get("/work/booked-works")
+    async def booked_works():
+        return []
+
+    @app.post("/work/book-a-work")
+    async def book():
+        return {"detail": "booked"}
+
+    @app.get("/healthz")
+    async def healthz():
+        return {"status": "ok"}
+
+    monkeypatch.setattr(admission, "in_flight", MAX_IN_FLIGHT)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=AdmissionMiddleware(app)), base_url="http://test"
+    ) as client:
+        for path in ("/work/professionals/1", "/work/booked-works"):
+            response = await client.get(path)
+            assert response.status_code == 503
+            assert response.headers["Retry-After"] == "1"
+            assert response.json() == {"detail": "Server is overloaded, try again later"}
+
+        response = await client.post("/work/book-a-work")
+        assert response.status_code == 200
+        assert response.json() == {"detail": "booked"}
+        assert (await client.get("/healthz")).status_code == 200
+
+    # Served requests left the in flight count as they found it
+    assert admission.in_flight == MAX_IN_FLIGHT
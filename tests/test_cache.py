@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from app.utils.cache import MemoryBackend, ResponseCache
+
+pytestmark = pytest.mark.anyio
+
+
+class Loader:
+    """Counts its calls, each one returns the call number after `delay` seconds"""
+
+    def __init__(self, delay: float = 0.05, error: Exception | None = None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return {"call": call}
+
+
+@pytest.fixture
+def cache() -> ResponseCache:
+    return ResponseCache(MemoryBackend())
+
+
+async def test_concurrent_misses_share_one_load(cache):
+    loader = Loader()
+    results = await asyncio.gather(
+        *(cache.get_or_set("professions", "all", 60, loader) for _ in range(10))
+    )
+
+    assert loader.calls == 1
+    assert results == [{"call": 1}] * 10
+    assert not cache.in_flight
+    # Stored, later requests don't load either
+    assert await cache.get_or_set("professions", "all", 60, loader) == {"call": 1}
+    assert loader.calls == 1
+
+
+async def test_waiters_reload_when_the_loading_request_is_cancelled(cache):
+    loader = Loader()
+    leader = asyncio.create_task(cache.get_or_set("professions", "all", 60, loader))
+    await asyncio.sleep(0.01)
+    waiters = [
+        asyncio.create_task(cache.get_or_set("professions", "all", 60, loader)) for _ in range(3)
+    ]
+    await asyncio.sleep(0.01)
+    leader.cancel()
+
+    # One waiter loads it again, the others wait for that load
+    assert await asyncio.gather(*waiters) == [{"call": 2}] * 3
+    assert leader.cancelled()
+    assert loader.calls == 2
+    assert not cache.in_flight
+
+
+async def test_loader_error_reaches_every_waiter(cache):
+    loader = Loader(error=ValueError("database is down"))
+    results = await asyncio.gather(
+        *(cache.get_or_set("professions", "all", 60, loader) for _ in range(3)),
+        return_exceptions=True,
+    )
+
+    assert loader.calls == 1
+    assert [str(result) for result in results] == ["database is down"] * 3
+    assert all(isinstance(result, ValueError) for result in results)
+    # Errors are not cached, the next request loads again
+    loader.error = None
+    assert await cache.get_or_set("professions", "all", 60, loader) == {"call": 2}
+
+
+async def test_invalidate_forces_a_reload(cache):
+    loader = Loader(delay=0)
+    assert await cache.get_or_set("professionals", "1", 60, loader) == {"call": 1}
+    assert await cache.get_or_set("estimated_cost", "1", 60, loader) == {"call": 2}
+
+    version = await cache.version("professionals")
+    await cache.invalidate("professionals")
+    assert await cache.version("professionals") == version + 1
+
+    assert await cache.get_or_set("professionals", "1", 60, loader) == {"call": 3}
+    # Other namespaces keep their entries
+    assert await cache.get_or_set("estimated_cost", "1", 60, loader) == {"call": 2}
+
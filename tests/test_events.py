@@ -0,0 +1,165 @@
+import json
+import asyncio
+from types import SimpleNamespace
+
+import asyncpg
+import pytest
+
+from app.utils import events
+from app.utils.events import (
+    CHANNEL,
+    SUBSCRIBER_QUEUE_SIZE,
+    EventBroker,
+    event_listener_reconnects_total,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeConnection:
+    """The part of an asyncpg connection the broker's LISTEN uses"""
+
+    def __init__(self):
+        self.listeners = {}
+        self.termination_listeners = []
+        self.closed = False
+
+    async def add_listener(self, channel, callback):
+        self.listeners[channel] = callback
+
+    def add_termination_listener(self, callback):
+        self.termination_listeners.append(callback)
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self, timeout=None):
+        self.closed = True
+
+    def terminate(self):
+        self.closed = True
+
+    def notify(self, user_ids, event):
+        self.listeners[CHANNEL](self, 1, CHANNEL, json.dumps({"user_ids": user_ids, "event": event}))
+
+    def drop(self):
+        """The server went away, asyncpg calls the termination listeners"""
+        self.closed = True
+        for callback in self.termination_listeners:
+            callback(self)
+
+
+class Database:
+    """Hands out fake connections, failing the attempts listed in `failures`"""
+
+    def __init__(self, failures: int = 0):
+        self.connections = []
+        self.failures = failures
+        self.reconnected = asyncio.Event()
+
+    async def connect(self, dsn):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("Connection refused")
+        connection = FakeConnection()
+        self.connections.append(connection)
+        if len(self.connections) > 1:
+            self.reconnected.set()
+        return connection
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = Database()
+    monkeypatch.setattr(asyncpg, "connect", database.connect)
+    postgres = SimpleNamespace(capabilities=SimpleNamespace(dialect="postgres"))
+    monkeypatch.setattr(events, "connections", SimpleNamespace(get=lambda name: postgres))
+    monkeypatch.setattr(events, "RECONNECT_MIN_SECONDS", 0.01)
+    return database
+
+
+@pytest.fixture
+async def broker(database):
+    broker = EventBroker()
+    await broker.start()
+    yield broker
+    await broker.stop()
+
+
+def drain(queue: asyncio.Queue) -> list:
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    return items
+
+
+async def test_notifications_reach_the_subscribers(database, broker):
+    queue = broker.subscribe(1)
+    other = broker.subscribe(2)
+
+    database.connections[0].notify([1], {"type": "work.booked"})
+
+    assert drain(queue) == [{"type": "work.booked"}]
+    assert drain(other) == []
+
+
+async def test_dropped_listener_closes_streams_and_reconnects(database, broker):
+    reconnects = event_listener_reconnects_total.values.get((), 0)
+    queue = broker.subscribe(1)
+    queue.put_nowait({"type": "work.booked"})
+    database.failures = 2
+
+    database.connections[0].drop()
+    await asyncio.wait_for(database.reconnected.wait(), 5)
+    await asyncio.sleep(0)
+
+    # The stream ends, its client reconnects and refetches what it missed
+    assert drain(queue) == [{"type": "work.booked"}, None]
+    assert broker.subscribers == {}
+    assert event_listener_reconnects_total.values[()] == reconnects + 1
+    assert database.failures == 0 and len(database.connections) == 2
+    assert broker.listener is database.connections[1]
+
+    queue = broker.subscribe(1)
+    database.connections[1].notify([1], {"type": "work.accepted"})
+    assert drain(queue) == [{"type": "work.accepted"}]
+
+
+async def test_unnoticed_termination_is_found_by_the_check(database, monkeypatch):
+    monkeypatch.setattr(events, "LISTENER_CHECK_SECONDS", 0.01)
+    broker = EventBroker()
+    await broker.start()
+    try:
+        database.connections[0].closed = True  # Without calling the termination listeners
+        await asyncio.wait_for(database.reconnected.wait(), 5)
+    finally:
+        await broker.stop()
+    assert len(database.connections) == 2
+
+
+async def test_stop_ends_full_streams(database, broker):
+    queue = broker.subscribe(1)
+    for index in range(SUBSCRIBER_QUEUE_SIZE):
+        queue.put_nowait({"index": index})
+
+    await broker.stop()
+
+    # The oldest event makes room for the end of the stream
+    items = drain(queue)
+    assert len(items) == SUBSCRIBER_QUEUE_SIZE
+    assert items[0] == {"index": 1} and items[-1] is None
+    assert broker.subscribers == {} and broker.supervisor is None
+    assert database.connections[0].closed
+
+
+async def test_slow_subscriber_is_disconnected():
+    broker = EventBroker()
+    queue = broker.subscribe(1)
+    for index in range(SUBSCRIBER_QUEUE_SIZE):
+        await broker.publish([1], {"index": index})
+
+    await broker.publish([1], {"index": SUBSCRIBER_QUEUE_SIZE})
+
+    items = drain(queue)
+    assert items[-1] is None and {"index": SUBSCRIBER_QUEUE_SIZE} not in items
+    assert broker.subscribers == {}
@@ -0,0 +1,131 @@
+import os
+import random
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from app.utils.factors import FactorModel, export_factors
+
+TOLERANCE = 1e-9
+
+
+@pytest.fixture(scope="module")
+def stub_model():
+    """
+    The attributes of a fitted SVDpp that the export reads, with random factors. Raw ids are
+    mapped to inner ids out of order, like surprise does in the order it meets them.
+    """
+    rng = np.random.default_rng(1)
+    user_ids = [7, 3, 12, 5]
+    item_ids = [20, 10, 30]
+    ratings = {0: [(0, 1.0), (2, 0.0)], 1: [(1, 1.0)], 2: [], 3: [(0, 0.0), (1, 1.0), (2, 1.0)]}
+    factors = 4
+    return SimpleNamespace(
+        trainset=SimpleNamespace(
+            ur=ratings,
+            _raw2inner_id_users={raw: inner for inner, raw in enumerate(user_ids)},
+            _raw2inner_id_items={raw: inner for inner, raw in enumerate(item_ids)},
+            global_mean=0.4,
+            rating_scale=(0, 1),
+        ),
+        pu=rng.normal(0, 0.5, (len(user_ids), factors)),
+        qi=rng.normal(0, 0.5, (len(item_ids), factors)),
+        yj=rng.normal(0, 0.5, (len(item_ids), factors)),
+        bu=rng.normal(0, 0.2, len(user_ids)),
+        bi=rng.normal(0, 0.2, len(item_ids)),
+    )
+
+
+def svdpp_estimate(model, user_id, item_id) -> float:
+    """SVDpp.estimate and the clipping of AlgoBase.predict, computed from the stub's arrays"""
+    trainset = model.trainset
+    user = trainset._raw2inner_id_users.get(user_id)
+    item = trainset._raw2inner_id_items.get(item_id)
+    est = trainset.global_mean
+    if user is not None:
+        est += model.bu[user]
+    if item is not None:
+        est += model.bi[item]
+    if user is not None and item is not None:
+        rated = [rated_item for rated_item, _ in trainset.ur[user]]
+        implicit = sum((model.yj[j] for j in rated), np.zeros(model.pu.shape[1]))
+        if rated:
+            implicit /= np.sqrt(len(rated))
+        est += np.dot(model.qi[item], model.pu[user] + implicit)
+    lower_bound, higher_bound = trainset.rating_scale
+    return min(higher_bound, max(lower_bound, est))
+
+
+@pytest.fixture(scope="module")
+def stub_factor_model(stub_model, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("stub") / "model_factors")
+    export_factors(stub_model, path)
+    return FactorModel(path)
+
+
+@pytest.mark.parametrize("user_id", [7, 3, 12, 5, 999])
+@pytest.mark.parametrize("item_id", [20, 10, 30, 999])
+def test_estimate_is_the_svdpp_formula(stub_model, stub_factor_model, user_id, item_id):
+    assert stub_factor_model.estimate(user_id, item_id) == pytest.approx(
+        svdpp_estimate(stub_model, user_id, item_id), abs=TOLERANCE
+    )
+
+
+def test_estimates_are_clipped_to_the_rating_scale(stub_model, stub_factor_model):
+    estimates = [
+        stub_factor_model.estimate(user_id, item_id)
+        for user_id in stub_model.trainset._raw2inner_id_users
+        for item_id in stub_model.trainset._raw2inner_id_items
+    ]
+    assert all(0 <= estimate <= 1 for estimate in estimates)
+
+
+def test_export_replaces_the_previous_one(stub_model, tmp_path):
+    path = str(tmp_path / "model_factors")
+    export_factors(stub_model, path)
+    export_factors(stub_model, path)
+    assert sorted(os.listdir(tmp_path)) == ["model_factors"]
+    assert FactorModel(path).estimate(7, 20) == pytest.approx(svdpp_estimate(stub_model, 7, 20))
+
+
+@pytest.fixture(scope="module")
+def algo():
+    """A small SVDpp fitted on booked / not booked pairs, like the recommendation model"""
+    surprise = pytest.importorskip("surprise")
+    pd = pytest.importorskip("pandas")
+    rng = random.Random(1)
+    rows = [
+        (user_id, profession_id, float(rng.random() < 0.3))
+        for user_id in range(1, 41)
+        for profession_id in range(1, 9)
+    ]
+    data = surprise.Dataset.load_from_df(
+        pd.DataFrame(rows, columns=["booked_by_id", "profession_id", "booked_or_not"]),
+        surprise.Reader(rating_scale=(0, 1)),
+    )
+    algo = surprise.SVDpp(n_factors=5, n_epochs=5, random_state=1)
+    algo.fit(data.build_full_trainset())
+    return algo
+
+
+@pytest.fixture(scope="module")
+def factor_model(algo, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("export") / "model_factors")
+    export_factors(algo, path)
+    return FactorModel(path)
+
+
+def test_predictions_match(algo, factor_model):
+    for user_id in range(1, 41):
+        for profession_id in range(1, 9):
+            expected = algo.predict(user_id, profession_id).est
+            assert factor_model.predict(user_id, profession_id).est == pytest.approx(
+                expected, abs=TOLERANCE
+            )
+
+
+@pytest.mark.parametrize("user_id, profession_id", [(999, 3), (7, 999), (999, 999)])
+def test_unknown_ids_match(algo, factor_model, user_id, profession_id):
+    expected = algo.predict(user_id, profession_id).est
+    assert factor_model.predict(user_id, profession_id).est == pytest.approx(
+        expected, abs=TOLERANCE
+    )
@@ -0,0 +1,176 @@
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from tortoise import timezone
+
+from app.database.models import OutboxEvents, WorkerRankings, Works
+# Imported before any test swaps the handler list, so the work handlers register in the real one
+from app.routers.work import transition
+from app.utils import outbox
+
+pytestmark = pytest.mark.anyio
+
+
+class Handled(list):
+    """(pattern, topic) of every event handled by the handlers registered with `register`"""
+
+    def register(self, pattern: str) -> None:
+        @outbox.handles(pattern)
+        async def handler(event, conn):
+            self.append((pattern, event["topic"]))
+
+
+@pytest.fixture
+def handled(monkeypatch) -> Handled:
+    """Only the handlers a test registers run"""
+    monkeypatch.setattr(outbox, "_handlers", [])
+    return Handled()
+
+
+async def test_event_of_rolled_back_transaction_is_never_handled(db, handled):
+    handled.register("*")
+    with pytest.raises(RuntimeError):
+        async with outbox.transaction() as conn:
+            await outbox.emit("work.booked", {"work_id": 1}, using_db=conn)
+            raise RuntimeError("write failed")
+
+    assert await outbox.drain_once() == 0
+    assert handled == []
+    assert not await OutboxEvents.exists()
+
+
+async def test_committed_event_is_handled_once(db, handled):
+    handled.register("*")
+    async with outbox.transaction() as conn:
+        await outbox.emit("work.booked", {"work_id": 1}, using_db=conn)
+
+    assert await outbox.drain_once() == 1
+    assert await outbox.drain_once() == 0
+    assert handled == [("*", "work.booked")]
+    event = await OutboxEvents.get(topic="work.booked")
+    assert event.processed_at is not None and event.attempts == 0
+
+
+async def test_failing_handler_is_retried_then_given_up(db, monkeypatch):
+    monkeypatch.setattr(outbox, "_handlers", [])
+    calls = []
+
+    @outbox.handles("work.booked")
+    async def failing(event, conn):
+        calls.append(event["id"])
+        # Written in the drain transaction, rolled back with it
+        await OutboxEvents.create(
+            topic="side.effect", payload={}, created_at=timezone.now(), using_db=conn
+        )
+        raise ValueError("rollup table is locked")
+
+    await outbox.emit("work.booked", {"work_id": 1})
+    for attempt in range(1, outbox.MAX_ATTEMPTS):
+        assert await outbox.drain_once() == 0
+        event = await OutboxEvents.get(topic="work.booked")
+        assert event.attempts == attempt
+        assert event.last_error == "ValueError: rollup table is locked"
+        assert event.processed_at is None
+
+    await outbox.drain_once()
+    event = await OutboxEvents.get(topic="work.booked")
+    assert event.attempts == outbox.MAX_ATTEMPTS
+    assert event.processed_at is not None
+    assert event.last_error == "ValueError: rollup table is locked"
+
+    # Given up, not handled again
+    assert await outbox.drain_once() == 0
+    assert len(calls) == outbox.MAX_ATTEMPTS
+    assert not await OutboxEvents.filter(topic="side.effect").exists()
+
+
+async def test_failed_event_does_not_purge_with_the_handled_ones(db, handled):
+    handled.register("*")
+    old = timezone.now() - outbox.RETENTION - timedelta(minutes=1)
+    await OutboxEvents.create(topic="work.booked", payload={}, created_at=old, processed_at=old)
+    await OutboxEvents.create(
+        topic="work.booked", payload={}, created_at=old, processed_at=old, last_error="boom"
+    )
+
+    await outbox.purge_processed()
+    assert await OutboxEvents.all().values_list("last_error", flat=True) == ["boom"]
+
+
+@pytest.mark.parametrize(
+    "topic, patterns",
+    [
+        ("review.created", ["review.*"]),
+        ("review.updated", ["review.*"]),
+        ("work.payment_received", ["work.*", "work.payment_*"]),
+        ("work.payment_sent", ["work.*", "work.payment_*"]),
+        ("work.booked", ["work.*", "work.booked"]),
+        ("work.cancelled", ["work.*"]),
+        ("workers.refreshed", []),
+    ],
+)
+async def test_topics_reach_matching_handlers(db, handled, topic, patterns):
+    for pattern in ("review.*", "work.*", "work.payment_*", "work.booked"):
+        handled.register(pattern)
+
+    await outbox.emit(topic, {})
+    await outbox.drain_once()
+
+    # In registration order, once per matching handler
+    assert handled == [(pattern, topic) for pattern in patterns]
+
+
+async def book(seed) -> Works:
+    now = timezone.now()
+    return await Works.create(
+        user_description="Leaking tap",
+        profession=seed.profession,
+        scheduled_date=now.date() + timedelta(days=1),
+        scheduled_time=now.time().replace(microsecond=0),
+        estimated_cost=1000,
+        booked_by=seed.client,
+        assigned_to=seed.workers[0],
+        created_at=now,
+        modified_at=now,
+    )
+
+
+async def test_transition_records_the_event(seed, handled):
+    work = await book(seed)
+    await transition(work, "work.accepted", status="accepted")
+
+    assert (await Works.get(id=work.id)).status == "accepted"
+    event = await OutboxEvents.get()
+    assert event.topic == "work.accepted"
+    assert event.payload["changes"] == {"status": "accepted"}
+
+
+async def test_transition_of_changed_work_is_a_conflict(seed, handled):
+    work = await book(seed)
+    # The client cancels after the worker's request read the work as pending
+    await Works.filter(id=work.id).update(status="cancelled")
+
+    with pytest.raises(HTTPException) as error:
+        await transition(work, "work.accepted", status="accepted")
+
+    assert error.value.status_code == 409
+    assert (await Works.get(id=work.id)).status == "cancelled"
+    assert not await OutboxEvents.exists()
+
+
+async def test_review_event_refreshes_the_worker_ranking(seed):
+    worker = seed.workers[0]
+    await outbox.emit(
+        "review.created",
+        {
+            "work_id": 1,
+            "booked_by_id": seed.client.id,
+            "assigned_to_id": worker.id,
+            "profession_id": seed.profession.id,
+            "final_cost": 1000,
+            "tags": [],
+            "changes": {"rating": 4},
+        },
+    )
+    assert await outbox.drain_once() == 1
+    assert await WorkerRankings.filter(worker_id=worker.id).exists()
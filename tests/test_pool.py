@@ -0,0 +1,128 @@
+import os
+import time
+import random
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.utils import score
+from app.utils.pool import (
+    QUEUE_PER_WORKER,
+    RETRY_AFTER_SECONDS,
+    ComputePool,
+    compute_jobs_total,
+)
+
+pytestmark = pytest.mark.anyio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Jobs run in spawned workers, which import them from this module
+def sleep_for(seconds: float) -> float:
+    time.sleep(seconds)
+    return seconds
+
+
+def crash() -> None:
+    os._exit(1)  # Like a worker killed for memory
+
+
+@pytest.fixture
+async def start_pool(monkeypatch):
+    """Starts warmed up pools, the workers preload the model from the repository root"""
+    monkeypatch.chdir(ROOT)
+    pools = []
+
+    async def start(workers: int = 1, timeout: float = 30) -> ComputePool:
+        pool = ComputePool(workers, timeout)
+        pool.start()
+        await pool.warm_up()
+        pools.append(pool)
+        return pool
+
+    yield start
+    for pool in pools:
+        pool.stop()
+
+
+async def test_jobs_past_the_queue_bound_are_rejected(start_pool):
+    pool = await start_pool()
+    assert pool.max_pending == QUEUE_PER_WORKER
+
+    queued = [asyncio.create_task(pool.run(sleep_for, 0.2)) for _ in range(pool.max_pending)]
+    await asyncio.sleep(0)
+    with pytest.raises(HTTPException) as error:
+        await pool.run(sleep_for, 0)
+    assert error.value.status_code == 503
+    assert error.value.headers["Retry-After"] == str(RETRY_AFTER_SECONDS)
+
+    # The queued jobs still run, and free their places
+    assert await asyncio.gather(*queued) == [0.2] * pool.max_pending
+    assert pool.pending == 0
+    assert await pool.run(sleep_for, 0) == 0
+
+
+async def test_job_past_the_timeout_is_a_503(start_pool):
+    pool = await start_pool(timeout=0.2)
+
+    started = time.perf_counter()
+    with pytest.raises(HTTPException) as error:
+        await pool.run(sleep_for, 2)
+    assert time.perf_counter() - started < 1
+    assert error.value.status_code == 503
+    assert error.value.detail == "Request took too long, try again later"
+    assert pool.pending == 0
+
+
+async def test_broken_pool_is_replaced(start_pool):
+    pool = await start_pool()
+    broken = pool.executor
+
+    with pytest.raises(HTTPException) as error:
+        await pool.run(crash)
+    assert error.value.status_code == 503
+    assert pool.executor is not None and pool.executor is not broken
+
+    # Jobs run on the new workers
+    assert await pool.run(sleep_for, 0) == 0
+
+
+def candidates(count: int) -> list:
+    rng = random.Random(1)
+    return [
+        SimpleNamespace(
+            worker_id=index,
+            latitude=9.93 + rng.uniform(-0.5, 0.5),
+            longitude=76.26 + rng.uniform(-0.5, 0.5),
+            base_score=rng.uniform(0, 3),
+        )
+        for index in range(count)
+    ]
+
+
+@pytest.mark.parametrize(
+    "limit, max_distance_km, tag_factors",
+    [(None, None, None), (10, 40, {3: 0.2, 7: 0.1})],
+)
+async def test_rank_workers_in_the_pool_matches_the_inline_ranking(
+    start_pool, monkeypatch, limit, max_distance_km, tag_factors
+):
+    monkeypatch.setattr(score, "compute_pool", await start_pool())
+    workers = candidates(score.POOL_MIN_CANDIDATES + 50)
+    user_cords = (9.93, 76.26)
+    ran_in_pool = compute_jobs_total.values.get(("rank_points", "ok"), 0)
+
+    ranked = await score.rank_workers(workers, user_cords, limit, max_distance_km, tag_factors)
+
+    assert compute_jobs_total.values.get(("rank_points", "ok"), 0) == ran_in_pool + 1
+    expected = score.sort_workers_by_score(
+        workers, user_cords, limit, max_distance_km, tag_factors
+    )
+    assert [(s, d, c.worker_id) for s, d, c in ranked] == [
+        (s, d, c.worker_id) for s, d, c in expected
+    ]
+    # The pool hands back the caller's candidate objects
+    assert all(candidate is workers[candidate.worker_id] for _, _, candidate in ranked)
@@ -0,0 +1,127 @@
+from collections import Counter
+from datetime import timedelta
+
+import pytest
+from tortoise import timezone
+
+from app.database.models import Professions, WorkRollups
+from app.utils.popularity import (
+    HALF_MODEL_WEIGHT_WORKS,
+    RegionalPopularity,
+    blend,
+    build_regional_popularity,
+)
+
+pytestmark = pytest.mark.anyio
+
+PROFESSIONS = [1, 2, 3]
+
+
+def popularity(city_counts: dict, city_states: dict) -> RegionalPopularity:
+    return RegionalPopularity(
+        PROFESSIONS,
+        {city: Counter(counts) for city, counts in city_counts.items()},
+        city_states,
+    )
+
+
+def test_falls_back_from_city_to_state_to_overall():
+    regions = popularity(
+        {"Kochi": {1: 300, 2: 100}, "Pune": {3: 1000}},
+        {"Kochi": "Kerala", "Pune": "Maharashtra"},
+    )
+
+    assert regions.top("Kochi", "Kerala", 5) == [1, 2, 3]
+    # A city without bookings gets its state's ranking, an unknown state the overall one
+    assert regions.top("Munnar", "Kerala", 5) == [1, 2, 3]
+    assert regions.top("Nagpur", "Maharashtra", 5) == [3, 1, 2]
+    assert regions.top("Paris", "Ile-de-France", 5) == [3, 1, 2]
+    assert regions.top(None, None, 2) == [3, 1]
+    # The city wins over the state it is given with
+    assert regions.top("Pune", "Kerala", 1) == [3]
+
+
+def test_small_cities_are_smoothed_towards_their_state():
+    regions = popularity(
+        {"Kochi": {1: 100}, "Munnar": {2: 1}},
+        {"Kochi": "Kerala", "Munnar": "Kerala"},
+    )
+
+    # One booking doesn't outweigh the state, it still raises the profession's score
+    assert regions.top("Munnar", "Kerala", 5) == [1, 2]
+    assert regions.scores("Munnar", "Kerala")[2] > regions.scores("Kochi", "Kerala")[2]
+
+
+def test_large_cities_keep_their_own_ranking():
+    regions = popularity(
+        {"Kochi": {1: 100}, "Trivandrum": {2: 300}},
+        {"Kochi": "Kerala", "Trivandrum": "Kerala"},
+    )
+
+    assert regions.top(None, "Kerala", 5) == [2, 1]
+    assert regions.top("Kochi", "Kerala", 5) == [1, 2]
+    assert regions.top("Trivandrum", "Kerala", 5) == [2, 1]
+
+
+def test_scores_are_scaled_to_the_most_popular():
+    scores = popularity({"Kochi": {1: 30, 2: 10}}, {"Kochi": "Kerala"}).scores("Kochi", "Kerala")
+
+    assert scores[1] == 1
+    assert 0 < scores[2] < 1
+    # Nobody booked it anywhere
+    assert 3 not in scores
+
+
+def test_without_rollups_nothing_is_popular():
+    regions = popularity({}, {})
+
+    assert regions.top("Kochi", "Kerala", 5) == []
+    assert regions.scores("Kochi", "Kerala") == {}
+
+
+async def test_build_without_rollups_nothing_is_popular(seed):
+    regions = await build_regional_popularity()
+
+    assert regions.top("Kochi", "Kerala", 5) == []
+
+
+async def test_build_from_recent_rollups(seed):
+    now = timezone.now()
+    electrician = await Professions.create(
+        name="electrician",
+        created_at=now,
+        modified_at=now,
+        created_by=seed.admin,
+        modified_by=seed.admin,
+    )
+    # Electricians were booked more, but before POPULARITY_WINDOW_DAYS
+    for profession, days_ago, bookings in (
+        (seed.profession, 0, 2),
+        (seed.profession, 1, 3),
+        (electrician, 400, 50),
+    ):
+        await WorkRollups.create(
+            profession=profession,
+            city="Kochi",
+            day=now.date() - timedelta(days=days_ago),
+            bookings=bookings,
+            modified_at=now,
+        )
+
+    regions = await build_regional_popularity()
+
+    assert regions.top("Kochi", None, 5) == [seed.profession.id]
+    # Kochi's clients live in Kerala
+    assert regions.top("Munnar", "Kerala", 5) == [seed.profession.id]
+
+
+def test_blend_weights_the_model_by_closed_works():
+    model = {1: 0.8, 2: 0.2}
+    regional = {1: 0.1, 2: 1.0}
+
+    # Without history only the regional popularity counts
+    assert blend(model, regional, 0) == pytest.approx(regional)
+    assert blend(model, regional, HALF_MODEL_WEIGHT_WORKS) == pytest.approx({1: 0.45, 2: 0.6})
+    assert blend(model, regional, 1000) == pytest.approx(model, abs=0.01)
+    # Professions nobody booked in the region only get the model's share
+    assert blend({3: 0.5}, regional, HALF_MODEL_WEIGHT_WORKS) == pytest.approx({3: 0.25})
@@ -0,0 +1,131 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+from starlette.requests import Request
+
+from app.dependencies import TokenData, create_access_token
+from app.utils import ratelimit
+from app.utils.ratelimit import Limit, MemoryBackend, RateLimiter, client_key, rate_limit
+
+pytestmark = pytest.mark.anyio
+
+LIMIT = Limit(capacity=3, per_second=0.4, concurrency=2)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+@pytest.fixture
+def limiter(monkeypatch) -> RateLimiter:
+    monkeypatch.setitem(ratelimit.limits, "test", LIMIT)
+    limiter = RateLimiter(MemoryBackend())
+    monkeypatch.setattr(ratelimit, "rate_limiter", limiter)
+    return limiter
+
+
+async def request(limiter: RateLimiter, client: str = "ip:10.0.0.1") -> None:
+    """One request that finished, its concurrency slot is released"""
+    limiter.release(await limiter.acquire("test", client))
+
+
+async def test_burst_then_retry_after(clock, limiter):
+    for _ in range(int(LIMIT.capacity)):
+        await request(limiter)
+
+    with pytest.raises(HTTPException) as error:
+        await request(limiter)
+    assert error.value.status_code == 429
+    # The bucket is empty, the next token is 1 / 0.4 = 2.5 s away
+    assert error.value.headers["Retry-After"] == "3"
+
+    # Other clients have their own bucket
+    await request(limiter, "ip:10.0.0.2")
+
+
+async def test_tokens_refill_at_the_sustained_rate(clock, limiter):
+    for _ in range(int(LIMIT.capacity)):
+        await request(limiter)
+
+    clock.now += 2.5
+    await request(limiter)
+    clock.now += 1
+    with pytest.raises(HTTPException) as error:
+        await request(limiter)
+    # 0.4 tokens after 1 s, the missing 0.6 take 1.5 s
+    assert error.value.headers["Retry-After"] == "2"
+
+    # Never more than the burst, however long the client was idle
+    clock.now += 3600
+    for _ in range(int(LIMIT.capacity)):
+        await request(limiter)
+    with pytest.raises(HTTPException):
+        await request(limiter)
+
+
+async def test_concurrency_cap(clock, limiter):
+    first = await limiter.acquire("test", "ip:10.0.0.1")
+    await limiter.acquire("test", "ip:10.0.0.1")
+    with pytest.raises(HTTPException) as error:
+        await limiter.acquire("test", "ip:10.0.0.1")
+    assert error.value.status_code == 429
+    assert error.value.detail == "Too many concurrent requests"
+    assert error.value.headers["Retry-After"] == "1"
+
+    limiter.release(first)
+    await limiter.acquire("test", "ip:10.0.0.1")
+
+
+async def test_slot_is_released_after_the_request(clock, limiter, monkeypatch):
+    monkeypatch.setitem(ratelimit.limits, "test", Limit(capacity=10, per_second=1, concurrency=1))
+    app = FastAPI()
+    release = asyncio.Event()
+
+    @app.get("/slow", dependencies=[Depends(rate_limit("test"))])
+    async def slow():
+        await release.wait()
+        return {"status": "ok"}
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        first = asyncio.create_task(client.get("/slow"))
+        await asyncio.sleep(0.05)
+        second = await client.get("/slow")
+        assert second.status_code == 429
+        assert second.headers["Retry-After"] == "1"
+
+        release.set()
+        assert (await first).status_code == 200
+        assert limiter.in_flight == {}
+        assert (await client.get("/slow")).status_code == 200
+
+
+def make_request(authorization: str | None = None, host: str = "10.0.0.1") -> Request:
+    headers = [] if authorization is None else [(b"authorization", authorization.encode())]
+    return Request({"type": "http", "headers": headers, "client": (host, 50000)})
+
+
+def test_client_key_is_the_token_user_or_the_address():
+    token = create_access_token(TokenData(id=42, username="client", role="user"))
+
+    assert client_key(make_request(f"Bearer {token}")) == "user:42"
+    assert client_key(make_request(f"bearer {token}")) == "user:42"
+    # Invalid tokens and other schemes are limited by address
+    assert client_key(make_request("Bearer not-a-token")) == "ip:10.0.0.1"
+    assert client_key(make_request(f"Basic {token}")) == "ip:10.0.0.1"
+    assert client_key(make_request(host="10.0.0.2")) == "ip:10.0.0.2"
@@ -0,0 +1,102 @@
+import pytest
+from tortoise import timezone
+
+from app.database.models import Professions
+from app.utils.cache import response_cache
+from app.utils.search import (
+    NAME_WEIGHT,
+    FallbackIndex,
+    InvertedIndex,
+    _build_professions_index,
+    tokenize,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def test_tokenize():
+    assert tokenize("The Plumbers fix LEAKING pipes, and glass!") == [
+        "plumber",
+        "fix",
+        "leaking",
+        "pipe",
+        "glass",
+    ]
+    assert tokenize("a I of_the x") == []
+    assert tokenize(None) == []
+
+
+def index() -> InvertedIndex:
+    index = InvertedIndex()
+    for doc_id, text, group in [
+        (1, "Fixes leaking pipes and taps", 10),
+        (2, "Installs pipes for kitchens", 10),
+        (3, "Paints kitchens and walls", 20),
+        (4, "Repairs leaking roofs", 20),
+    ]:
+        index.add(doc_id, text, group=group)
+    return index.freeze()
+
+
+def doc_ids(hits: list) -> list[int]:
+    return [doc_id for _, doc_id in hits]
+
+
+def test_every_word_has_to_match():
+    assert sorted(doc_ids(index().search("pipes"))) == [1, 2]
+    assert doc_ids(index().search("leaking pipes")) == [1]
+    assert doc_ids(index().search("kitchen walls")) == [3]
+    assert index().search("leaking gardens") == []
+
+
+def test_only_the_last_word_matches_as_a_prefix():
+    assert sorted(doc_ids(index().search("kit"))) == [2, 3]
+    assert doc_ids(index().search("leaking pi")) == [1]
+    # Earlier words are complete, "kit" is not "kitchen" there
+    assert index().search("kit walls") == []
+
+
+def test_search_within_a_group():
+    assert doc_ids(index().search("leaking", group=10)) == [1]
+    assert doc_ids(index().search("leaking", group=20)) == [4]
+    assert index().search("walls", group=10) == []
+
+
+def test_stop_words_only_match_nothing():
+    assert index().search("the and of") == []
+    assert index().search("") == []
+
+
+def test_rare_words_and_names_rank_first():
+    professions = InvertedIndex()
+    professions.add(1, "electrician", weight=NAME_WEIGHT)
+    professions.add(1, "Wires houses")
+    professions.add(2, "carpenter", weight=NAME_WEIGHT)
+    professions.add(2, "Builds furniture, no electrician needed")
+    professions.freeze()
+    assert doc_ids(professions.search("electrician")) == [1, 2]
+
+    ranked = index().search("leaking")
+    # Same term frequency, the shorter document ranks first
+    assert doc_ids(ranked) == [4, 1]
+    assert ranked[0][0] > ranked[1][0] > 0
+
+
+async def test_index_is_rebuilt_when_professions_are_invalidated(seed):
+    professions_index = FallbackIndex(("professions",), _build_professions_index)
+    assert doc_ids((await professions_index.get()).search("plumb")) == [seed.profession.id]
+
+    now = timezone.now()
+    electrician = await Professions.create(
+        name="electrician",
+        description="Fixes wiring",
+        created_at=now,
+        modified_at=now,
+        created_by=seed.admin,
+        modified_by=seed.admin,
+    )
+    # Served from the built index until the professions cache is invalidated
+    assert (await professions_index.get()).search("wiring") == []
+
+    await response_cache.invalidate("professions")
+    assert doc_ids((await professions_index.get()).search("wiring")) == [electrician.id]
@@ -0,0 +1,123 @@
+from datetime import timedelta
+
+import pytest
+from tortoise import timezone
+
+from app.database.models import TagStats, WorkerTagStats, Works
+from app.utils import outbox
+from app.utils.score import calculate_tag_factor
+from app.utils.tags import normalize_tags, popular_tags, worker_tag_counts
+from app.utils.work_events import emit_work
+
+pytestmark = pytest.mark.anyio
+
+
+def test_normalize_tags():
+    assert normalize_tags([" Leak", "leak", "KITCHEN ", "", "  ", "x" * 51, "x" * 50]) == [
+        "kitchen",
+        "leak",
+        "x" * 50,
+    ]
+    assert normalize_tags(None) == []
+
+
+async def book(seed, worker, tags: list[str]) -> None:
+    """
+    What /work/book-a-work commits: the work and its work.booked event. SQLite has no array
+    column, so the tags only travel in the event, as they would on Postgres.
+    """
+    now = timezone.now()
+    work = await Works.create(
+        user_description="Leaking tap",
+        profession=seed.profession,
+        scheduled_date=now.date() + timedelta(days=1),
+        scheduled_time=now.time().replace(microsecond=0),
+        estimated_cost=1000,
+        booked_by=seed.client,
+        assigned_to=worker,
+        created_at=now,
+        modified_at=now,
+    )
+    work.tags = tags
+    async with outbox.transaction() as conn:
+        await emit_work(work, "work.booked", conn, status="pending")
+
+
+async def tag_counts() -> dict:
+    return {
+        (row["profession_id"], row["city"], row["tag"]): row["count"]
+        for row in await TagStats.all().values("profession_id", "city", "tag", "count")
+    }
+
+
+async def worker_counts() -> dict:
+    return {
+        (row["worker_id"], row["tag"]): row["count"]
+        for row in await WorkerTagStats.all().values("worker_id", "tag", "count")
+    }
+
+
+async def test_booked_tags_are_counted(seed):
+    first, second = seed.workers
+    profession_id = seed.profession.id
+
+    await book(seed, first, ["Leak", "kitchen", "leak "])
+    assert await outbox.drain_once() == 1
+    assert await tag_counts() == {
+        (profession_id, "Kochi", "kitchen"): 1,
+        (profession_id, "Kochi", "leak"): 1,
+    }
+    assert await worker_counts() == {(first.id, "kitchen"): 1, (first.id, "leak"): 1}
+
+    # Repeat bookings add to the existing rows
+    await book(seed, first, ["leak"])
+    await book(seed, second, ["leak", "bathroom"])
+    assert await outbox.drain_once() == 2
+    assert await tag_counts() == {
+        (profession_id, "Kochi", "bathroom"): 1,
+        (profession_id, "Kochi", "kitchen"): 1,
+        (profession_id, "Kochi", "leak"): 3,
+    }
+    assert await worker_counts() == {
+        (first.id, "kitchen"): 1,
+        (first.id, "leak"): 2,
+        (second.id, "bathroom"): 1,
+        (second.id, "leak"): 1,
+    }
+
+    assert [row["tag"] for row in await popular_tags(profession_id)] == [
+        "leak",
+        "bathroom",
+        "kitchen",
+    ]
+    assert await worker_tag_counts([first.id, second.id], ["LEAK"]) == {
+        first.id: {"leak": 2},
+        second.id: {"leak": 1},
+    }
+
+
+async def test_works_without_tags_count_nothing(seed):
+    await book(seed, seed.workers[0], [])
+    assert await outbox.drain_once() == 1
+    assert await tag_counts() == {}
+    assert await worker_counts() == {}
+
+
+@pytest.mark.parametrize(
+    "tag_counts, requested_tags, factor",
+    [
+        ({}, 0, 0),
+        ({}, 1, 0),
+        ({"leak": 1}, 1, 0.5),
+        ({"leak": 3}, 1, 0.75),
+        ({"leak": 99}, 1, 0.99),
+        # Every requested tag weighs the same
+        ({"leak": 1}, 2, 0.25),
+        ({"leak": 1, "kitchen": 3}, 2, 0.625),
+    ],
+)
+def test_tag_factor_saturates(tag_counts, requested_tags, factor):
+    assert calculate_tag_factor(tag_counts, requested_tags, {"tags": 1}) == pytest.approx(factor)
+    assert calculate_tag_factor(tag_counts, requested_tags, {"tags": 0.2}) == pytest.approx(
+        0.2 * factor
+    )
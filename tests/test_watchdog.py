@@ -0,0 +1,73 @@
+import time
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils import watchdog as watchdog_module
+from app.utils.watchdog import LoopWatchdog, event_loop_blocked_seconds, slow_callbacks_total
+
+pytestmark = pytest.mark.anyio
+
+ROUTE = "GET /work/professionals/{profession_id}"
+
+
+def block_the_loop(seconds: float) -> None:
+    time.sleep(seconds)  # A blocking call in an async handler
+
+
+async def test_blocking_request_is_reported_with_its_route_and_stack(monkeypatch):
+    monkeypatch.setattr(watchdog_module, "SLOW_CALLBACK_SECONDS", 0.05)
+    logged = []
+    monkeypatch.setattr(
+        watchdog_module,
+        "msg_logger",
+        lambda message, level, *args, **fields: logged.append((message % args, fields)),
+    )
+    watchdog = LoopWatchdog()
+    scope = {
+        "method": "GET",
+        "path": "/work/professionals/3",
+        "route": SimpleNamespace(path="/work/professionals/{profession_id}"),
+    }
+
+    async def handler():
+        watchdog.track(scope, "request-1")
+        block_the_loop(0.3)
+
+    reported = slow_callbacks_total.values.get((ROUTE,), 0)
+    observed = event_loop_blocked_seconds.values.get((ROUTE,), [0])[-1]
+    watchdog.start()
+    try:
+        await asyncio.create_task(handler())
+        await asyncio.sleep(0.1)  # The heartbeat catches up and observes the stall
+    finally:
+        watchdog.stop()
+
+    # Reported once per stall, however long it lasts
+    assert slow_callbacks_total.values[(ROUTE,)] == reported + 1
+    assert event_loop_blocked_seconds.values[(ROUTE,)][-1] == observed + 1
+    assert len(logged) == 1
+    message, fields = logged[0]
+    assert message.startswith("Event loop blocked for over") and message.endswith(ROUTE)
+    assert fields["blocked_request_id"] == "request-1"
+    assert "in block_the_loop" in fields["stack"]
+    assert "time.sleep(seconds)" in fields["stack"]
+
+
+async def test_short_callbacks_are_not_reported(monkeypatch):
+    monkeypatch.setattr(watchdog_module, "SLOW_CALLBACK_SECONDS", 0.2)
+    logged = []
+    monkeypatch.setattr(watchdog_module, "msg_logger", lambda *args, **fields: logged.append(args))
+    watchdog = LoopWatchdog()
+
+    watchdog.start()
+    try:
+        for _ in range(5):
+            block_the_loop(0.01)
+            await asyncio.sleep(0.02)
+    finally:
+        watchdog.stop()
+
+    assert logged == []
+    assert watchdog.thread is None and watchdog.heartbeat is None
@@ -0,0 +1,106 @@
+from datetime import timedelta
+
+import pytest
+from conftest import auth_headers
+from tortoise import timezone
+
+from app.database.models import Professions, Users, WorkerSlots, Works
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_new_professional_gets_an_estimated_cost(api, seed):
+    profession_id = seed.profession.id
+    response = await api.get("/work/estimated-cost", params={"profession_id": profession_id})
+    assert [row["worker_id"] for row in response.json()] == [worker.id for worker in seed.workers]
+
+    response = await api.put(
+        "/users/switch-to-professional",
+        json={"profession_id": profession_id, "hourly_rate": 500, "worker_bio": "New plumber"},
+        headers=auth_headers(seed.client),
+    )
+    assert response.status_code == 200
+
+    # Both cached listings include the new worker right away
+    response = await api.get("/work/estimated-cost", params={"profession_id": profession_id})
+    assert {"worker_id": seed.client.id, "estimated_cost": 1000.0} in response.json()
+    response = await api.get(f"/work/estimated-cost/{seed.client.id}")
+    assert response.json() == 1000.0
+
+
+async def test_estimated_cost_without_estimated_time_is_null(api, seed):
+    await Professions.filter(id=seed.profession.id).update(estimated_time_hours=None)
+    worker_id = seed.workers[0].id
+
+    response = await api.get(f"/work/estimated-cost/{worker_id}")
+    assert response.status_code == 200
+    assert response.json() is None
+
+    response = await api.get("/work/estimated-cost", params={"worker_ids": [worker_id]})
+    assert response.json() == [{"worker_id": worker_id, "estimated_cost": None}]
+
+
+async def test_estimated_cost_of_unknown_worker_is_not_found(api, seed):
+    response = await api.get(f"/work/estimated-cost/{await Users.all().count() + 1}")
+    assert response.status_code == 404
+
+
+def booking(seed, worker, hour: int, **fields) -> dict:
+    """A booking of `worker` tomorrow at `hour`. Without tags, SQLite has no array column."""
+    return {
+        "tags": None,
+        "user_description": "Leaking tap",
+        "profession_id": seed.profession.id,
+        "assigned_to_id": worker.id,
+        "scheduled_date": str(timezone.now().date() + timedelta(days=1)),
+        "scheduled_time": f"{hour:02}:00:00",
+        **fields,
+    }
+
+
+async def test_batch_booking_returns_the_created_work_ids(api, seed):
+    first, second = seed.workers
+    response = await api.post(
+        "/work/book-works",
+        json=[
+            booking(seed, first, 9),
+            booking(seed, first, 10),  # Overlaps the first, a booking takes 2 hours
+            booking(seed, second, 10),
+            booking(seed, second, 14, profession_id=seed.profession.id + 1),
+        ],
+        headers=auth_headers(seed.client),
+    )
+
+    assert response.status_code == 201
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["created", "rejected", "created", "rejected"]
+    assert results[1]["detail"] == "Professional is not available at the scheduled time"
+    assert results[3]["detail"] == "Profession does not exist"
+    assert "work_id" not in results[1] and "work_id" not in results[3]
+
+    for result, worker in ((results[0], first), (results[2], second)):
+        work = await Works.get(id=result["work_id"])
+        assert work.assigned_to_id == worker.id and work.booked_by_id == seed.client.id
+        assert await WorkerSlots.filter(work_id=work.id, worker_id=worker.id).exists()
+    assert await Works.all().count() == 2
+
+
+async def test_batch_booking_with_every_item_rejected_is_a_bad_request(api, seed):
+    response = await api.post(
+        "/work/book-works",
+        json=[
+            booking(seed, seed.client, 9),
+            booking(seed, seed.workers[0], 9, scheduled_date="2000-01-01"),
+        ],
+        headers=auth_headers(seed.client),
+    )
+
+    assert response.status_code == 400
+    assert response.json()["results"] == [
+        {"status": "rejected", "detail": "User cannot self assign work"},
+        {
+            "status": "rejected",
+            "detail": "Scheduled time is in the past. Only future works can be booked",
+        },
+    ]
+    assert not await Works.exists()